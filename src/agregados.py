@@ -0,0 +1,386 @@
+"""
+Agregados pré-compilados das páginas (rollups).
+
+Cada página declara as tabelas agregadas que alimentam KPIs e gráficos com
+o decorador `@agregado("base", ...)`: a função recebe as bases (já preparadas
+pela página) e devolve um DataFrame pequeno, do tamanho do número de grupos.
+Um comando offline calcula todos os agregados registrados a partir das
+planilhas e os grava em Parquet com um manifesto:
+
+    python src/agregados.py [tenant]
+
+No app, o atualizador anexa os agregados compilados à versão do dataset que
+carregou (`anexar`); a chamada decorada devolve a tabela compilada em vez de
+agrupar as linhas. Um agregado só é usado se o hash das planilhas de que
+depende, o do código da carga e o do código da função forem os mesmos da
+compilação; senão a página calcula a partir das linhas, como antes (com cache
+por versão). O hash do código cobre a função, os preparos e tudo o que eles
+usam dos módulos do projeto (funções, classes e constantes, transitivamente);
+`versao=` no decorador invalida a compilação quando a mudança está fora disso.
+As planilhas são conferidas pela assinatura (mtime e tamanho) gravada no
+manifesto, sem ler os arquivos, e só têm o sha256 recalculado quando ela muda.
+Tabelas de detalhamento, dispersão e distribuição continuam nas linhas.
+"""
+import functools
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+from data_handler import (
+    ARQUIVOS, TABELAS, cache_por_versao, carregar_tabela, load_data, marcar_versao, resolver_raiz, versao_dataset,
+)
+
+DIR_AGREGADOS = ".ecomove_agregados"
+ARQUIVO_MANIFESTO = "manifesto.json"
+FORMATO_MANIFESTO = 2
+# Versões de dataset com agregados anexados mantidas em memória (LRU).
+VERSOES_ANEXADAS = 32
+
+_DIR_FONTES = os.path.dirname(os.path.abspath(__file__))
+# Constantes de módulo (nome público em maiúsculas) que entram no hash do código; estado
+# privado do módulo (ex.: _CACHE) e valores de outros tipos ficam de fora.
+_TIPOS_CONSTANTES = (dict, list, tuple, set, frozenset, str, bytes, int, float, bool)
+
+
+class Agregado(namedtuple("Agregado", ["nome", "bases", "preparo", "funcao", "versao"])):
+    @property
+    def codigo(self):
+        """Hash do código do agregado (calculado no primeiro uso, com o módulo já todo definido)."""
+        with _LOCK:
+            if self.nome not in _CODIGOS:
+                _CODIGOS[self.nome] = _hash_codigo(self.funcao, *self.preparo.values(), versao=self.versao)
+            return _CODIGOS[self.nome]
+
+
+REGISTRO = {}
+_CODIGOS = {}
+_ANEXADOS = OrderedDict()
+_LOCK = threading.Lock()
+# Versões negativas (as do atualizador são positivas) para as bases de cada
+# compilação: intermediários com cache por versão (ex.: juncoes) são calculados uma vez.
+_VERSOES_COMPILACAO = itertools.count(-1, -1)
+
+
+def _do_projeto(objeto):
+    arquivo = getattr(objeto, "__file__", None) or getattr(getattr(objeto, "__code__", None), "co_filename", None)
+    if arquivo is None and isinstance(objeto, type):
+        arquivo = getattr(sys.modules.get(objeto.__module__), "__file__", None)
+    return arquivo is not None and os.path.abspath(arquivo).startswith(_DIR_FONTES)
+
+
+def _nomes(codigo):
+    """Nomes globais e atributos usados por um code object e pelos aninhados (lambdas, funções internas)."""
+    nomes = set(codigo.co_names)
+    for constante in codigo.co_consts:
+        if isinstance(constante, types.CodeType):
+            nomes |= _nomes(constante)
+    return nomes
+
+
+def _fonte(objeto):
+    try:
+        return inspect.getsource(objeto)
+    except (OSError, TypeError):
+        return repr(getattr(getattr(objeto, "__code__", None), "co_code", objeto))
+
+
+def _dependencias(objeto, partes, vistos):
+    """Acrescenta a `partes` o código de `objeto` e o de tudo o que ele usa do projeto."""
+    objeto = inspect.unwrap(objeto) if callable(objeto) else objeto
+    if id(objeto) in vistos:
+        return
+    vistos.add(id(objeto))
+
+    if isinstance(objeto, type):
+        partes.append(_fonte(objeto))
+        funcoes = [v for v in vars(objeto).values() if isinstance(v, (types.FunctionType, property, staticmethod, classmethod))]
+        for funcao in funcoes:
+            funcao = funcao.fget if isinstance(funcao, property) else getattr(funcao, "__func__", funcao)
+            # Métodos gerados fora do projeto (ex.: os de namedtuple) não entram.
+            if funcao is not None and _do_projeto(funcao):
+                _dependencias_de_codigo(funcao, partes, vistos)
+        return
+    if isinstance(objeto, types.FunctionType):
+        partes.append(_fonte(objeto))
+        _dependencias_de_codigo(objeto, partes, vistos)
+
+
+def _dependencias_de_codigo(funcao, partes, vistos):
+    escopo = funcao.__globals__
+    nomes = sorted(_nomes(funcao.__code__))
+    # Módulos do projeto usados pela função, inclusive os importados dentro dela (from matrizes import ...).
+    modulos = [escopo.get(n) or sys.modules.get(n) for n in nomes]
+    modulos = [m for m in modulos if isinstance(m, types.ModuleType) and _do_projeto(m)]
+    for nome in nomes:
+        # Nome global do módulo da função ou atributo de um módulo do projeto (ex.: arrow_store.ler_ipc).
+        candidatos = [escopo[nome]] if nome in escopo else []
+        candidatos += [getattr(m, nome) for m in modulos if hasattr(m, nome)]
+        for valor in candidatos:
+            _valor(nome, valor, partes, vistos)
+
+
+def _valor(nome, valor, partes, vistos):
+    if isinstance(valor, (types.FunctionType, type)) or callable(getattr(valor, "__wrapped__", None)):
+        if _do_projeto(inspect.unwrap(valor)):
+            _dependencias(valor, partes, vistos)
+    elif isinstance(valor, _TIPOS_CONSTANTES) and nome.isupper() and not nome.startswith("_"):
+        partes.append(f"{nome} = {_estavel(valor, partes, vistos)}")
+
+
+def _estavel(valor, partes, vistos):
+    """repr sem endereços de memória: funções viram o nome qualificado (e entram nas dependências)."""
+    if isinstance(valor, dict):
+        itens = sorted((_estavel(k, partes, vistos), _estavel(v, partes, vistos)) for k, v in valor.items())
+        return "{" + ", ".join(f"{k}: {v}" for k, v in itens) + "}"
+    if isinstance(valor, (list, tuple)):
+        return "[" + ", ".join(_estavel(v, partes, vistos) for v in valor) + "]"
+    if isinstance(valor, (set, frozenset)):
+        return "{" + ", ".join(sorted(_estavel(v, partes, vistos) for v in valor)) + "}"
+    if isinstance(valor, _TIPOS_CONSTANTES):
+        return repr(valor)
+    if callable(valor) and _do_projeto(inspect.unwrap(valor)):
+        _dependencias(valor, partes, vistos)
+        return f"{valor.__module__}.{valor.__qualname__}"
+    return type(valor).__name__
+
+
+def _hash_codigo(*funcoes, versao=None):
+    """sha256 do código das `funcoes` e das suas dependências no projeto, mais a `versao` declarada."""
+    partes, vistos = [repr(versao)], set()
+    for funcao in funcoes:
+        _dependencias(funcao, partes, vistos)
+    return hashlib.sha256("\n".join(partes).encode("utf-8")).hexdigest()[:16]
+
+
+def codigo_carga():
+    """Hash do código que lê e normaliza as bases (datas, dimensões, aliases, validação)."""
+    return _hash_codigo(carregar_tabela)
+
+
+def agregado(*bases, preparo=None, versao=None):
+    """
+    Registra `funcao(*frames)` como agregado pré-compilável das `bases` (nomes de
+    TABELAS, na ordem dos argumentos). `preparo` = {base: função} aplicada à base
+    carregada antes da chamada, na compilação; no app a página já passa as bases preparadas.
+    `versao` (opcional) entra no hash do código: incrementá-la invalida as compilações.
+    """
+    desconhecidas = set(bases) - set(TABELAS)
+    if desconhecidas:
+        raise ValueError(f"Bases desconhecidas: {sorted(desconhecidas)}")
+
+    def decorador(funcao):
+        nome = f"{funcao.__module__.rsplit('.', 1)[-1]}.{funcao.__name__}"
+        calcular = cache_por_versao()(funcao)
+
+        @functools.wraps(funcao)
+        def wrapper(*frames):
+            # Bases de versões diferentes (ex.: recortadas por período junto com bases inteiras)
+            # não correspondem a nenhuma compilação.
+            versoes = {versao_dataset(df) for df in frames}
+            tabela = _compilado(nome, versoes.pop()) if len(versoes) == 1 else None
+            if tabela is None:
+                tabela = calcular(*frames)
+            # Tabelas pequenas: a cópia deixa a página acrescentar colunas sem tocar no cache.
+            return tabela.copy()
+
+        REGISTRO[nome] = Agregado(nome, bases, dict(preparo or {}), funcao, versao)
+        wrapper.nome_agregado = nome
+        return wrapper
+
+    return decorador
+
+
+def _compilado(nome, versao):
+    if versao is None:
+        return None
+    with _LOCK:
+        tabelas = _ANEXADOS.get(versao)
+    return None if tabelas is None else tabelas.get(nome)
+
+
+def anexar(versao, tabelas):
+    """Associa os agregados compilados (nome → DataFrame) à versão do dataset."""
+    with _LOCK:
+        _ANEXADOS[versao] = tabelas
+        _ANEXADOS.move_to_end(versao)
+        while len(_ANEXADOS) > VERSOES_ANEXADAS:
+            _ANEXADOS.popitem(last=False)
+
+
+def importar_paginas():
+    """Importa as páginas para que os seus agregados entrem no REGISTRO."""
+    from app_pages import atendimento, clientes, marketing, vendasproduto, visaogeral  # noqa: F401
+
+
+def hash_arquivo(caminho):
+    with open(caminho, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def estado_bases(data_path, anterior=None):
+    """
+    Assinatura (mtime, tamanho) e sha256 de cada planilha presente em `data_path`
+    (base → {"assinatura", "sha256"}). Planilhas com a mesma assinatura do estado
+    `anterior` (o do manifesto) reaproveitam o sha256 dele, sem ler o arquivo.
+    """
+    anterior = anterior or {}
+    estado = {}
+    for nome, arquivo in ARQUIVOS.items():
+        caminho = os.path.join(data_path, arquivo)
+        try:
+            st_arquivo = os.stat(caminho)
+        except OSError:
+            continue
+        assinatura = [st_arquivo.st_mtime_ns, st_arquivo.st_size]
+        conhecido = anterior.get(nome, {})
+        if conhecido.get("assinatura") == assinatura:
+            sha256 = conhecido["sha256"]
+        else:
+            sha256 = hash_arquivo(caminho)
+        estado[nome] = {"assinatura": assinatura, "sha256": sha256}
+    return estado
+
+
+def hashes_bases(data_path):
+    """sha256 de cada planilha presente em `data_path` (base → hash)."""
+    return {nome: item["sha256"] for nome, item in estado_bases(data_path).items()}
+
+
+def calcular_todos(frames):
+    """Calcula todos os agregados registrados a partir das bases carregadas (nome → DataFrame)."""
+    versao = next(_VERSOES_COMPILACAO)
+    preparadas = {}
+    tabelas = {}
+    for item in REGISTRO.values():
+        argumentos = []
+        for base in item.bases:
+            preparo = item.preparo.get(base)
+            if (base, preparo) not in preparadas:
+                # Cada preparo trabalha numa cópia rasa: as funções de preparo alteram colunas no lugar.
+                df = marcar_versao(frames[base].copy(deep=False), versao)
+                preparadas[(base, preparo)] = preparo(df) if preparo is not None else df
+            argumentos.append(preparadas[(base, preparo)])
+        tabela = item.funcao(*argumentos)
+        if not isinstance(tabela, pd.DataFrame):
+            raise TypeError(f"Agregado {item.nome} devolveu {type(tabela).__name__}, não DataFrame")
+        tabelas[item.nome] = tabela
+    return tabelas
+
+
+def _ler_manifesto(destino):
+    try:
+        with open(os.path.join(destino, ARQUIVO_MANIFESTO), encoding="utf-8") as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifesto if manifesto.get("formato") == FORMATO_MANIFESTO else None
+
+
+def gravar(tabelas, hashes, destino, manter=False, planilhas=None):
+    """
+    Grava os agregados `tabelas` (nome → DataFrame) em Parquet + manifesto em `destino`;
+    `hashes` = hash de cada base de origem e `planilhas` = estado_bases das planilhas
+    lidas (conferido sem reler os arquivos na carga). Com `manter`, os agregados da
+    compilação anterior que não estão em `tabelas` continuam no manifesto.
+    O manifesto é trocado por último, de forma atômica; os arquivos que saem dele são removidos.
+    """
+    os.makedirs(destino, exist_ok=True)
+    anterior = _ler_manifesto(destino)
+    compilacao = (anterior or {}).get("compilacao", 0) + 1
+    agregados = dict((anterior or {}).get("agregados", {})) if manter else {}
+    estado = dict((anterior or {}).get("planilhas", {})) if manter else {}
+    estado.update(planilhas or {})
+    for nome, tabela in tabelas.items():
+        item = REGISTRO[nome]
+        arquivo = f"{compilacao:06d}_{nome}.parquet"
+        tabela.to_parquet(os.path.join(destino, arquivo))
+        agregados[nome] = {
+            "arquivo": arquivo,
+            "bases": {base: hashes.get(base) for base in item.bases},
+            "codigo": item.codigo,
+            "versao": item.versao,
+            "linhas": len(tabela),
+        }
+    manifesto = {
+        "formato": FORMATO_MANIFESTO,
+        "compilacao": compilacao,
+        "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "carga": codigo_carga(),
+        "planilhas": estado,
+        "agregados": agregados,
+    }
+    temporario = os.path.join(destino, ARQUIVO_MANIFESTO + ".tmp")
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, os.path.join(destino, ARQUIVO_MANIFESTO))
+
+    em_uso = {item["arquivo"] for item in agregados.values()}
+    for nome in os.listdir(destino):
+        if nome.endswith(".parquet") and nome not in em_uso:
+            os.remove(os.path.join(destino, nome))
+    return manifesto
+
+
+def compilar(data_path, destino=None):
+    """
+    Carrega as planilhas de `data_path`, calcula todos os agregados e grava
+    Parquet + manifesto em `destino` (padrão: DIR_AGREGADOS dentro de `data_path`).
+    """
+    destino = destino or os.path.join(data_path, DIR_AGREGADOS)
+    # Estado lido antes da carga: uma planilha trocada durante a compilação invalida o agregado.
+    planilhas = estado_bases(data_path)
+    hashes = {nome: item["sha256"] for nome, item in planilhas.items()}
+    frames = dict(zip(TABELAS, load_data(data_path, usar_store=False)))
+    return gravar(calcular_todos(frames), hashes, destino, planilhas=planilhas)
+
+
+def carregar(data_path, destino=None):
+    """
+    Agregados compilados ainda válidos para as planilhas atuais de `data_path`
+    (nome → DataFrame), conferidos antes de qualquer base ser carregada: planilhas
+    pela assinatura gravada no manifesto (sha256 só das que mudaram), código da
+    carga e código de cada agregado. Agregados de bases alteradas, de funções
+    alteradas ou não registradas ficam de fora; sem compilação, devolve {}.
+    """
+    destino = destino or os.path.join(data_path, DIR_AGREGADOS)
+    manifesto = _ler_manifesto(destino)
+    if manifesto is None or manifesto.get("carga") != codigo_carga():
+        return {}
+    estado = estado_bases(data_path, manifesto.get("planilhas"))
+    hashes = {nome: item["sha256"] for nome, item in estado.items()}
+    tabelas = {}
+    for nome, item in manifesto["agregados"].items():
+        registrado = REGISTRO.get(nome)
+        if registrado is None or registrado.codigo != item["codigo"] or registrado.versao != item.get("versao"):
+            continue
+        if any(hashes.get(base) != valor for base, valor in item["bases"].items()):
+            continue
+        try:
+            tabelas[nome] = pd.read_parquet(os.path.join(destino, item["arquivo"]))
+        except Exception as e:
+            # Arquivo removido por uma compilação concorrente ou ilegível: a página calcula.
+            print(f"⚠ Agregado {nome} ignorado:", e)
+    return tabelas
+
+
+if __name__ == "__main__":
+    tenant = sys.argv[1] if len(sys.argv) > 1 else None
+    data_path = resolver_raiz(tenant)
+    # As páginas registram os agregados no módulo `agregados` importado, não neste __main__.
+    import agregados
+
+    agregados.importar_paginas()
+    inicio = time.perf_counter()
+    manifesto = agregados.compilar(data_path)
+    linhas = sum(item["linhas"] for item in manifesto["agregados"].values())
+    print(f"{len(manifesto['agregados'])} agregados ({linhas:,} linhas) compilados em "
+          f"{time.perf_counter() - inicio:.1f}s → {os.path.join(data_path, DIR_AGREGADOS)}")
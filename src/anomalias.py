@@ -0,0 +1,285 @@
+"""
+Varredura de anomalias em KPIs diários com z-score robusto (mediana/MAD).
+
+Cada KPI vira uma matriz séries × dias; as janelas móveis são vistas
+(sliding_window_view, sem cópia) sobre a matriz inteira, de modo que a
+mediana e o MAD de todas as séries saem de poucas operações vetorizadas,
+processadas em blocos de séries para limitar a memória.
+
+Séries esparsas (vendas de uma cidade, tickets de um motivo) têm janelas com
+mais da metade dos dias em zero e MAD zero. Nas somas (vendas), a escala tem
+um piso ligado ao nível da série quando o MAD é zero: a mediana dos dias com
+valor, de modo que um dia típico isolado nunca vira alerta. Nas contagens (tickets), o teste é o de
+Poisson com a taxa da janela, convertido em z pela normal. Um z nunca é
+infinito: sem escala (janela constante de uma razão), o ponto fica sem z.
+Verificação offline (o repositório não tem suíte de testes):
+    python src/anomalias.py
+"""
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import stats
+
+from data_handler import Requisito, combinar_requisitos
+from matrizes import contingencia
+
+JANELA_PADRAO = 28
+MIN_PERIODOS = 7
+LIMIAR_Z = 3.5
+# Constantes que tornam o MAD e o desvio absoluto médio comparáveis ao desvio padrão numa normal.
+_CONSTANTE_MAD = 0.6745
+_CONSTANTE_DESVIO_MEDIO = 1.2533
+# Piso da escala das somas com MAD zero, em múltiplos da mediana dos dias com valor da série.
+PISO_RELATIVO_SOMAS = 1.0
+# Menor p-valor convertido em z (norm.isf(1e-300) ≈ 37): o z das contagens é sempre finito.
+P_MINIMO = 1e-300
+# Máximo de elementos (séries × dias × janela) materializados por bloco.
+ELEMENTOS_POR_BLOCO = 20_000_000
+
+
+def series_diarias(df, coluna_data, coluna_grupo, coluna_valor=None, estatistica="soma"):
+    """Matriz séries × dias contínuos; sem `coluna_valor`, conta linhas."""
+    matriz = contingencia(df, coluna_grupo, coluna_data, valor=coluna_valor, freq_coluna="D", esparsa=False)
+    series = matriz.para_frame("contagem" if coluna_valor is None else estatistica)
+    if series.shape[1] == 0:
+        return series
+    dias = pd.date_range(series.columns.min(), series.columns.max(), freq="D")
+    # Contagens e somas: dia sem registro é zero; médias/razões ficam sem valor.
+    preencher = np.nan if estatistica == "media" else 0.0
+    return series.reindex(columns=dias, fill_value=preencher)
+
+
+def zscores_robustos(valores, janela=JANELA_PADRAO, min_periodos=MIN_PERIODOS, pisos=None):
+    """
+    z-score robusto de cada ponto contra os `janela` pontos anteriores da mesma série.
+    A escala é MAD/0.6745; com MAD zero, o desvio absoluto médio × 1.2533, com o
+    mínimo `pisos` (um por série; zero por padrão). Devolve (z, mediana), ambos
+    séries × dias; NaN onde não há histórico suficiente ou a escala é zero.
+    """
+    valores = np.asarray(valores, dtype=float)
+    n_series, n_dias = valores.shape
+    z = np.full(valores.shape, np.nan)
+    medianas = np.full(valores.shape, np.nan)
+    if n_dias <= janela:
+        return z, medianas
+    pisos = np.zeros(n_series) if pisos is None else np.asarray(pisos, dtype=float)
+
+    tem_nulos = np.isnan(valores).any()
+    passo = max(1, ELEMENTOS_POR_BLOCO // max(1, (n_dias - janela) * janela))
+    for inicio in range(0, n_series, passo):
+        bloco = valores[inicio:inicio + passo]
+        # janelas[s, t] = bloco[s, t : t + janela], comparada ao ponto t + janela.
+        janelas = sliding_window_view(bloco[:, :-1], janela, axis=1)
+        atuais = bloco[:, janela:]
+        if tem_nulos:
+            with warnings.catch_warnings():
+                # Janelas totalmente vazias geram "All-NaN slice"; viram NaN abaixo.
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                mediana = np.nanmedian(janelas, axis=2)
+                desvios = np.abs(janelas - mediana[..., None])
+                mad = np.nanmedian(desvios, axis=2)
+                desvio_medio = np.nanmean(desvios, axis=2)
+            mediana[np.isfinite(janelas).sum(axis=2) < min_periodos] = np.nan
+        else:
+            mediana = np.median(janelas, axis=2)
+            desvios = np.abs(janelas - mediana[..., None])
+            mad = np.median(desvios, axis=2)
+            desvio_medio = desvios.mean(axis=2)
+
+        escala = np.where(mad > 0, mad / _CONSTANTE_MAD,
+                          np.fmax(desvio_medio * _CONSTANTE_DESVIO_MEDIO, pisos[inicio:inicio + passo, None]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_bloco = np.where(escala > 0, (atuais - mediana) / escala, np.nan)
+        z[inicio:inicio + passo, janela:] = z_bloco
+        medianas[inicio:inicio + passo, janela:] = mediana
+
+    return z, medianas
+
+
+def zscores_poisson(contagens, janela=JANELA_PADRAO):
+    """
+    z de cada contagem pelo teste de Poisson contra a taxa média dos `janela` dias
+    anteriores (no mínimo um evento por janela, para janelas zeradas): a cauda
+    superior P(X ≥ x) ou inferior P(X ≤ x) convertida em z pela normal padrão.
+    Devolve (z, mediana), como zscores_robustos; z sempre finito.
+    """
+    contagens = np.asarray(contagens, dtype=float)
+    n_series, n_dias = contagens.shape
+    z = np.full(contagens.shape, np.nan)
+    medianas = np.full(contagens.shape, np.nan)
+    if n_dias <= janela:
+        return z, medianas
+
+    acumulada = np.concatenate([np.zeros((n_series, 1)), np.cumsum(contagens, axis=1)], axis=1)
+    taxa = np.maximum((acumulada[:, janela:n_dias] - acumulada[:, :n_dias - janela]) / janela, 1.0 / janela)
+    atuais = contagens[:, janela:]
+    acima = np.maximum(stats.poisson.sf(atuais - 1, taxa), P_MINIMO)
+    abaixo = np.maximum(stats.poisson.cdf(atuais, taxa), P_MINIMO)
+    z[:, janela:] = np.where(atuais >= taxa, stats.norm.isf(acima), -stats.norm.isf(abaixo))
+    medianas[:, janela:] = np.median(sliding_window_view(contagens[:, :-1], janela, axis=1), axis=2)
+    return z, medianas
+
+
+def _pisos(valores, relativo):
+    """Piso da escala por série: `relativo` × mediana dos |valores| não nulos (0 sem valores)."""
+    absolutos = np.abs(np.where(np.isfinite(valores), valores, 0.0))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        tipicos = np.nanmedian(np.where(absolutos > 0, absolutos, np.nan), axis=1)
+    return relativo * np.nan_to_num(tipicos)
+
+
+def detectar(series, kpi, janela=JANELA_PADRAO, limiar=LIMIAR_Z, modelo="soma"):
+    """
+    Pontos de `series` (séries × dias) com |z| acima do limiar, em formato longo.
+    `modelo`: "contagem" (teste de Poisson), "soma" (z robusto com piso no nível
+    da série) ou "razao" (z robusto sem piso).
+    """
+    if series.empty:
+        return pd.DataFrame(columns=["KPI", "Serie", "Data", "Valor", "Mediana", "Z"])
+    valores = series.to_numpy(dtype=float)
+    if modelo == "contagem":
+        z, medianas = zscores_poisson(valores, janela)
+    else:
+        pisos = _pisos(valores, PISO_RELATIVO_SOMAS) if modelo == "soma" else None
+        z, medianas = zscores_robustos(valores, janela, pisos=pisos)
+    linhas, colunas = np.nonzero(np.abs(np.nan_to_num(z)) > limiar)
+    return pd.DataFrame({
+        "KPI": kpi,
+        "Serie": series.index[linhas].astype(str),
+        "Data": series.columns[colunas],
+        "Valor": valores[linhas, colunas],
+        "Mediana": medianas[linhas, colunas],
+        "Z": z[linhas, colunas],
+    })
+
+
+def _roas_diario(df_marketing):
+    receita = series_diarias(df_marketing, "Data_Campanha", "Tipo_Midia", "Receita_Gerada")
+    investimento = series_diarias(df_marketing, "Data_Campanha", "Tipo_Midia", "Investimento")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return receita / investimento.where(investimento > 0)
+
+
+KPI_ROAS = "ROAS por Tipo de Mídia"
+
+Varredura = namedtuple("Varredura", ["base", "requisito", "series", "modelo"])
+
+# KPI → base, colunas lidas, série diária da base e modelo do z (ver `detectar`).
+VARREDURAS = {
+    "Vendas por Cidade": Varredura("vendas", Requisito(["Data_Venda", "Cidade", "Valor_Total"]),
+                                   lambda df: series_diarias(df, "Data_Venda", "Cidade", "Valor_Total"), "soma"),
+    "Vendas por Canal": Varredura("vendas", Requisito(["Data_Venda", "Canal_Venda", "Valor_Total"]),
+                                  lambda df: series_diarias(df, "Data_Venda", "Canal_Venda", "Valor_Total"), "soma"),
+    "Tickets por Motivo": Varredura("atendimento", Requisito(["Data_Abertura", "Motivo"]),
+                                    lambda df: series_diarias(df, "Data_Abertura", "Motivo"), "contagem"),
+    "Tickets por Canal": Varredura("atendimento", Requisito(["Data_Abertura", "Canal"]),
+                                   lambda df: series_diarias(df, "Data_Abertura", "Canal"), "contagem"),
+    KPI_ROAS: Varredura("marketing", Requisito(["Data_Campanha", "Tipo_Midia", "Investimento", "Receita_Gerada"]),
+                        _roas_diario, "razao"),
+}
+
+
+def requisitos(kpis=None):
+    """Bases e colunas lidas pela varredura dos `kpis` (todos, por padrão)."""
+    return combinar_requisitos(*({VARREDURAS[kpi].base: VARREDURAS[kpi].requisito} for kpi in (kpis or VARREDURAS)))
+
+
+# Bases e colunas lidas por varrer_kpis (ver data_handler.Requisito).
+REQUISITOS = requisitos()
+
+
+def ordenar(alertas):
+    """Alertas ordenados por |z|, maior desvio primeiro."""
+    return alertas.reindex(alertas["Z"].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+
+def varrer(frames, kpis=None):
+    """Alertas de cada KPI de `kpis` (todos, por padrão) sobre `frames` (base → DataFrame), por KPI."""
+    alertas = {}
+    for kpi in kpis or VARREDURAS:
+        varredura = VARREDURAS[kpi]
+        alertas[kpi] = detectar(varredura.series(frames[varredura.base]), kpi, modelo=varredura.modelo)
+    return alertas
+
+
+def varrer_kpis(df_atendimento, df_marketing, df_vendas):
+    """
+    Roda a varredura sobre vendas diárias por Cidade/Canal_Venda, tickets por
+    Motivo/Canal e ROAS diário por Tipo_Midia. Devolve os alertas ordenados por |z|.
+    """
+    frames = {"atendimento": df_atendimento, "marketing": df_marketing, "vendas": df_vendas}
+    return ordenar(pd.concat(varrer(frames).values(), ignore_index=True))
+
+
+def verificar():
+    """
+    Casos de referência da varredura (o repositório não tem suíte de testes).
+    Imprime as falhas e devolve True se todos passaram.
+    """
+    dias = pd.date_range("2024-01-01", periods=90, freq="D")
+    esparsa = np.zeros(len(dias))
+    esparsa[::10] = 1.0  # um ticket a cada 10 dias: mediana e MAD das janelas são zero
+    esparsa[80] = 12.0
+    zerada = np.zeros(len(dias))
+    zerada[70] = 5.0
+    ruido = np.random.default_rng(0).normal(100, 5, len(dias))
+    ruido[60] = 160.0
+    venda_rara = np.zeros(len(dias))
+    venda_rara[::9] = 100.0  # uma venda de tamanho típico a cada 9 dias
+    venda_rara[81] = 900.0
+    contagens = pd.DataFrame([esparsa, zerada], index=["esparsa", "zerada"], columns=dias)
+    somas = pd.DataFrame([ruido, np.full(len(dias), 3.0), venda_rara],
+                         index=["ruido", "constante", "venda_rara"], columns=dias)
+    por_serie = pd.concat([detectar(contagens, "teste", modelo="contagem"), detectar(somas, "teste")])
+    por_serie = por_serie.groupby("Serie")["Data"].apply(set)
+
+    falhas = []
+    casos = [
+        ("pico em série de mediana zero", "esparsa", dias[80]),
+        ("pico em janela toda zerada", "zerada", dias[70]),
+        ("pico em série com MAD positivo", "ruido", dias[60]),
+        ("venda grande em série esparsa", "venda_rara", dias[81]),
+    ]
+    for descricao, serie, data in casos:
+        if por_serie.get(serie, set()) != {data}:
+            falhas.append(f"{descricao}: alertas {sorted(por_serie.get(serie, set()))}, esperado só {data:%d/%m/%Y}")
+    if "constante" in por_serie:
+        falhas.append("série constante gerou alerta")
+
+    # Séries esparsas regulares (sem pico) não geram alerta nem z infinito.
+    dias_ano = pd.date_range("2024-01-01", periods=365, freq="D")
+    rng = np.random.default_rng(1)
+    tickets = pd.DataFrame([rng.poisson(0.1, len(dias_ano))], index=["tickets"], columns=dias_ano)
+    vendas = pd.DataFrame([np.where(rng.random(len(dias_ano)) < 0.1, rng.uniform(50, 150, len(dias_ano)), 0.0)],
+                          index=["vendas"], columns=dias_ano)
+    for modelo, series in (("contagem", tickets), ("soma", vendas)):
+        alertas = detectar(series, "teste", modelo=modelo)
+        if len(alertas):
+            falhas.append(f"série esparsa regular ({modelo}) gerou {len(alertas)} alertas")
+    z_tickets, _ = zscores_poisson(tickets.to_numpy(dtype=float))
+    if np.isinf(z_tickets).any():
+        falhas.append("teste de Poisson devolveu z infinito")
+
+    # Com MAD positivo o z continua o da fórmula mediana/MAD.
+    z, _ = zscores_robustos(ruido[None, :])
+    janela = ruido[60 - JANELA_PADRAO:60]
+    mediana = np.median(janela)
+    esperado = _CONSTANTE_MAD * (ruido[60] - mediana) / np.median(np.abs(janela - mediana))
+    if not np.isclose(z[0, 60], esperado):
+        falhas.append(f"z com MAD positivo mudou: {z[0, 60]} ≠ {esperado}")
+
+    for falha in falhas:
+        print("✗", falha)
+    if not falhas:
+        print(f"✓ {len(casos) + 5} casos de anomalias ok")
+    return not falhas
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(0 if verificar() else 1)
@@ -5,6 +5,42 @@ import plotly.express as px
 import plotly.graph_objects as go
 import math
 from typing import List
+from data_handler import Requisito, cache_por_versao
+from sketches import sketches_por_grupo, reagrupar, tabela_caixas, caixas_plotly
+from matrizes import contingencia
+from insights import estatisticas_por_grupo, avaliar_regras
+from renderizacao import AgendadorSecoes
+from consultas import top_n
+from datas import converter_datas
+from agregados import agregado
+
+
+# Bases e colunas que a página usa (carga sob demanda; o período filtra Data_Abertura).
+REQUISITOS = {'atendimento': Requisito(data='Data_Abertura')}
+
+METRICAS_GRUPO = {
+    'Tickets': ('ID_Chamado', 'size'),
+    'Tempo_Medio': ('Tempo_Resolucao', 'mean'),
+    'Avaliacao_Media': ('Avaliacao_Cliente', 'mean'),
+    'Taxa_Resolucao': ('Eh_Resolvido', 'mean'),
+}
+
+REGRAS_INSIGHTS_MOTIVO = [
+    {'tipo': 'melhor', 'metrica': 'Tickets', 'texto': '- Motivo com mais tickets: **{grupo}** ({valor:,} tickets).'},
+    {'tipo': 'melhor', 'metrica': 'Tempo_Medio', 'texto': '- Motivo com maior tempo médio de resolução: **{grupo}** ({valor:.1f}h).'},
+    {'tipo': 'pior', 'metrica': 'Avaliacao_Media', 'texto': '- Motivo com pior avaliação média: **{grupo}** ({valor:.2f}).'},
+    {'tipo': 'outliers_mediana', 'metrica': 'Tempo_Medio', 'fator': 3.0,
+     'texto': '- Motivos com tempo de resolução fora do padrão: {grupos}.'},
+]
+
+REGRAS_INSIGHTS_CANAL = [
+    {'tipo': 'melhor', 'metrica': 'Taxa_Resolucao', 'texto': '- Canal com maior taxa de resolução: **{grupo}** ({valor:.1%}).'},
+    {'tipo': 'pior', 'metrica': 'Avaliacao_Media', 'texto': '- Canal com pior avaliação média: **{grupo}** ({valor:.2f}).'},
+    {'tipo': 'acima_limite', 'metrica': 'Tempo_Medio', 'limite': 48, 'min_grupos': 1,
+     'texto': '- {n} de {total} canais com tempo médio acima de 48h.'},
+]
+
+STATUS_RESOLVIDOS = ['resolvido', 'resolved', 'closed', 'fechado', 'concluido', 'concluído']
 
 
 @st.cache_data
@@ -16,7 +52,7 @@ def clean_and_engineer(df):
 
     # Datas
     if 'Data_Abertura' in df.columns:
-        df['Data_Abertura'] = pd.to_datetime(df['Data_Abertura'], errors='coerce')
+        df['Data_Abertura'] = converter_datas(df['Data_Abertura'])
     else:
         df['Data_Abertura'] = pd.NaT
 
@@ -34,6 +70,10 @@ def clean_and_engineer(df):
     for col in ['Motivo', 'Status', 'Canal']:
         if col not in df.columns:
             df[col] = 'Desconhecido'
+        elif isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Dimensão já canônica (ver data_handler.aplicar_dimensoes): só preenche ausentes.
+            if df[col].isna().any():
+                df[col] = df[col].cat.add_categories(['Desconhecido']).fillna('Desconhecido')
         else:
             df[col] = df[col].astype(str).str.strip().replace({'nan': 'Desconhecido'})
 
@@ -68,12 +108,69 @@ def clean_and_engineer(df):
 
     df['Tempo_Categoria'] = df['Tempo_Resolucao'].apply(categorize_tempo)
 
-    df['Eh_Resolvido'] = df['Status'].astype(str).str.lower().isin(
-        ['resolvido', 'resolved', 'closed', 'fechado', 'concluido', 'concluído']
-    )
+    df['Eh_Resolvido'] = df['Status'].astype(str).str.lower().isin(STATUS_RESOLVIDOS)
 
     return df
 
+@cache_por_versao()
+def sketches_tempo_resolucao(df):
+    """Sketches de Tempo_Resolucao por (Motivo, Mes); reagrupáveis por motivo ou período."""
+    return sketches_por_grupo(df, ['Motivo', 'Mes'], 'Tempo_Resolucao')
+
+
+@cache_por_versao()
+def matriz_tickets_mes_canal(df):
+    """Contagem de tickets mês × canal (códigos inteiros de mês, sem strings)."""
+    return contingencia(df, 'Data_Abertura', 'Canal', freq_linha='M')
+
+
+PREPARO = {'atendimento': clean_and_engineer}
+
+
+@agregado('atendimento', preparo=PREPARO)
+def kpis_atendimento(df):
+    """Totais dos cards de KPI (uma linha)."""
+    total_tickets = len(df)
+    return pd.DataFrame([{
+        'Total_Tickets': total_tickets,
+        'Pct_Resolvidos': (df['Eh_Resolvido'].mean() * 100) if total_tickets > 0 else 0.0,
+        'Tempo_Medio': df['Tempo_Resolucao'].mean(),
+        'Avaliacao_Media': df['Avaliacao_Cliente'].mean(),
+    }])
+
+
+@agregado('atendimento', preparo=PREPARO)
+def estatisticas_por_motivo(df):
+    return estatisticas_por_grupo(df, 'Motivo', METRICAS_GRUPO)
+
+
+@agregado('atendimento', preparo=PREPARO)
+def estatisticas_por_canal(df):
+    return estatisticas_por_grupo(df, 'Canal', METRICAS_GRUPO)
+
+
+@agregado('atendimento', preparo=PREPARO)
+def status_tickets(df):
+    status_counts = df['Status'].value_counts().reset_index()
+    status_counts.columns = ['Status', 'Count']
+    return status_counts
+
+
+@agregado('atendimento', preparo=PREPARO)
+def avaliacao_mensal(df):
+    """Avaliação média por mês de abertura."""
+    meses = df['Data_Abertura'].dt.to_period('M').dt.to_timestamp().rename('Data_Abertura_Month')
+    return df.groupby(meses)['Avaliacao_Cliente'].mean().reset_index()
+
+
+@agregado('atendimento', preparo=PREPARO)
+def tickets_mes_canal(df):
+    """Heatmap mês × canal como tabela densa de contagens (rótulos de canal como texto)."""
+    tabela = matriz_tickets_mes_canal(df).para_frame('contagem').astype(int)
+    tabela.columns = tabela.columns.astype(str)
+    return tabela
+
+
 def _format_money_br(value: float) -> str:
     try:
         if pd.isna(value):
@@ -135,7 +232,7 @@ def format_display_dataframe_for_view(df: pd.DataFrame) -> pd.DataFrame:
     disp = df.copy()
 
     for col in disp.columns:
-        if np.issubdtype(disp[col].dtype, np.datetime64) or col.lower().startswith('data') or 'data' in col.lower():
+        if pd.api.types.is_datetime64_any_dtype(disp[col]) or col.lower().startswith('data') or 'data' in col.lower():
             disp[col] = disp[col].apply(_format_date_br)
 
         elif _is_money_column(col):
@@ -154,7 +251,7 @@ def format_display_dataframe_for_view(df: pd.DataFrame) -> pd.DataFrame:
                     return str(x)
             disp[col] = disp[col].apply(fmt_pct)
 
-        elif np.issubdtype(disp[col].dtype, np.number):
+        elif pd.api.types.is_numeric_dtype(disp[col]) and not pd.api.types.is_bool_dtype(disp[col]):
             disp[col] = disp[col].apply(lambda x: f"{x:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.') if not pd.isna(x) else "")
 
         else:
@@ -176,10 +273,11 @@ def app(df_atendimento):
     # ----------------- KPIs -----------------
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
 
-    total_tickets = len(df)
-    percent_resolvidos = (df['Eh_Resolvido'].mean() * 100) if total_tickets > 0 else 0.0
-    tempo_medio = df['Tempo_Resolucao'].mean()
-    avaliacao_media = df['Avaliacao_Cliente'].mean()
+    kpis = kpis_atendimento(df).iloc[0]
+    total_tickets = int(kpis['Total_Tickets'])
+    percent_resolvidos = kpis['Pct_Resolvidos']
+    tempo_medio = kpis['Tempo_Medio']
+    avaliacao_media = kpis['Avaliacao_Media']
 
     kpi1.metric("Total de Tickets", f"{total_tickets:,}".replace(',', '.')) 
     kpi2.metric("% Resolvidos", f"{percent_resolvidos:.1f}%")
@@ -194,12 +292,22 @@ def app(df_atendimento):
 
     st.markdown("---")
 
+    # Heatmap, distribuições e scatter calculam no pool e preenchem seus lugares
+    # quando prontos. As threads leem uma cópia rasa: colunas auxiliares que a
+    # página ainda acrescenta em `df` não alteram o frame que elas estão lendo.
+    agendador = AgendadorSecoes()
+    df_secoes = df.copy(deep=False)
+
+    # Estatísticas por grupo calculadas uma vez; alimentam os gráficos e os insights.
+    stats_motivo = estatisticas_por_motivo(df)
+    stats_canal = estatisticas_por_canal(df)
+
     st.markdown("### Volume de Tickets por Motivo")
     if df.empty:
         st.info("Sem dados para este gráfico.")
     else:
         tickets_por_motivo = (
-            df.groupby('Motivo').size().reset_index(name='Count').sort_values(by='Count', ascending=False)
+            stats_motivo['Tickets'].reset_index(name='Count').sort_values(by='Count', ascending=False)
         )
         fig_motivo = px.bar(
             tickets_por_motivo,
@@ -219,7 +327,7 @@ def app(df_atendimento):
         st.info("Sem dados para este gráfico.")
     else:
         tempo_resolucao_por_canal = (
-            df.groupby('Canal')['Tempo_Resolucao'].mean().reset_index().sort_values(by='Tempo_Resolucao', ascending=False)
+            stats_canal['Tempo_Medio'].rename('Tempo_Resolucao').reset_index().sort_values(by='Tempo_Resolucao', ascending=False)
         )
         fig_tempo_canal = px.bar(
             tempo_resolucao_por_canal,
@@ -239,8 +347,7 @@ def app(df_atendimento):
     if df.empty:
         st.info("Sem dados para este gráfico.")
     else:
-        status_counts = df['Status'].value_counts().reset_index()
-        status_counts.columns = ['Status', 'Count']
+        status_counts = status_tickets(df)
         fig_status = px.pie(
             status_counts,
             values='Count',
@@ -255,33 +362,28 @@ def app(df_atendimento):
 
     st.markdown("### Tickets por Mês e Canal")
     if df['Data_Abertura'].notna().any():
-        df['Mês'] = df['Data_Abertura'].dt.to_period('M').astype(str)
-        tickets_heatmap = df.groupby(['Mês', 'Canal']).size().unstack(fill_value=0)
-
-        try:
-            idx = pd.PeriodIndex(tickets_heatmap.index, freq='M').to_timestamp()
-            tickets_heatmap.index = idx
-            tickets_heatmap = tickets_heatmap.sort_index()
+        def calcular_heatmap():
+            tickets_heatmap = tickets_mes_canal(df_secoes)
             y_labels = tickets_heatmap.index.strftime('%Y-%m')
-        except Exception:
-            y_labels = tickets_heatmap.index.astype(str)
-
-        fig_heatmap = go.Figure(data=go.Heatmap(
-            z=tickets_heatmap.values,
-            x=tickets_heatmap.columns,
-            y=y_labels,
-            colorscale='YlOrRd',
-            hovertemplate='Canal: %{x}<br>Mês: %{y}<br>Tickets: %{z:,}<extra></extra>'
-        ))
-        fig_heatmap.update_layout(title='Volume de Tickets por Mês e Canal', xaxis_title='Canal', yaxis_title='Mês')
-        st.plotly_chart(fig_heatmap, use_container_width=True)
+
+            fig_heatmap = go.Figure(data=go.Heatmap(
+                z=tickets_heatmap.values,
+                x=tickets_heatmap.columns,
+                y=y_labels,
+                colorscale='YlOrRd',
+                hovertemplate='Canal: %{x}<br>Mês: %{y}<br>Tickets: %{z:,}<extra></extra>'
+            ))
+            fig_heatmap.update_layout(title='Volume de Tickets por Mês e Canal', xaxis_title='Canal', yaxis_title='Mês')
+            return fig_heatmap
+
+        agendador.secao(calcular_heatmap, lambda fig: st.plotly_chart(fig, use_container_width=True))
     else:
         st.info("Coluna Data_Abertura ausente ou sem valores válidos para calcular meses.")
 
     st.markdown("### Avaliação Média do Cliente ao Longo do Tempo")
     if df['Data_Abertura'].notna().any() and 'Avaliacao_Cliente' in df.columns:
         df['Data_Abertura_Month'] = df['Data_Abertura'].dt.to_period('M').dt.to_timestamp()
-        avg_avaliacao_mensal = df.groupby('Data_Abertura_Month')['Avaliacao_Cliente'].mean().reset_index()
+        avg_avaliacao_mensal = avaliacao_mensal(df)
         fig_avaliacao = px.line(
             avg_avaliacao_mensal,
             x='Data_Abertura_Month',
@@ -299,44 +401,51 @@ def app(df_atendimento):
     col1, col2 = st.columns(2)
     with col1:
         if df['Tempo_Resolucao'].notna().any():
-            fig_hist = px.histogram(df, x='Tempo_Resolucao', nbins=30, title='Histograma do Tempo de Resolução (h)')
-            fig_hist.update_traces(hovertemplate='Tempo (h): %{x}<br>Contagem: %{y}<extra></extra>')
-            st.plotly_chart(fig_hist, use_container_width=True)
+            def calcular_histograma():
+                fig_hist = px.histogram(df_secoes, x='Tempo_Resolucao', nbins=30, title='Histograma do Tempo de Resolução (h)')
+                fig_hist.update_traces(hovertemplate='Tempo (h): %{x}<br>Contagem: %{y}<extra></extra>')
+                return fig_hist
+
+            agendador.secao(calcular_histograma, lambda fig: st.plotly_chart(fig, use_container_width=True))
         else:
             st.info("Sem valores de Tempo_Resolucao para histograma.")
     with col2:
         if df['Tempo_Resolucao'].notna().any():
-            fig_box = px.box(df, x='Motivo', y='Tempo_Resolucao', title='Boxplot: Tempo de Resolução por Motivo')
-            fig_box.update_layout(xaxis_tickangle=-45)
-            fig_box.update_traces(hovertemplate='Motivo: %{x}<br>Tempo (h): %{y}<extra></extra>')
-            st.plotly_chart(fig_box, use_container_width=True)
+            def calcular_boxplot():
+                caixas_motivo = tabela_caixas(reagrupar(sketches_tempo_resolucao(df_secoes), nivel=0))
+                fig_box = go.Figure(go.Box(**caixas_plotly(caixas_motivo), name='Tempo_Resolucao'))
+                fig_box.update_layout(title='Boxplot: Tempo de Resolução por Motivo', xaxis_title='Motivo',
+                                      yaxis_title='Tempo_Resolucao', xaxis_tickangle=-45)
+                fig_box.update_traces(hovertemplate='Motivo: %{x}<br>Tempo (h): %{y}<extra></extra>')
+                return fig_box
+
+            agendador.secao(calcular_boxplot, lambda fig: st.plotly_chart(fig, use_container_width=True))
         else:
             st.info("Sem valores de Tempo_Resolucao para boxplot.")
 
     st.markdown("### Tempo de Resolução (h) vs Avaliação do Cliente")
     if df['Tempo_Resolucao'].notna().any() and df['Avaliacao_Cliente'].notna().any():
-        df['_Tempo_Formatado_Hover'] = df['Tempo_Resolucao'].apply(lambda x: _hours_to_hm(x))
-        fig_scatter = px.scatter(
-            df,
-            x='Tempo_Resolucao',
-            y='Avaliacao_Cliente',
-            hover_data=['ID_Chamado', 'Motivo', 'Canal', '_Tempo_Formatado_Hover'],
-            title='Tempo de Resolução vs Avaliação'
-        )
-        fig_scatter.update_traces(hovertemplate='<b>ID:</b> %{customdata[0]}<br><b>Motivo:</b> %{customdata[1]}<br><b>Canal:</b> %{customdata[2]}<br><b>Tempo:</b> %{customdata[3]}<br><b>Avaliação:</b> %{y:.2f}<extra></extra>')
-        st.plotly_chart(fig_scatter, use_container_width=True)
-        df.drop(columns=['_Tempo_Formatado_Hover'], inplace=True, errors='ignore')
+        def calcular_scatter():
+            df_scatter = df_secoes.assign(_Tempo_Formatado_Hover=df_secoes['Tempo_Resolucao'].apply(lambda x: _hours_to_hm(x)))
+            fig_scatter = px.scatter(
+                df_scatter,
+                x='Tempo_Resolucao',
+                y='Avaliacao_Cliente',
+                hover_data=['ID_Chamado', 'Motivo', 'Canal', '_Tempo_Formatado_Hover'],
+                title='Tempo de Resolução vs Avaliação'
+            )
+            fig_scatter.update_traces(hovertemplate='<b>ID:</b> %{customdata[0]}<br><b>Motivo:</b> %{customdata[1]}<br><b>Canal:</b> %{customdata[2]}<br><b>Tempo:</b> %{customdata[3]}<br><b>Avaliação:</b> %{y:.2f}<extra></extra>')
+            return fig_scatter
+
+        agendador.secao(calcular_scatter, lambda fig: st.plotly_chart(fig, use_container_width=True))
     else:
         st.info("Dados insuficientes para scatter (Tempo_Resolucao ou Avaliacao_Cliente ausentes).")
 
     st.markdown("### Top 3 e Bottom 3 por Tempo de Resolução")
     if df['Tempo_Resolucao'].notna().any():
-        top3 = df.sort_values('Tempo_Resolucao', ascending=False).head(3)[
-            ['ID_Chamado', 'Data_Abertura', 'Motivo', 'Status', 'Tempo_Resolucao', 'Canal', 'Avaliacao_Cliente']
-        ]
-        bot3 = df.sort_values('Tempo_Resolucao', ascending=True).head(3)[
-            ['ID_Chamado', 'Data_Abertura', 'Motivo', 'Status', 'Tempo_Resolucao', 'Canal', 'Avaliacao_Cliente']
-        ]
+        colunas_top = ['ID_Chamado', 'Data_Abertura', 'Motivo', 'Status', 'Tempo_Resolucao', 'Canal', 'Avaliacao_Cliente']
+        top3 = top_n(df, 'Tempo_Resolucao', 3, colunas=colunas_top)
+        bot3 = top_n(df, 'Tempo_Resolucao', 3, ascendente=True, colunas=colunas_top)
         # Formatar para exibição
         top3_disp = format_display_dataframe_for_view(top3)
         bot3_disp = format_display_dataframe_for_view(bot3)
@@ -351,6 +460,11 @@ def app(df_atendimento):
     else:
         st.info("Sem valores de Tempo_Resolucao para calcular top/bottom.")
 
+    st.markdown("---")
+    st.markdown("### 🧠 Insights Automáticos")
+    insights = avaliar_regras(stats_motivo, REGRAS_INSIGHTS_MOTIVO) + avaliar_regras(stats_canal, REGRAS_INSIGHTS_CANAL)
+    st.info("\n".join(insights) if insights else "Sem dados para gerar insights automáticos.")
+
     st.markdown("---")
     st.subheader("Amostra dos Dados (após limpeza)")
 
@@ -359,3 +473,5 @@ def app(df_atendimento):
 
     csv = df.to_csv(index=False).encode('utf-8')
     st.download_button(label='Download do dataset limpo (CSV)', data=csv, file_name='dataset_limpo_atendimento.csv', mime='text/csv')
+
+    agendador.concluir()
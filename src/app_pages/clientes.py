@@ -1,11 +1,96 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+from data_handler import Requisito, cache_por_versao
+from sketches import combinar_sketches, sketches_por_grupo, tabela_caixas, caixas_plotly
+from coortes import matriz_coortes, retencao
+from rfm import tabela_rfm, resumo_segmentos
+from datas import converter_datas
+from agregados import agregado
 
-def app(df_clientes):
-    st.title("Análise de Clientes")
+# Bases e colunas que a página usa (carga sob demanda). Com período, só as vendas são
+# filtradas: a base de clientes fica inteira e RFM/coortes olham as compras do período.
+REQUISITOS = {
+    'clientes': Requisito(['ID_Cliente', 'Tipo', 'Cidade', 'Idade', 'Gênero', 'Renda', 'Data_Cadastro']),
+    'vendas': Requisito(['ID_Cliente', 'Data_Venda', 'Valor_Total'], data='Data_Venda'),
+}
+
+
+@cache_por_versao()
+def sketches_renda(df_clientes):
+    """Sketches de Renda por (Tipo, mês de cadastro), combináveis para qualquer recorte."""
+    df = df_clientes.assign(_Mes_Cadastro=df_clientes["Data_Cadastro"].dt.to_period("M"))
+    return sketches_por_grupo(df, ["Tipo", "_Mes_Cadastro"], "Renda")
+
+
+@cache_por_versao()
+def coortes_clientes(df_clientes, df_vendas):
+    """Clientes ativos por coorte de cadastro × meses desde o cadastro."""
+    return matriz_coortes(df_clientes, df_vendas)
+
+
+@cache_por_versao()
+def segmentos_rfm(df_clientes, df_vendas):
+    """Tabela RFM por cliente e os pontos de corte usados nas notas."""
+    return tabela_rfm(df_clientes, df_vendas)
+
+
+def preparar_clientes(df_clientes):
     df_clientes["Renda"] = pd.to_numeric(df_clientes["Renda"], errors="coerce")
-    df_clientes["Data_Cadastro"] = pd.to_datetime(df_clientes["Data_Cadastro"], errors="coerce")
+    df_clientes["Data_Cadastro"] = converter_datas(df_clientes["Data_Cadastro"])
+    return df_clientes
+
+
+PREPARO = {"clientes": preparar_clientes}
+
+
+def _mes_cadastro(df_clientes):
+    return df_clientes['Data_Cadastro'].dt.to_period('M').astype(str).rename('Ano_Mes_Cadastro')
+
+
+@agregado("clientes", preparo=PREPARO)
+def contagem_por_tipo(df_clientes):
+    type_counts = df_clientes['Tipo'].value_counts().reset_index()
+    type_counts.columns = ['Tipo', 'Contagem']
+    return type_counts
+
+
+@agregado("clientes", preparo=PREPARO)
+def contagem_por_genero(df_clientes):
+    gender_counts = df_clientes['Gênero'].value_counts().reset_index()
+    gender_counts.columns = ['Gênero', 'Contagem']
+    return gender_counts
+
+
+@agregado("clientes", preparo=PREPARO)
+def renda_por_cidade(df_clientes):
+    return (
+        df_clientes.groupby('Cidade', observed=True)['Renda']
+        .mean()
+        .sort_values(ascending=False)
+        .reset_index()
+    )
+
+
+@agregado("clientes", preparo=PREPARO)
+def renda_por_tipo(df_clientes):
+    return df_clientes.groupby('Tipo')['Renda'].mean().reset_index()
+
+
+@agregado("clientes", preparo=PREPARO)
+def cadastros_por_mes(df_clientes):
+    return df_clientes.groupby(_mes_cadastro(df_clientes)).size().reset_index(name='Contagem')
+
+
+@agregado("clientes", preparo=PREPARO)
+def renda_media_por_mes(df_clientes):
+    return df_clientes.groupby(_mes_cadastro(df_clientes))['Renda'].mean().reset_index()
+
+
+def app(df_clientes, df_vendas=None):
+    st.title("Análise de Clientes")
+    preparar_clientes(df_clientes)
 
     # ================================================================
     # 1. Perfil Demográfico
@@ -14,8 +99,7 @@ def app(df_clientes):
 
     # PF vs PJ
     st.subheader("Distribuição de Clientes por Tipo (PF vs. PJ)")
-    type_counts = df_clientes['Tipo'].value_counts().reset_index()
-    type_counts.columns = ['Tipo', 'Contagem']
+    type_counts = contagem_por_tipo(df_clientes)
     fig_type = px.pie(
         type_counts, values='Contagem', names='Tipo',
         title='Proporção de Clientes PF vs. PJ', hole=0.3
@@ -24,8 +108,7 @@ def app(df_clientes):
 
     # Distribuição por gênero
     st.subheader("Distribuição de Clientes por Gênero")
-    gender_counts = df_clientes['Gênero'].value_counts().reset_index()
-    gender_counts.columns = ['Gênero', 'Contagem']
+    gender_counts = contagem_por_genero(df_clientes)
     fig_gender = px.bar(
         gender_counts, x='Gênero', y='Contagem',
         title='Distribuição de Clientes por Gênero'
@@ -55,12 +138,7 @@ def app(df_clientes):
 
     # Renda média por cidade
     st.subheader("Renda Média por Cidade")
-    avg_income_city = (
-        df_clientes.groupby('Cidade')['Renda']
-        .mean()
-        .sort_values(ascending=False)
-        .reset_index()
-    )
+    avg_income_city = renda_por_cidade(df_clientes)
     fig_income_city = px.bar(
         avg_income_city, x='Renda', y='Cidade',
         orientation='h', title='Renda Média por Cidade'
@@ -76,7 +154,7 @@ def app(df_clientes):
 
     # Renda por tipo
     st.subheader("Renda Média por Tipo de Cliente (PF vs. PJ)")
-    avg_income_type = df_clientes.groupby('Tipo')['Renda'].mean().reset_index()
+    avg_income_type = renda_por_tipo(df_clientes)
     fig_income_type = px.bar(
         avg_income_type, x='Tipo', y='Renda',
         title='Renda Média por Tipo de Cliente'
@@ -92,11 +170,10 @@ def app(df_clientes):
 
     # Boxplot renda
     st.subheader("Dispersão da Renda dos Clientes")
-    fig_boxplot_income = px.box(
-        df_clientes, y='Renda',
-        title='Boxplot da Renda dos Clientes'
-    )
+    caixa_renda = tabela_caixas({"Renda": combinar_sketches(sketches_renda(df_clientes))})
+    fig_boxplot_income = go.Figure(go.Box(**caixas_plotly(caixa_renda), name="Renda"))
     fig_boxplot_income.update_layout(
+        title='Boxplot da Renda dos Clientes',
         yaxis_tickprefix="R$ ", 
         yaxis_tickformat=",.2f"
     )
@@ -110,11 +187,9 @@ def app(df_clientes):
     # ================================================================
     st.header("3. Análise Temporal (Evolução)")
 
-    df_clientes['Ano_Mes_Cadastro'] = df_clientes['Data_Cadastro'].dt.to_period('M').astype(str)
-
     # Cadastros por mês
     st.subheader("Novos Cadastros por Mês/Ano")
-    monthly = df_clientes.groupby('Ano_Mes_Cadastro').size().reset_index(name='Contagem')
+    monthly = cadastros_por_mes(df_clientes)
     fig_monthly = px.line(
         monthly, x='Ano_Mes_Cadastro', y='Contagem',
         title='Novos Cadastros por Mês/Ano', markers=True
@@ -127,10 +202,7 @@ def app(df_clientes):
 
     # Renda por mês
     st.subheader("Evolução da Renda Média dos Novos Entrantes")
-    avg_income_month = (
-        df_clientes.groupby('Ano_Mes_Cadastro')['Renda']
-        .mean().reset_index()
-    )
+    avg_income_month = renda_media_por_mes(df_clientes)
     fig_avg_income = px.line(
         avg_income_month, x='Ano_Mes_Cadastro', y='Renda',
         title='Renda Média dos Novos Entrantes por Mês/Ano', markers=True
@@ -166,3 +238,64 @@ def app(df_clientes):
         hovertemplate='Idade: %{x}<br>Renda: R$ %{y:,.2f}<br>Tipo: %{trace.name}<br>Cidade: %{customdata[0]}<extra></extra>'
     )
     st.plotly_chart(fig_scatter)
+
+    # ================================================================
+    # 5. Coortes e Retenção
+    # ================================================================
+    st.header("5. Coortes e Retenção")
+
+    st.subheader("Retenção por Coorte de Cadastro")
+    if df_vendas is None or df_vendas.empty:
+        st.info("Sem dados de vendas para calcular a retenção por coorte.")
+    else:
+        ativos, tamanhos = coortes_clientes(df_clientes, df_vendas)
+        taxa_retencao = retencao(ativos, tamanhos) * 100
+        fig_coortes = px.imshow(
+            taxa_retencao,
+            x=taxa_retencao.columns,
+            y=taxa_retencao.index.strftime('%Y-%m'),
+            labels=dict(x='Meses desde o cadastro', y='Coorte', color='Retenção (%)'),
+            color_continuous_scale='Greens',
+            aspect='auto',
+            title='Clientes com compra por mês desde o cadastro (% da coorte)'
+        )
+        fig_coortes.update_traces(
+            customdata=ativos.values,
+            hovertemplate='Coorte: %{y}<br>Mês %{x}: %{z:.1f}%<br>Clientes ativos: %{customdata:,}<extra></extra>'
+        )
+        st.plotly_chart(fig_coortes)
+
+    # ================================================================
+    # 6. Segmentação RFM
+    # ================================================================
+    st.header("6. Segmentação RFM (Recência, Frequência, Valor)")
+
+    if df_vendas is None or df_vendas.empty:
+        st.info("Sem dados de vendas para calcular a segmentação RFM.")
+    else:
+        tabela, _ = segmentos_rfm(df_clientes, df_vendas)
+        resumo = resumo_segmentos(tabela)
+
+        st.subheader("Clientes e Receita por Segmento")
+        fig_rfm = px.bar(
+            resumo, x='Segmento', y='Clientes',
+            color='Valor_Total', color_continuous_scale='Greens',
+            title='Clientes por Segmento RFM (cor = receita total)'
+        )
+        fig_rfm.update_layout(yaxis_tickformat=",", coloraxis_colorbar_title="Receita (R$)")
+        fig_rfm.update_traces(
+            customdata=resumo[['Valor_Total']].values,
+            hovertemplate='Segmento: %{x}<br>Clientes: %{y:,}<br>Receita: R$ %{customdata[0]:,.2f}<extra></extra>'
+        )
+        st.plotly_chart(fig_rfm)
+
+        st.dataframe(
+            resumo.style.format({
+                'Clientes': '{:,.0f}',
+                'Recencia_Media': '{:,.0f} dias',
+                'Frequencia_Media': '{:,.2f}',
+                'Valor_Medio': 'R$ {:,.2f}',
+                'Valor_Total': 'R$ {:,.2f}',
+            }, na_rep='—'),
+            hide_index=True
+        )
@@ -1,4 +1,5 @@
 import math
+import time
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -7,23 +8,154 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from plotly.colors import sample_colorscale
 from typing import Tuple
+from data_handler import Requisito, cache_por_versao
+from sketches import sketches_por_grupo, reagrupar, tabela_caixas, caixas_plotly
+from matrizes import contingencia
+from insights import avaliar_regras
+from renderizacao import AgendadorSecoes
+from datas import converter_datas
+from agregados import agregado
+from simulador import ajustar_curvas, melhores_alocacoes, tabela_curvas, varrer
+from anomalias import KPI_ROAS
 
 # -------------------- Config e meta --------------------
 st.set_page_config(page_title="Marketing", layout="wide")
 
+# Bases e colunas que a página usa (carga sob demanda; o período filtra Data_Campanha).
+# O financeiro não entra: a receita mensal vem de Receita_Gerada das campanhas.
+REQUISITOS = {"marketing": Requisito(data="Data_Campanha")}
+
+# Concentração do sorteio dos cenários do simulador para cada opção de afastamento do mix atual.
+AFASTAMENTOS = {"Pequeno": 200.0, "Médio": 50.0, "Grande": 10.0}
+# Abaixo deste R² (log-log) em todas as mídias, as curvas do simulador pouco explicam a receita.
+R2_MINIMO_SIMULADOR = 0.1
+
+# -------------------- Regras de insights --------------------
+REGRAS_INSIGHTS_MIDIA = [
+    {"tipo": "melhor", "metrica": "ROAS", "texto": "- Mídia com melhor ROAS médio: **{grupo}** ({valor:.2f}x)."},
+    {"tipo": "pior", "metrica": "ROAS", "texto": "- Mídia com pior ROAS médio: **{grupo}** ({valor:.2f}x)."},
+    {"tipo": "outliers_mediana", "metrica": "ROAS", "fator": 3.0,
+     "texto": "- ROAS médio muito distante da mediana das mídias: {grupos}."},
+]
+
+REGRAS_INSIGHTS_CAMPANHA = [
+    {"tipo": "melhor", "metrica": "Lucro", "texto": "- Campanha mais lucrativa: **{grupo}**."},
+    {"tipo": "pior", "metrica": "Lucro", "texto": "- Campanha com menor lucro: **{grupo}**."},
+    {"tipo": "acima_limite", "metrica": "Lucro", "limite": 0, "texto": "- {pct:.1f}% das campanhas geraram lucro."},
+]
+
+REGRAS_RECOMENDACOES_CAMPANHA = [
+    {"tipo": "condicoes", "condicoes": [("ROAS", "<", 1), ("Investimento", ">", "mediana")], "max_itens": 3,
+     "texto": "- Avaliar pausar/otimizar campanhas com ROAS < 1 e investimento alto (ex.: {grupos})."},
+]
+
 # -------------------- Utilitários e caches --------------------
-@st.cache_data
+def _safe_to_numeric(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce").fillna(0)
+
+
+def _ensure_datecol(df: pd.DataFrame, col_name: str = "Data_Campanha") -> pd.DataFrame:
+    if col_name not in df.columns:
+        df[col_name] = pd.NaT
+    else:
+        df[col_name] = converter_datas(df[col_name])
+    return df
+
+
+def preparar_campanhas(df_marketing: pd.DataFrame) -> pd.DataFrame:
+    """Colunas obrigatórias, tipos, períodos e métricas por campanha (ROAS, Lucro, CPRG, Desempenho), no lugar."""
+    for col in ["Investimento", "Receita_Gerada"]:
+        if col not in df_marketing.columns:
+            df_marketing[col] = 0
+
+    if "Campanha" not in df_marketing.columns:
+        df_marketing["Campanha"] = df_marketing.index.astype(str)
+    if "Tipo_Midia" not in df_marketing.columns:
+        df_marketing["Tipo_Midia"] = "Desconhecido"
+
+    # numeric conversions
+    df_marketing["Investimento"] = _safe_to_numeric(df_marketing["Investimento"])
+    df_marketing["Receita_Gerada"] = _safe_to_numeric(df_marketing["Receita_Gerada"])
+
+    # dates
+    df_marketing = _ensure_datecol(df_marketing, "Data_Campanha")
+    df_marketing["Ano"] = df_marketing["Data_Campanha"].dt.year
+    df_marketing["Mes"] = df_marketing["Data_Campanha"].dt.to_period("M").dt.to_timestamp()
+    df_marketing["Trimestre"] = df_marketing["Data_Campanha"].dt.quarter
+
+    # computed metrics (safe): divisões vetorizadas, zero no denominador vira NaN
+    df_marketing["ROAS"] = df_marketing["Receita_Gerada"] / df_marketing["Investimento"].where(df_marketing["Investimento"] != 0)
+    df_marketing["Lucro"] = df_marketing["Receita_Gerada"] - df_marketing["Investimento"]
+    df_marketing["CPRG"] = df_marketing["Investimento"] / df_marketing["Receita_Gerada"].where(df_marketing["Receita_Gerada"] != 0)
+
+    # classification
+    df_marketing["Desempenho"] = np.select(
+        [df_marketing["ROAS"] >= 3, df_marketing["ROAS"] >= 2], ["Excelente", "Bom"], default="Ruim"
+    )
+    return df_marketing
+
+
+PREPARO = {"marketing": preparar_campanhas}
+
+
+@agregado("marketing", preparo=PREPARO)
+def kpis_campanhas(df: pd.DataFrame):
+    """Totais e extremos dos cards de KPI (uma linha)."""
+    return pd.DataFrame([{
+        "Investimento_Total": df["Investimento"].sum(),
+        "Receita_Total": df["Receita_Gerada"].sum(),
+        "ROAS_Medio": df["ROAS"].mean() if not df.empty else np.nan,
+        "ROAS_Max": df["ROAS"].max(),
+        "ROAS_Min": df["ROAS"].min(),
+        "Campanhas": len(df),
+        "Campanhas_Lucrativas": int((df["Lucro"] > 0).sum()),
+    }])
+
+
+@agregado("marketing", preparo=PREPARO)
+def investimento_por_midia(df: pd.DataFrame):
+    return df.groupby("Tipo_Midia", as_index=False, observed=True)[["Investimento", "Receita_Gerada"]].sum()
+
+
+@agregado("marketing", preparo=PREPARO)
+def roas_por_midia(df: pd.DataFrame):
+    """ROAS médio por Tipo_Midia, do maior para o menor."""
+    return (df.groupby("Tipo_Midia", as_index=False, observed=True)["ROAS"]
+            .mean()
+            .sort_values("ROAS", ascending=False)
+            .reset_index(drop=True))
+
+
+@agregado("marketing", preparo=PREPARO)
 def aggregate_by_month(df: pd.DataFrame):
     df2 = df.copy()
     if "Data_Campanha" not in df2.columns:
         df2["Data_Campanha"] = pd.NaT
-    df2["Mes"] = pd.to_datetime(df2["Data_Campanha"], errors="coerce").dt.to_period("M").dt.to_timestamp()
+    df2["Mes"] = converter_datas(df2["Data_Campanha"]).dt.to_period("M").dt.to_timestamp()
     inv = df2.groupby("Mes", as_index=False)["Investimento"].sum()
     rev = df2.groupby("Mes", as_index=False)["Receita_Gerada"].sum().rename(columns={"Receita_Gerada": "Receita_Bruta"})
     merged = pd.merge(inv, rev, on="Mes", how="outer").fillna(0).sort_values("Mes")
     return merged
 
 
+@cache_por_versao()
+def sketches_roas(df: pd.DataFrame):
+    """Sketches de ROAS por (Tipo_Midia, Mes); reagrupáveis por mídia ou período."""
+    return sketches_por_grupo(df, ["Tipo_Midia", "Mes"], "ROAS")
+
+
+@cache_por_versao()
+def matriz_roas_midia_trimestre(df: pd.DataFrame):
+    """Soma e contagem de ROAS por Tipo_Midia × Trimestre para o heatmap de médias."""
+    return contingencia(df, "Tipo_Midia", "Trimestre", valor="ROAS")
+
+
+@cache_por_versao()
+def curvas_midia(df: pd.DataFrame):
+    """Curvas de resposta log-log de Receita_Gerada × Investimento por Tipo_Midia (ajuste em lote)."""
+    return ajustar_curvas(df)
+
+
 def pearson_r_squared(x, y):
     try:
         if len(x) < 2:
@@ -37,23 +169,11 @@ def pearson_r_squared(x, y):
         return np.nan
 
 
-def _safe_to_numeric(s: pd.Series) -> pd.Series:
-    return pd.to_numeric(s, errors="coerce").fillna(0)
-
-
-def _ensure_datecol(df: pd.DataFrame, col_name: str = "Data_Campanha") -> pd.DataFrame:
-    if col_name not in df.columns:
-        df[col_name] = pd.NaT
-    else:
-        df[col_name] = pd.to_datetime(df[col_name], errors="coerce")
-    return df
-
-
 def _get_month_col(df: pd.DataFrame, col_name: str = "Mes") -> pd.DataFrame:
     if "Mês" in df.columns and "Mes" not in df.columns:
         df = df.rename(columns={"Mês": "Mes"})
     if "Mes" in df.columns:
-        df["Mes"] = pd.to_datetime(df["Mes"], errors="coerce").dt.to_period("M").dt.to_timestamp()
+        df["Mes"] = converter_datas(df["Mes"]).dt.to_period("M").dt.to_timestamp()
     return df
 
 # -------------------- Funções de formatação --------------------
@@ -67,54 +187,13 @@ def fmt_mult(v):
 
 # -------------------- App principal --------------------
 
-def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
+def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None, alertas=None):
     st.title("Dashboard: Marketing")
 
     df_marketing = df_marketing.copy() if df_marketing is not None else pd.DataFrame()
     df_financeiro = df_financeiro.copy() if df_financeiro is not None else pd.DataFrame()
 
-    for col in ["Investimento", "Receita_Gerada"]:
-        if col not in df_marketing.columns:
-            df_marketing[col] = 0
-
-    if "Campanha" not in df_marketing.columns:
-        df_marketing["Campanha"] = df_marketing.index.astype(str)
-    if "Tipo_Midia" not in df_marketing.columns:
-        df_marketing["Tipo_Midia"] = "Desconhecido"
-
-    # numeric conversions
-    df_marketing["Investimento"] = _safe_to_numeric(df_marketing["Investimento"])
-    df_marketing["Receita_Gerada"] = _safe_to_numeric(df_marketing["Receita_Gerada"])
-
-    # dates
-    df_marketing = _ensure_datecol(df_marketing, "Data_Campanha")
-    df_marketing["Ano"] = df_marketing["Data_Campanha"].dt.year
-    df_marketing["Mes"] = df_marketing["Data_Campanha"].dt.to_period("M").dt.to_timestamp()
-    df_marketing["Trimestre"] = df_marketing["Data_Campanha"].dt.quarter
-
-    # computed metrics (safe)
-    def safe_roas(row):
-        inv = row["Investimento"]
-        rev = row["Receita_Gerada"]
-        if pd.isna(inv) or inv == 0:
-            return np.nan
-        return rev / inv
-
-    def safe_cprg(row):
-        inv = row["Investimento"]
-        rev = row["Receita_Gerada"]
-        if pd.isna(rev) or rev == 0:
-            return np.nan
-        return inv / rev
-
-    df_marketing["ROAS"] = df_marketing.apply(safe_roas, axis=1)
-    df_marketing["Lucro"] = df_marketing["Receita_Gerada"] - df_marketing["Investimento"]
-    df_marketing["CPRG"] = df_marketing.apply(safe_cprg, axis=1)
-
-    # classification
-    df_marketing["Desempenho"] = df_marketing["ROAS"].apply(
-        lambda x: "Excelente" if pd.notna(x) and x >= 3 else ("Bom" if pd.notna(x) and x >= 2 else "Ruim")
-    )
+    df_marketing = preparar_campanhas(df_marketing)
 
     color_mode = "Cor única (limpa)"
     base_color = "#2ECC71"
@@ -125,12 +204,13 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
 
     # ---------- KPIs ----------
     st.subheader("📌 Indicadores Gerais")
-    total_invest = df_marketing["Investimento"].sum()
-    total_receita = df_marketing["Receita_Gerada"].sum()
+    kpis = kpis_campanhas(df_marketing).iloc[0]
+    total_invest = kpis["Investimento_Total"]
+    total_receita = kpis["Receita_Total"]
 
     # ROAS agregado (peso correto) vs ROAS médio por campanha (informativo)
     roas_agregado = (total_receita / total_invest) if total_invest > 0 else np.nan
-    roas_medio_por_campanha = df_marketing["ROAS"].mean() if not df_marketing.empty else np.nan
+    roas_medio_por_campanha = kpis["ROAS_Medio"]
 
     k1, k2, k3 = st.columns(3)
     k4, k5, k6 = st.columns(3)
@@ -139,20 +219,24 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
     k2.metric("Receita Total", fmt_money(total_receita))
     k3.metric("ROAS (agregado)", fmt_mult(roas_agregado))
     k4.metric("ROAS médio (por campanha)", fmt_mult(roas_medio_por_campanha))
-    k5.metric("Melhor ROAS", fmt_mult(df_marketing['ROAS'].max() if df_marketing['ROAS'].notna().any() else np.nan))
-    k6.metric("Pior ROAS", fmt_mult(df_marketing['ROAS'].min() if df_marketing['ROAS'].notna().any() else np.nan))
+    k5.metric("Melhor ROAS", fmt_mult(kpis["ROAS_Max"]))
+    k6.metric("Pior ROAS", fmt_mult(kpis["ROAS_Min"]))
 
     if not df_marketing.empty:
-        pct_lucrativas = (df_marketing["Lucro"] > 0).sum() / len(df_marketing) * 100
+        pct_lucrativas = kpis["Campanhas_Lucrativas"] / kpis["Campanhas"] * 100
         st.write(f"Campanhas lucrativas: {pct_lucrativas:.1f}%")
     else:
         st.write("Campanhas lucrativas: —")
 
     st.markdown("---")
 
+    # Seções caras (ranking, dispersão, facetas, boxplot, heatmap) calculam em
+    # paralelo e só ocupam a página quando prontas; o resto renderiza direto.
+    agendador = AgendadorSecoes()
+
     # ---------- Investimento x Receita por Tipo de Mídia (barras) ----------
     st.markdown("### 💸 Investimento e Receita por Tipo de Mídia")
-    inv_mid = df_marketing.groupby("Tipo_Midia", as_index=False)[["Investimento", "Receita_Gerada"]].sum().fillna(0)
+    inv_mid = investimento_por_midia(df_marketing)
     if inv_mid.empty:
         st.info("Sem dados de Investimento x Receita por Tipo de Mídia.")
     else:
@@ -173,10 +257,7 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
 
     # ---------- ROAS Médio por Tipo de Mídia ----------
     st.markdown("### 📈 ROAS Médio por Tipo de Mídia (ordenado)")
-    roas_midia = (df_marketing.groupby("Tipo_Midia", as_index=False)["ROAS"]
-                  .mean()
-                  .sort_values("ROAS", ascending=False)
-                  .reset_index(drop=True))
+    roas_midia = roas_por_midia(df_marketing)
 
     if roas_midia.empty:
         st.info("Sem dados para ROAS médio por Tipo de Mídia.")
@@ -213,34 +294,39 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
     if df_marketing.empty:
         st.info("Sem dados de campanhas.")
     else:
-        df_rank = df_marketing.copy()
-        df_rank_sorted = df_rank.sort_values("ROAS", ascending=False, na_position="last").reset_index(drop=True)
-        campaign_color = base_color
-        fig_rank = go.Figure()
-        fig_rank.add_trace(go.Bar(
-            x=df_rank_sorted["ROAS"].fillna(0),
-            y=pd.Categorical(df_rank_sorted["Campanha"], categories=df_rank_sorted["Campanha"].tolist()[::-1], ordered=True),
-            orientation="h",
-            marker=dict(color=campaign_color),
-            hovertemplate="<b>%{y}</b><br>ROAS: %{x:.2f}x<br>Lucro: %{customdata}<extra></extra>",
-            customdata=df_rank_sorted["Lucro"].apply(lambda v: f"R$ {v:,.2f}")
-        ))
-        fig_rank.update_traces(text=df_rank_sorted["Lucro"].apply(lambda v: f"R$ {v:,.0f}"), textposition="outside")
-        fig_rank.update_layout(title="ROAS por Campanha (ordenado)", margin=dict(l=300), height=600, xaxis_title="ROAS")
-        st.plotly_chart(fig_rank, use_container_width=True)
-
-        st.markdown("**Top 3 Campanhas (por ROAS)** / **Bottom 3 Campanhas (por ROAS)**")
-        df_roas_valid = df_marketing.dropna(subset=["ROAS"]) if not df_marketing.empty else pd.DataFrame()
-        if not df_roas_valid.empty:
-            top3 = df_roas_valid.nlargest(3, "ROAS")[["Campanha", "Tipo_Midia", "Investimento", "Receita_Gerada", "ROAS", "Lucro"]]
-            bot3 = df_roas_valid.nsmallest(3, "ROAS")[["Campanha", "Tipo_Midia", "Investimento", "Receita_Gerada", "ROAS", "Lucro"]]
-        else:
-            top3 = pd.DataFrame(columns=["Campanha", "Tipo_Midia", "Investimento", "Receita_Gerada", "ROAS", "Lucro"])
-            bot3 = top3.copy()
-
-        c1, c2 = st.columns(2)
-        c1.table(top3.reset_index(drop=True))
-        c2.table(bot3.reset_index(drop=True))
+        def calcular_ranking():
+            df_rank_sorted = df_marketing.sort_values("ROAS", ascending=False, na_position="last").reset_index(drop=True)
+            campaign_color = base_color
+            fig_rank = go.Figure()
+            fig_rank.add_trace(go.Bar(
+                x=df_rank_sorted["ROAS"].fillna(0),
+                y=pd.Categorical(df_rank_sorted["Campanha"], categories=df_rank_sorted["Campanha"].tolist()[::-1], ordered=True),
+                orientation="h",
+                marker=dict(color=campaign_color),
+                hovertemplate="<b>%{y}</b><br>ROAS: %{x:.2f}x<br>Lucro: %{customdata}<extra></extra>",
+                customdata=df_rank_sorted["Lucro"].apply(lambda v: f"R$ {v:,.2f}")
+            ))
+            fig_rank.update_traces(text=df_rank_sorted["Lucro"].apply(lambda v: f"R$ {v:,.0f}"), textposition="outside")
+            fig_rank.update_layout(title="ROAS por Campanha (ordenado)", margin=dict(l=300), height=600, xaxis_title="ROAS")
+
+            df_roas_valid = df_marketing.dropna(subset=["ROAS"])
+            if not df_roas_valid.empty:
+                top3 = df_roas_valid.nlargest(3, "ROAS")[["Campanha", "Tipo_Midia", "Investimento", "Receita_Gerada", "ROAS", "Lucro"]]
+                bot3 = df_roas_valid.nsmallest(3, "ROAS")[["Campanha", "Tipo_Midia", "Investimento", "Receita_Gerada", "ROAS", "Lucro"]]
+            else:
+                top3 = pd.DataFrame(columns=["Campanha", "Tipo_Midia", "Investimento", "Receita_Gerada", "ROAS", "Lucro"])
+                bot3 = top3.copy()
+            return fig_rank, top3, bot3
+
+        def renderizar_ranking(resultado):
+            fig_rank, top3, bot3 = resultado
+            st.plotly_chart(fig_rank, use_container_width=True)
+            st.markdown("**Top 3 Campanhas (por ROAS)** / **Bottom 3 Campanhas (por ROAS)**")
+            c1, c2 = st.columns(2)
+            c1.table(top3.reset_index(drop=True))
+            c2.table(bot3.reset_index(drop=True))
+
+        agendador.secao(calcular_ranking, renderizar_ranking)
 
     st.markdown("---")
 
@@ -270,59 +356,67 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
     if df_marketing.empty:
         st.info("Sem dados para o gráfico de dispersão.")
     else:
-        df_sc = df_marketing.dropna(subset=["Investimento", "Receita_Gerada"]).copy()
-        x = df_sc["Investimento"].values
-        y = df_sc["Receita_Gerada"].values
-
-        # regressão linear
-        slope = intercept = r2 = None
-        y_pred = None
-        trend_text = ""
-        if show_regression:
-            try:
-                if len(x) >= 2 and np.nanstd(x) > 0:
-                    slope, intercept = np.polyfit(x, y, 1)
-                    y_pred = slope * x + intercept
-                    r2 = pearson_r_squared(x, y)
-                    trend_text = f"y = {slope:.2f}x + {intercept:.2f} • R²={r2:.3f}"
-                else:
-                    trend_text = "Insuficientes dados para regressão"
-            except Exception:
-                trend_text = "Erro ao calcular regressão"
-
-        use_gl = len(df_sc) > use_scattergl_threshold
-        scatter_trace_type = go.Scattergl if use_gl else go.Scatter
-
-        fig_scatter = go.Figure()
-        fig_scatter.add_trace(
-            scatter_trace_type(
-                x=df_sc["Investimento"],
-                y=df_sc["Receita_Gerada"],
-                mode="markers",
-                marker=dict(size=8, opacity=0.7),
-                text=df_sc["Campanha"],
-                hovertemplate="<b>%{text}</b><br>Investimento: R$ %{x:.2f}<br>Receita: R$ %{y:.2f}<br>ROAS: %{customdata:.2f}x<extra></extra>",
-                customdata=df_sc["ROAS"].fillna(-1)
+        def calcular_dispersao():
+            df_sc = df_marketing.dropna(subset=["Investimento", "Receita_Gerada"])
+            x = df_sc["Investimento"].values
+            y = df_sc["Receita_Gerada"].values
+
+            # regressão linear
+            slope = intercept = r2 = None
+            y_pred = None
+            trend_text = ""
+            if show_regression:
+                try:
+                    if len(x) >= 2 and np.nanstd(x) > 0:
+                        slope, intercept = np.polyfit(x, y, 1)
+                        y_pred = slope * x + intercept
+                        r2 = pearson_r_squared(x, y)
+                        trend_text = f"y = {slope:.2f}x + {intercept:.2f} • R²={r2:.3f}"
+                    else:
+                        trend_text = "Insuficientes dados para regressão"
+                except Exception:
+                    trend_text = "Erro ao calcular regressão"
+
+            use_gl = len(df_sc) > use_scattergl_threshold
+            scatter_trace_type = go.Scattergl if use_gl else go.Scatter
+
+            fig_scatter = go.Figure()
+            fig_scatter.add_trace(
+                scatter_trace_type(
+                    x=df_sc["Investimento"],
+                    y=df_sc["Receita_Gerada"],
+                    mode="markers",
+                    marker=dict(size=8, opacity=0.7),
+                    text=df_sc["Campanha"],
+                    hovertemplate="<b>%{text}</b><br>Investimento: R$ %{x:.2f}<br>Receita: R$ %{y:.2f}<br>ROAS: %{customdata:.2f}x<extra></extra>",
+                    customdata=df_sc["ROAS"].fillna(-1)
+                )
             )
-        )
 
-        max_val = max(
-            df_marketing["Investimento"].max(skipna=True) if not df_marketing["Investimento"].isna().all() else 0,
-            df_marketing["Receita_Gerada"].max(skipna=True) if not df_marketing["Receita_Gerada"].isna().all() else 0
-        ) * 1.05
-        max_val = max_val if max_val > 0 else 1
+            max_val = max(
+                df_marketing["Investimento"].max(skipna=True) if not df_marketing["Investimento"].isna().all() else 0,
+                df_marketing["Receita_Gerada"].max(skipna=True) if not df_marketing["Receita_Gerada"].isna().all() else 0
+            ) * 1.05
+            max_val = max_val if max_val > 0 else 1
+
+            # linha de equilíbrio
+            fig_scatter.add_trace(go.Scatter(x=[0, max_val], y=[0, max_val], mode="lines", name="Equilíbrio", line=dict(dash="dash", color="black")))
+
+            # linha de regressão
+            if y_pred is not None and slope is not None:
+                xs = np.array([0, max_val])
+                ys = slope * xs + intercept
+                fig_scatter.add_trace(go.Scatter(x=xs, y=ys, mode="lines", line=dict(color="firebrick", width=2), name=f"Regressão • R²={r2:.3f}"))
 
-        # linha de equilíbrio
-        fig_scatter.add_trace(go.Scatter(x=[0, max_val], y=[0, max_val], mode="lines", name="Equilíbrio", line=dict(dash="dash", color="black")))
+            fig_scatter.update_layout(height=520, title=f"Investimento vs Receita (com regressão) — {trend_text}")
+            return fig_scatter
 
-        # linha de regressão
-        if y_pred is not None and slope is not None:
-            xs = np.array([0, max_val])
-            ys = slope * xs + intercept
-            fig_scatter.add_trace(go.Scatter(x=xs, y=ys, mode="lines", line=dict(color="firebrick", width=2), name=f"Regressão • R²={r2:.3f}"))
+        agendador.secao(calcular_dispersao, lambda fig: st.plotly_chart(fig, use_container_width=True))
 
-        fig_scatter.update_layout(height=520, title=f"Investimento vs Receita (com regressão) — {trend_text}")
-        st.plotly_chart(fig_scatter, use_container_width=True)
+    # Sketches de ROAS por mídia: calculados uma vez no pool e compartilhados por facetas e boxplot.
+    futuro_roas_por_midia = agendador.tarefa(
+        lambda: {m: sk for m, sk in reagrupar(sketches_roas(df_marketing), nivel=0).items() if pd.notna(m)}
+    )
 
     st.markdown("### Small Multiples — Investimento vs Receita por Tipo de Mídia")
     medias = df_marketing["Tipo_Midia"].dropna().unique().tolist()
@@ -330,105 +424,109 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
         st.info("Sem dados por Tipo de Mídia para small multiples.")
     else:
         try:
-            media_order = df_marketing.groupby("Tipo_Midia")["ROAS"].mean().sort_values(ascending=False).index.tolist()
+            media_order = roas_midia["Tipo_Midia"].tolist()
             medias = [m for m in media_order if m in medias]
         except Exception:
             pass
 
-        stats = df_marketing.groupby("Tipo_Midia").agg(n=("Campanha", "count"), med_roas=("ROAS", lambda x: float(x.median(skipna=True)) if x.dropna().size > 0 else np.nan)).reindex(medias)
-        subplot_titles = [f"{m} — n={int(stats.loc[m,'n'])} — med:{(stats.loc[m,'med_roas'] if not np.isnan(stats.loc[m,'med_roas']) else '—'):.2f}" if not np.isnan(stats.loc[m,'med_roas']) else f"{m} — n={int(stats.loc[m,'n'])} — med: —" for m in medias]
-
-        cols = 3
-        rows = math.ceil(len(medias) / cols)
-        fig_facet = make_subplots(rows=rows, cols=cols, subplot_titles=subplot_titles, horizontal_spacing=0.06, vertical_spacing=0.10, shared_xaxes=False, shared_yaxes=False)
-
-        colorscale = px.colors.sequential.Viridis
-        roas_min = df_marketing["ROAS"].min(skipna=True)
-        roas_max = df_marketing["ROAS"].max(skipna=True)
-        if pd.isna(roas_min) or pd.isna(roas_max) or roas_min == roas_max:
-            roas_min, roas_max = 0.0, 1.0
-
-        # global max quando uniform_scales=True
-        global_max = max(
-            df_marketing["Investimento"].max(skipna=True) if not df_marketing["Investimento"].isna().all() else 0,
-            df_marketing["Receita_Gerada"].max(skipna=True) if not df_marketing["Receita_Gerada"].isna().all() else 0
-        ) * 1.10
-        global_max = global_max if global_max > 0 else 1
-
-        i = 0
-        for r in range(1, rows + 1):
-            for c in range(1, cols + 1):
-                if i >= len(medias):
-                    fig_facet.add_trace(go.Scatter(x=[None], y=[None], showlegend=False, hoverinfo='none'), row=r, col=c)
-                    i += 1
-                    continue
-                media = medias[i]
-                sub = df_marketing[df_marketing["Tipo_Midia"] == media]
-
-                local_max = max(
-                    sub["Investimento"].max(skipna=True) if not sub["Investimento"].isna().all() else 0,
-                    sub["Receita_Gerada"].max(skipna=True) if not sub["Receita_Gerada"].isna().all() else 0
-                ) * 1.10
-                local_max = local_max if local_max > 0 else 1
-
-                sub_max = global_max if uniform_scales else local_max
-
-                roas_vals = sub["ROAS"].fillna(roas_min).tolist()
-                if len(roas_vals) == 0:
-                    norm_vals = []
-                else:
-                    norm_vals = [0.0 if pd.isna(v) else float((v - roas_min) / (roas_max - roas_min)) if roas_max != roas_min else 0.5 for v in roas_vals]
-                try:
-                    marker_colors = sample_colorscale(colorscale, norm_vals)
-                except Exception:
-                    marker_colors = ["#636EFA"] * len(norm_vals)
-
-                fig_facet.add_trace(
-                    go.Scatter(mode="markers",
-                               x=sub["Investimento"],
-                               y=sub["Receita_Gerada"],
-                               marker=dict(size=9, opacity=0.85, color=marker_colors),
-                               name=str(media),
-                               hovertemplate="<b>%{text}</b><br>Investimento: R$ %{x:.2f}<br>Receita: R$ %{y:.2f}<br>ROAS: %{customdata:.2f}x<extra></extra>",
-                               text=sub.get("Campanha"),
-                               customdata=sub["ROAS"].fillna(-1)),
-                    row=r, col=c
-                )
+        def calcular_facetas():
+            roas_por_midia = futuro_roas_por_midia.result()
+            stats = df_marketing.groupby("Tipo_Midia", observed=True).agg(n=("Campanha", "count")).reindex(medias)
+            stats["med_roas"] = [roas_por_midia[m].mediana() if m in roas_por_midia else np.nan for m in medias]
+            subplot_titles = [f"{m} — n={int(stats.loc[m,'n'])} — med:{(stats.loc[m,'med_roas'] if not np.isnan(stats.loc[m,'med_roas']) else '—'):.2f}" if not np.isnan(stats.loc[m,'med_roas']) else f"{m} — n={int(stats.loc[m,'n'])} — med: —" for m in medias]
+
+            cols = 3
+            rows = math.ceil(len(medias) / cols)
+            fig_facet = make_subplots(rows=rows, cols=cols, subplot_titles=subplot_titles, horizontal_spacing=0.06, vertical_spacing=0.10, shared_xaxes=False, shared_yaxes=False)
+
+            colorscale = px.colors.sequential.Viridis
+            roas_min = df_marketing["ROAS"].min(skipna=True)
+            roas_max = df_marketing["ROAS"].max(skipna=True)
+            if pd.isna(roas_min) or pd.isna(roas_max) or roas_min == roas_max:
+                roas_min, roas_max = 0.0, 1.0
+
+            # global max quando uniform_scales=True
+            global_max = max(
+                df_marketing["Investimento"].max(skipna=True) if not df_marketing["Investimento"].isna().all() else 0,
+                df_marketing["Receita_Gerada"].max(skipna=True) if not df_marketing["Receita_Gerada"].isna().all() else 0
+            ) * 1.10
+            global_max = global_max if global_max > 0 else 1
+
+            i = 0
+            for r in range(1, rows + 1):
+                for c in range(1, cols + 1):
+                    if i >= len(medias):
+                        fig_facet.add_trace(go.Scatter(x=[None], y=[None], showlegend=False, hoverinfo='none'), row=r, col=c)
+                        i += 1
+                        continue
+                    media = medias[i]
+                    sub = df_marketing[df_marketing["Tipo_Midia"] == media]
+
+                    local_max = max(
+                        sub["Investimento"].max(skipna=True) if not sub["Investimento"].isna().all() else 0,
+                        sub["Receita_Gerada"].max(skipna=True) if not sub["Receita_Gerada"].isna().all() else 0
+                    ) * 1.10
+                    local_max = local_max if local_max > 0 else 1
+
+                    sub_max = global_max if uniform_scales else local_max
+
+                    roas_vals = sub["ROAS"].fillna(roas_min).tolist()
+                    if len(roas_vals) == 0:
+                        norm_vals = []
+                    else:
+                        norm_vals = [0.0 if pd.isna(v) else float((v - roas_min) / (roas_max - roas_min)) if roas_max != roas_min else 0.5 for v in roas_vals]
+                    try:
+                        marker_colors = sample_colorscale(colorscale, norm_vals)
+                    except Exception:
+                        marker_colors = ["#636EFA"] * len(norm_vals)
 
-                fig_facet.add_trace(
-                    go.Scatter(x=[0, sub_max], y=[0, sub_max], mode="lines",
-                               line=dict(dash="dash", color="black", width=1), showlegend=False, hoverinfo='none'),
-                    row=r, col=c
-                )
-
-                try:
-                    median_roas = sub["ROAS"].median(skipna=True)
-                    med_text = f"n={len(sub)}\nmed: {median_roas:.2f}x" if pd.notna(median_roas) else f"n={len(sub)}\nmed: —"
                     fig_facet.add_trace(
-                        go.Scatter(x=[sub_max * 0.05], y=[sub_max * 0.90], mode="text",
-                                   text=[med_text],
-                                   showlegend=False, hoverinfo='none'),
+                        go.Scatter(mode="markers",
+                                   x=sub["Investimento"],
+                                   y=sub["Receita_Gerada"],
+                                   marker=dict(size=9, opacity=0.85, color=marker_colors),
+                                   name=str(media),
+                                   hovertemplate="<b>%{text}</b><br>Investimento: R$ %{x:.2f}<br>Receita: R$ %{y:.2f}<br>ROAS: %{customdata:.2f}x<extra></extra>",
+                                   text=sub.get("Campanha"),
+                                   customdata=sub["ROAS"].fillna(-1)),
                         row=r, col=c
                     )
-                except Exception:
+
                     fig_facet.add_trace(
-                        go.Scatter(x=[sub_max * 0.05], y=[sub_max * 0.90], mode="text",
-                                   text=[f"n={len(sub)}"],
-                                   showlegend=False, hoverinfo='none'),
+                        go.Scatter(x=[0, sub_max], y=[0, sub_max], mode="lines",
+                                   line=dict(dash="dash", color="black", width=1), showlegend=False, hoverinfo='none'),
                         row=r, col=c
                     )
 
-                fig_facet.update_xaxes(title_text="Investimento (R$)", range=[0, sub_max], row=r, col=c)
-                fig_facet.update_yaxes(title_text="Receita (R$)", range=[0, sub_max], row=r, col=c)
+                    try:
+                        median_roas = stats.loc[media, "med_roas"]
+                        med_text = f"n={len(sub)}\nmed: {median_roas:.2f}x" if pd.notna(median_roas) else f"n={len(sub)}\nmed: —"
+                        fig_facet.add_trace(
+                            go.Scatter(x=[sub_max * 0.05], y=[sub_max * 0.90], mode="text",
+                                       text=[med_text],
+                                       showlegend=False, hoverinfo='none'),
+                            row=r, col=c
+                        )
+                    except Exception:
+                        fig_facet.add_trace(
+                            go.Scatter(x=[sub_max * 0.05], y=[sub_max * 0.90], mode="text",
+                                       text=[f"n={len(sub)}"],
+                                       showlegend=False, hoverinfo='none'),
+                            row=r, col=c
+                        )
+
+                    fig_facet.update_xaxes(title_text="Investimento (R$)", range=[0, sub_max], row=r, col=c)
+                    fig_facet.update_yaxes(title_text="Receita (R$)", range=[0, sub_max], row=r, col=c)
 
-                i += 1
+                    i += 1
 
-        fig_facet.update_layout(height=350 * rows, title_text="Small Multiples: Investimento vs Receita por Tipo de Mídia", showlegend=False, margin=dict(t=120, l=60, r=20, b=60))
-        for a in fig_facet.layout.annotations:
-            a.font = dict(size=11)
-            a.y = a.y + 0.02
+            fig_facet.update_layout(height=350 * rows, title_text="Small Multiples: Investimento vs Receita por Tipo de Mídia", showlegend=False, margin=dict(t=120, l=60, r=20, b=60))
+            for a in fig_facet.layout.annotations:
+                a.font = dict(size=11)
+                a.y = a.y + 0.02
+            return fig_facet
 
-        st.plotly_chart(fig_facet, use_container_width=True)
+        agendador.secao(calcular_facetas, lambda fig: st.plotly_chart(fig, use_container_width=True))
 
     st.markdown("---")
 
@@ -437,14 +535,13 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
     if df_marketing.empty:
         st.info("Sem dados para boxplot de ROAS.")
     else:
-        fig_box = px.box(
-            df_marketing,
-            x="Tipo_Midia",
-            y="ROAS",
-            title="Variação de ROAS por Tipo de Mídia",
-            points="outliers"
-        )
-        st.plotly_chart(fig_box, use_container_width=True)
+        def calcular_boxplot():
+            caixas_roas = tabela_caixas(futuro_roas_por_midia.result())
+            fig_box = go.Figure(go.Box(**caixas_plotly(caixas_roas), name="ROAS"))
+            fig_box.update_layout(title="Variação de ROAS por Tipo de Mídia", xaxis_title="Tipo_Midia", yaxis_title="ROAS")
+            return fig_box
+
+        agendador.secao(calcular_boxplot, lambda fig: st.plotly_chart(fig, use_container_width=True))
 
     st.markdown("---")
 
@@ -453,17 +550,69 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
     if df_marketing["Trimestre"].isna().all() or df_marketing["Tipo_Midia"].isna().all():
         st.info("Dados insuficientes para heatmap (Trimestre x Tipo_Midia).")
     else:
-        df_heat = df_marketing.groupby(["Tipo_Midia", "Trimestre"], as_index=False)["ROAS"].mean()
-        pivot = df_heat.pivot(index="Tipo_Midia", columns="Trimestre", values="ROAS").fillna(0)
-        pivot = pivot.reindex(columns=sorted(pivot.columns))
-        fig_heat = px.imshow(
-            pivot,
-            labels=dict(x="Trimestre", y="Tipo de Mídia", color="ROAS"),
-            x=pivot.columns.astype(str),
-            y=pivot.index,
-            title="ROAS médio (Tipo de Mídia x Trimestre)"
+        def calcular_heatmap():
+            pivot = matriz_roas_midia_trimestre(df_marketing).para_frame("media", preencher=0)
+            return px.imshow(
+                pivot,
+                labels=dict(x="Trimestre", y="Tipo de Mídia", color="ROAS"),
+                x=pivot.columns.astype(str),
+                y=pivot.index,
+                title="ROAS médio (Tipo de Mídia x Trimestre)"
+            )
+
+        agendador.secao(calcular_heatmap, lambda fig: st.plotly_chart(fig, use_container_width=True))
+
+    st.markdown("---")
+
+    # ---------- Simulador de alocação do orçamento ----------
+    st.markdown("### 🧮 Simulador: alocação do orçamento entre mídias")
+    if df_marketing.empty or df_marketing["Tipo_Midia"].isna().all():
+        st.info("Sem dados para simular alocações do orçamento.")
+    else:
+        curvas = curvas_midia(df_marketing)
+        if not (curvas.r2 >= R2_MINIMO_SIMULADOR).any():
+            st.warning(
+                f"Nenhuma curva de resposta tem R² acima de {R2_MINIMO_SIMULADOR:.1f}: a receita das campanhas "
+                "quase não acompanha o investimento, então as alocações simuladas pouco diferem entre si."
+            )
+        s1, s2, s3 = st.columns(3)
+        faixa = s1.slider("Orçamento (% do investimento atual)", 50, 200, (80, 150), step=10)
+        n_cenarios = s2.select_slider("Cenários", options=[1_000, 2_500, 5_000, 10_000], value=10_000)
+        afastamento = s3.select_slider("Afastamento do mix atual", options=list(AFASTAMENTOS), value="Médio")
+
+        multiplicadores = np.arange(faixa[0], faixa[1] + 1, 10) / 100
+        inicio = time.perf_counter()
+        participacoes, orcamentos, receitas = varrer(curvas, multiplicadores, n_cenarios, AFASTAMENTOS[afastamento])
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+
+        fig_sim = go.Figure()
+        fig_sim.add_trace(go.Scatter(x=orcamentos, y=receitas.max(axis=0), mode="lines+markers", name="Melhor cenário"))
+        fig_sim.add_trace(go.Scatter(x=orcamentos, y=receitas[0], mode="lines+markers", name="Mix atual", line=dict(dash="dash")))
+        fig_sim.update_layout(title="Receita prevista por orçamento total", xaxis_title="Orçamento (R$)", yaxis_title="Receita prevista (R$)")
+        st.plotly_chart(fig_sim, use_container_width=True)
+
+        # Detalhe no orçamento mais próximo do investimento atual.
+        nivel = int(np.argmin(np.abs(multiplicadores - 1)))
+        st.markdown(f"**Melhores alocações com orçamento de {fmt_money(orcamentos[nivel])}** "
+                    f"({multiplicadores[nivel]:.0%} do investimento atual)")
+        melhores = melhores_alocacoes(curvas, participacoes, receitas[:, nivel], orcamentos[nivel])
+        valores = [c for c in melhores.columns if c not in ("Cenario", "ROAS_Previsto")]
+        st.dataframe(
+            melhores.style.format("R$ {:,.0f}", subset=valores).format("{:.2f}x", subset=["ROAS_Previsto"]),
+            hide_index=True, use_container_width=True,
+        )
+        with st.expander("Curvas de resposta por mídia"):
+            st.dataframe(
+                tabela_curvas(curvas).style.format(
+                    {"Investimento": "R$ {:,.0f}", "Receita_Gerada": "R$ {:,.0f}", "Elasticidade": "{:.2f}", "R2_log": "{:.3f}"}
+                ),
+                hide_index=True, use_container_width=True,
+            )
+        st.caption(
+            f"{n_cenarios:,} cenários × {len(curvas.midias)} mídias × {len(orcamentos)} orçamentos simulados em "
+            f"{duracao_ms:.0f} ms. Receita de cada mídia = fator × investimento^elasticidade (reta log-log por "
+            "campanha, com a correção de Duan na volta do log; elasticidade limitada a [0, 1] na simulação)."
         )
-        st.plotly_chart(fig_heat, use_container_width=True)
 
     st.markdown("---")
 
@@ -482,47 +631,41 @@ def app(df_marketing: pd.DataFrame = None, df_financeiro: pd.DataFrame = None):
     # ---------- Insights automáticos e recomendações ----------
     st.markdown("## 🧠 Insights Automáticos")
     insights = []
+    recs = []
     if not df_marketing.empty:
-        try:
-            melhor_midia = df_marketing.groupby("Tipo_Midia")["ROAS"].mean().idxmax()
-            pior_midia = df_marketing.groupby("Tipo_Midia")["ROAS"].mean().idxmin()
-        except Exception:
-            melhor_midia = None
-            pior_midia = None
-
-        melhor_campanha = df_marketing.loc[df_marketing["Lucro"].idxmax()]["Campanha"] if df_marketing["Lucro"].notna().any() else None
-        pior_campanha = df_marketing.loc[df_marketing["Lucro"].idxmin()]["Campanha"] if df_marketing["Lucro"].notna().any() else None
+        # Estatísticas já calculadas acima: ROAS médio por mídia e a própria linha de cada campanha.
+        stats_midia = roas_midia.set_index("Tipo_Midia")
+        stats_campanha = df_marketing.set_index("Campanha")[["ROAS", "Lucro", "Investimento"]]
 
         insights.append(f"- ROAS agregado: **{roas_agregado:.2f}x**." if pd.notna(roas_agregado) else "- ROAS agregado: —")
-        if melhor_midia:
-            insights.append(f"- Mídia com melhor ROAS médio: **{melhor_midia}**.")
-        if pior_midia:
-            insights.append(f"- Mídia com pior ROAS médio: **{pior_midia}**.")
-        if pd.notna(melhor_campanha):
-            insights.append(f"- Campanha mais lucrativa: **{melhor_campanha}**.")
-        if pd.notna(pior_campanha):
-            insights.append(("- Campanha com menor lucro: **{pior_campanha}**.") if pd.notna(pior_campanha) else None)
-
-        insights.append(f"- { (df_marketing['Lucro'] > 0).mean() * 100:.1f}% das campanhas geraram lucro.")
+        insights += avaliar_regras(stats_midia, REGRAS_INSIGHTS_MIDIA)
+        insights += avaliar_regras(stats_campanha, REGRAS_INSIGHTS_CAMPANHA)
+
+        # `alertas` é uma função: a varredura só roda quando os insights são montados.
+        alertas_roas = alertas() if alertas is not None else pd.DataFrame()
+        alertas_roas = alertas_roas[alertas_roas["KPI"] == KPI_ROAS] if not alertas_roas.empty else alertas_roas
+        if not alertas_roas.empty:
+            maior = alertas_roas.iloc[0]
+            insights.append(
+                f"- {len(alertas_roas)} dia(s) com ROAS anômalo por mídia; maior desvio: **{maior['Serie']}** em "
+                f"{maior['Data']:%d/%m/%Y} ({maior['Valor']:.2f}x vs mediana {maior['Mediana']:.2f}x)."
+            )
+
+        recs += avaliar_regras(stats_midia, [{
+            "tipo": "abaixo_referencia", "metrica": "ROAS", "referencia": roas_agregado,
+            "texto": "- Revisar estratégia para: {grupos} (ROAS abaixo do agregado).",
+        }])
+        recs += avaliar_regras(stats_campanha, REGRAS_RECOMENDACOES_CAMPANHA)
     else:
         insights.append("- Sem dados para gerar insights automáticos.")
 
     st.info("\n".join(["### Principais insights"] + insights))
 
     st.markdown("### ✅ Recomendações rápidas (automáticas)")
-    recs = []
-    if not roas_midia.empty and pd.notna(roas_agregado):
-        medias_baixas = roas_midia[roas_midia["ROAS"] < roas_agregado]["Tipo_Midia"].tolist()
-        if medias_baixas:
-            recs.append(f"- Revisar estratégia para: {', '.join(medias_baixas)} (ROAS abaixo do agregado).")
-
-    if not df_marketing.empty:
-        candidates = df_marketing[(df_marketing["ROAS"] < 1) & (df_marketing["Investimento"] > df_marketing["Investimento"].median())]
-        if not candidates.empty:
-            recs.append(f"- Avaliar pausar/otimizar campanhas com ROAS < 1 e investimento alto (ex.: {', '.join(candidates['Campanha'].head(3).tolist())}).")
-
     if recs:
         for r in recs:
             st.write(r)
     else:
         st.write("- Nenhuma recomendação automática gerada (dados equilibrados).")
+
+    agendador.concluir()
@@ -2,22 +2,92 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from insights import estatisticas_por_grupo, avaliar_regras
+from consultas import top_n, pagina
+from datas import converter_datas
+from agregados import agregado
+from data_handler import Requisito
+
+METRICAS_GRUPO = {
+    'Receita': ('Valor_Total', 'sum'),
+    'Vendas': ('Valor_Total', 'size'),
+    'Ticket_Medio': ('Valor_Total', 'mean'),
+}
+
+REGRAS_INSIGHTS = {
+    'Cidade': [
+        {'tipo': 'melhor', 'metrica': 'Receita', 'texto': '- Cidade com maior receita: **{grupo}** (R$ {valor:,.2f}).'},
+        {'tipo': 'pior', 'metrica': 'Receita', 'texto': '- Cidade com menor receita: **{grupo}** (R$ {valor:,.2f}).'},
+        {'tipo': 'outliers_mediana', 'metrica': 'Receita', 'fator': 3.0,
+         'texto': '- Cidades com receita fora do padrão: {grupos}.'},
+    ],
+    'Canal_Venda': [
+        {'tipo': 'melhor', 'metrica': 'Ticket_Medio', 'texto': '- Canal com maior ticket médio: **{grupo}** (R$ {valor:,.2f}).'},
+    ],
+    'Categoria': [
+        {'tipo': 'melhor', 'metrica': 'Participacao', 'texto': '- Categoria líder: **{grupo}** ({valor:.1%} da receita).'},
+        {'tipo': 'acima_limite', 'metrica': 'Participacao', 'limite': 0.4, 'min_grupos': 1,
+         'texto': '- {n} categoria(s) concentram mais de 40% da receita cada.'},
+    ],
+}
+
+COLUNAS_DETALHE = ['Data_Venda', 'Cidade', 'Categoria', 'Canal_Venda', 'Valor_Total']
+
+# Bases e colunas que a página usa (carga sob demanda; o período filtra Data_Venda).
+REQUISITOS = {'vendas': Requisito(COLUNAS_DETALHE, data='Data_Venda')}
+
+DIMENSOES_DETALHE = {'Cidade': 'Cidade', 'Canal de Venda': 'Canal_Venda', 'Categoria': 'Categoria'}
+
+VENDAS_POR_PAGINA = 20
 
 def formatar_moeda(valor):
     return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
+def formatar_vendas(vendas):
+    vendas = vendas.copy()
+    vendas['Valor_Total'] = vendas['Valor_Total'].apply(formatar_moeda)
+    vendas['Data_Venda'] = vendas['Data_Venda'].dt.strftime("%d/%m/%Y")
+    return vendas
+
+def preparar_vendas(df_vendas):
+    df_vendas['Valor_Total'] = pd.to_numeric(df_vendas['Valor_Total'], errors='coerce')
+    df_vendas['Data_Venda'] = converter_datas(df_vendas['Data_Venda'])
+    return df_vendas
+
+@agregado('vendas', preparo={'vendas': preparar_vendas})
+def estatisticas_por_cidade(df_vendas):
+    return estatisticas_por_grupo(df_vendas, 'Cidade', METRICAS_GRUPO)
+
+@agregado('vendas', preparo={'vendas': preparar_vendas})
+def estatisticas_por_canal(df_vendas):
+    return estatisticas_por_grupo(df_vendas, 'Canal_Venda', METRICAS_GRUPO)
+
+@agregado('vendas', preparo={'vendas': preparar_vendas})
+def estatisticas_por_categoria(df_vendas):
+    return estatisticas_por_grupo(df_vendas, 'Categoria', METRICAS_GRUPO)
+
+ESTATISTICAS = {
+    'Cidade': estatisticas_por_cidade,
+    'Canal_Venda': estatisticas_por_canal,
+    'Categoria': estatisticas_por_categoria,
+}
+
 def app(df_vendas):
     st.title("Dashboard: Vendas & Produto")
 
-    df_vendas['Valor_Total'] = pd.to_numeric(df_vendas['Valor_Total'], errors='coerce')
-    df_vendas['Data_Venda'] = pd.to_datetime(df_vendas['Data_Venda'], errors='coerce')
+    preparar_vendas(df_vendas)
+
+    # Estatísticas por dimensão (pré-compiladas ou calculadas uma vez por versão);
+    # alimentam os gráficos e os insights.
+    stats = {dim: ESTATISTICAS[dim](df_vendas) for dim in REGRAS_INSIGHTS}
+    stats['Categoria']['Participacao'] = stats['Categoria']['Receita'] / stats['Categoria']['Receita'].sum()
 
     # ==========================================================
     # 1) RECEITA POR CIDADE
     # ==========================================================
     st.markdown("### Receita por Cidade")
 
-    receita_por_cidade = df_vendas.groupby('Cidade')['Valor_Total'].sum().reset_index()
+    receita_por_cidade = stats['Cidade']['Receita'].rename('Valor_Total').reset_index()
 
     fig_cidade = px.bar(
         receita_por_cidade,
@@ -43,8 +113,7 @@ def app(df_vendas):
     st.markdown("### Receita por Canal de Venda")
 
     receita_por_canal = (
-        df_vendas.groupby('Canal_Venda')['Valor_Total']
-        .sum()
+        stats['Canal_Venda']['Receita'].rename('Valor_Total')
         .reset_index()
         .sort_values(by='Valor_Total', ascending=False)
     )
@@ -71,8 +140,7 @@ def app(df_vendas):
     st.markdown("### Receita por Categoria de Produto")
 
     receita_por_categoria = (
-        df_vendas.groupby('Categoria')['Valor_Total']
-        .sum()
+        stats['Categoria']['Receita'].rename('Valor_Total')
         .reset_index()
         .sort_values(by='Valor_Total', ascending=False)
     )
@@ -99,8 +167,7 @@ def app(df_vendas):
     st.markdown("### Ticket Médio por Canal de Venda")
 
     ticket_medio_por_canal = (
-        df_vendas.groupby('Canal_Venda')['Valor_Total']
-        .mean()
+        stats['Canal_Venda']['Ticket_Medio'].rename('Valor_Total')
         .reset_index()
         .sort_values(by='Valor_Total', ascending=False)
     )
@@ -126,17 +193,33 @@ def app(df_vendas):
     # ==========================================================
     st.markdown("### Top 10 Vendas Recentes")
 
-    top_vendas = df_vendas.sort_values(
-        by='Data_Venda',
-        ascending=False
-    ).head(10)
-
-    # Aplicar formatação
-    top_vendas_display = top_vendas.copy()
-    top_vendas_display['Valor_Total'] = top_vendas_display['Valor_Total'].apply(formatar_moeda)
-    top_vendas_display['Data_Venda'] = top_vendas_display['Data_Venda'].dt.strftime("%d/%m/%Y")
+    # Índice por data mantido por versão do dataset: só as 10 posições são lidas.
+    top_vendas = top_n(df_vendas, 'Data_Venda', 10, colunas=COLUNAS_DETALHE)
+
+    st.dataframe(formatar_vendas(top_vendas), use_container_width=True)
+
+    # Detalhamento paginado das vendas mais recentes de uma cidade/canal/categoria.
+    st.markdown("#### Detalhar vendas")
+    col_dim, col_valor, col_pagina = st.columns(3)
+    dimensao = DIMENSOES_DETALHE[col_dim.selectbox("Detalhar por", list(DIMENSOES_DETALHE), key='detalhe_dimensao')]
+    valores = stats[dimensao].index.tolist()
+    valor = col_valor.selectbox("Valor", valores, key='detalhe_valor') if valores else None
+    numero = col_pagina.number_input("Página", min_value=1, value=1, step=1, key='detalhe_pagina')
+
+    if valor is None:
+        st.info("Sem dados para detalhar.")
+    else:
+        detalhe, total = pagina(
+            df_vendas, 'Data_Venda', grupo=dimensao, valor=valor,
+            numero=int(numero) - 1, tamanho=VENDAS_POR_PAGINA, colunas=COLUNAS_DETALHE,
+        )
+        paginas = max(1, -(-total // VENDAS_POR_PAGINA))
+        st.caption(f"{total:,} vendas em {valor} • página {int(numero)} de {paginas}".replace(",", "."))
+        st.dataframe(formatar_vendas(detalhe), use_container_width=True)
 
-    st.dataframe(
-        top_vendas_display[['Data_Venda', 'Cidade', 'Categoria', 'Canal_Venda', 'Valor_Total']],
-        use_container_width=True
-    )
+    # ==========================================================
+    # 6) INSIGHTS AUTOMÁTICOS
+    # ==========================================================
+    st.markdown("### 🧠 Insights Automáticos")
+    insights = [texto for dim, regras in REGRAS_INSIGHTS.items() for texto in avaliar_regras(stats[dim], regras)]
+    st.info("\n".join(insights) if insights else "Sem dados para gerar insights automáticos.")
@@ -1,35 +1,135 @@
 import streamlit as st
 import pandas as pd
+import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
+from data_handler import Requisito, cache_por_versao, consolidar_financeiro, juncoes
+from agregados import agregado
+from previsao import series_mensais, ajustar_lote, prever_lote
 
-def app(df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas):
+HORIZONTE_PREVISAO = 6
+DIMENSOES_PREVISAO = {"Categoria": "Categoria", "Cidade": "Cidade", "Canal de Venda": "Canal_Venda"}
+
+# Bases e colunas que a página usa (carga sob demanda): as cinco, pelas junções e KPIs.
+REQUISITOS = {
+    'atendimento': Requisito(['Data_Abertura', 'Motivo'], data='Data_Abertura'),
+    'clientes': Requisito(['ID_Cliente', 'Tipo', 'Gênero', 'Cidade']),
+    'financeiro': Requisito(data='Mês'),
+    'marketing': Requisito(['Data_Campanha', 'Investimento'], data='Data_Campanha'),
+    'vendas': Requisito(data='Data_Venda'),
+}
+
+
+def preparar_vendas(df_vendas):
+    df_vendas['Valor_Total'] = pd.to_numeric(df_vendas['Valor_Total'], errors='coerce').fillna(0)
+    return df_vendas
+
+
+def preparar_marketing(df_marketing):
+    df_marketing['Investimento'] = pd.to_numeric(df_marketing['Investimento'], errors='coerce').fillna(0)
+    return df_marketing
+
+
+# O financeiro não tem preparo: a consolidação (data_handler.consolidar_financeiro) faz a coerção.
+PREPARO = {'vendas': preparar_vendas, 'marketing': preparar_marketing}
+
+
+@agregado('financeiro', preparo=PREPARO)
+def financeiro_mensal(df_financeiro):
+    """Uma linha por mês, sem linhas repetidas: somas de receita, despesas e lucro e margem ponderada pela receita."""
+    return consolidar_financeiro(df_financeiro).mensal
+
+
+@agregado('financeiro', preparo=PREPARO)
+def financeiro_trimestral(df_financeiro):
+    return consolidar_financeiro(df_financeiro).trimestral
+
+
+@agregado('financeiro', preparo=PREPARO)
+def financeiro_acumulado_ano(df_financeiro):
+    return consolidar_financeiro(df_financeiro).acumulado_ano
+
+
+@agregado('financeiro', 'vendas', 'marketing', preparo=PREPARO)
+def kpis_visao_geral(df_financeiro, df_vendas, df_marketing):
+    """Totais dos cards de KPI (uma linha); os financeiros vêm prontos da consolidação."""
+    totais = consolidar_financeiro(df_financeiro).totais
+    return pd.DataFrame([{
+        'Receita_Total': totais['Receita_Bruta'],
+        'Lucro_Total': totais['Lucro_Líquido'],
+        'Margem_Ponderada': totais['Margem (%)'],
+        'Linhas_Duplicadas': totais['Duplicadas'],
+        'Total_Vendas': df_vendas['Valor_Total'].sum(),
+        'Num_Vendas': len(df_vendas),
+        'Investimento_Marketing': df_marketing['Investimento'].sum(),
+    }])
+
+
+@agregado('vendas', preparo=PREPARO)
+def receita_por_categoria(df_vendas):
+    return df_vendas.groupby('Categoria', observed=True)['Valor_Total'].sum().reset_index()
+
+
+@agregado('vendas', 'clientes', 'atendimento', 'marketing', preparo=PREPARO)
+def receita_por_motivo(df_vendas, df_clientes, df_atendimento, df_marketing):
+    """Receita rateada pelos tickets de cada motivo, com receita por ticket."""
+    fatos = juncoes(df_vendas, df_clientes, df_atendimento, df_marketing)
+    por_motivo = fatos.receita_por_motivo.groupby('Motivo', as_index=False)[['Tickets', 'Receita_Atribuida']].sum()
+    por_motivo['Receita_por_Ticket'] = por_motivo['Receita_Atribuida'] / por_motivo['Tickets']
+    return por_motivo.sort_values('Receita_Atribuida', ascending=False)
+
+
+@agregado('vendas', 'clientes', 'atendimento', 'marketing', preparo=PREPARO)
+def receita_por_tipo_cliente(df_vendas, df_clientes, df_atendimento, df_marketing):
+    fatos = juncoes(df_vendas, df_clientes, df_atendimento, df_marketing)
+    return fatos.vendas_clientes.groupby('Tipo_Cliente', as_index=False)['Valor_Total'].sum()
+
+
+@agregado('vendas', 'clientes', 'atendimento', 'marketing', preparo=PREPARO)
+def marketing_vs_vendas_por_cidade(df_vendas, df_clientes, df_atendimento, df_marketing):
+    fatos = juncoes(df_vendas, df_clientes, df_atendimento, df_marketing)
+    por_cidade = fatos.marketing_vs_vendas.groupby('Cidade', as_index=False)[['Receita', 'Investimento_Atribuido']].sum()
+    return por_cidade.sort_values('Receita', ascending=False)
+
+
+@agregado('financeiro', preparo=PREPARO)
+def previsao_financeira(df_financeiro):
+    """Previsão de Receita_Bruta e Lucro_Líquido mensais (ajuste em lote das duas séries)."""
+    mensal = consolidar_financeiro(df_financeiro).mensal
+    series = pd.concat([
+        series_mensais(mensal, 'Mês', 'Receita_Bruta').rename(index={"Total": "Receita_Bruta"}),
+        series_mensais(mensal, 'Mês', 'Lucro_Líquido').rename(index={"Total": "Lucro_Líquido"}),
+    ])
+    return prever_lote(ajustar_lote(series), HORIZONTE_PREVISAO)
+
+
+@cache_por_versao()
+def previsao_vendas(df_vendas):
+    """Séries mensais de receita por Categoria, Cidade e Canal_Venda e suas previsões (um único ajuste)."""
+    series = pd.concat(
+        {dim: series_mensais(df_vendas, 'Data_Venda', 'Valor_Total', coluna) for dim, coluna in DIMENSOES_PREVISAO.items()},
+        names=["Dimensao", "Serie"],
+    )
+    modelo = ajustar_lote(series.set_axis([f"{d}|{s}" for d, s in series.index]))
+    previsoes = prever_lote(modelo, HORIZONTE_PREVISAO)
+    previsoes[["Dimensao", "Serie"]] = previsoes["Serie"].str.split("|", n=1, expand=True)
+    return series, previsoes
+
+
+def app(df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas, alertas=None):
     st.title("Dashboard: Visão Geral")
 
     # ==========================================================================================
-    #  1. TRATAMENTO E NORMALIZAÇÃO DO DATAFRAME FINANCEIRO (PARA EVITAR DUPLICAÇÕES)
+    #  1. CONSOLIDAÇÃO FINANCEIRA (UMA VEZ POR VERSÃO DO DATASET)
     # ==========================================================================================
 
-    df_financeiro['Receita_Bruta'] = pd.to_numeric(df_financeiro['Receita_Bruta'], errors='coerce').fillna(0)
-    df_financeiro['Lucro_Líquido'] = pd.to_numeric(df_financeiro['Lucro_Líquido'], errors='coerce').fillna(0)
-    df_financeiro['Despesas_Operacionais'] = pd.to_numeric(df_financeiro['Despesas_Operacionais'], errors='coerce').fillna(0)
-    df_financeiro['Margem (%)'] = pd.to_numeric(df_financeiro['Margem (%)'], errors='coerce').fillna(0)
-
-    df_financeiro['Mês'] = pd.to_datetime(df_financeiro['Mês'], errors='coerce')
-    df_financeiro['Mês'] = df_financeiro['Mês'].dt.to_period('M').dt.to_timestamp()
-
-    df_financeiro_mensal = df_financeiro.groupby('Mês', as_index=False).agg({
-        'Receita_Bruta': 'sum',
-        'Despesas_Operacionais': 'sum',
-        'Lucro_Líquido': 'sum',
-        'Margem (%)': 'mean'
-    })
+    df_financeiro_mensal = financeiro_mensal(df_financeiro)
 
     # ==========================================================================================
     #  2. TRATAMENTO DE OUTRAS TABELAS
     # ==========================================================================================
-    df_marketing['Investimento'] = pd.to_numeric(df_marketing['Investimento'], errors='coerce').fillna(0)
-    df_vendas['Valor_Total'] = pd.to_numeric(df_vendas['Valor_Total'], errors='coerce').fillna(0)
+    preparar_marketing(df_marketing)
+    preparar_vendas(df_vendas)
 
     # ==========================================================================================
     # 3. KPI CARDS
@@ -37,15 +137,16 @@ def app(df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas):
     st.markdown("### Indicadores Chave de Performance")
     col1, col2, col3, col4, col5, col6 = st.columns(6)
 
-    total_receita = df_financeiro_mensal['Receita_Bruta'].sum()
-    total_lucro = df_financeiro_mensal['Lucro_Líquido'].sum()
-    margem_percentual = (total_lucro / total_receita * 100) if total_receita > 0 else 0
+    kpis = kpis_visao_geral(df_financeiro, df_vendas, df_marketing).iloc[0]
+    total_receita = kpis['Receita_Total']
+    total_lucro = kpis['Lucro_Total']
+    margem_percentual = kpis['Margem_Ponderada'] if pd.notna(kpis['Margem_Ponderada']) else 0
 
-    total_vendas = df_vendas['Valor_Total'].sum()
-    num_vendas = len(df_vendas)
+    total_vendas = kpis['Total_Vendas']
+    num_vendas = kpis['Num_Vendas']
     ticket_medio = total_vendas / num_vendas if num_vendas > 0 else 0
 
-    investimento_marketing = df_marketing['Investimento'].sum()
+    investimento_marketing = kpis['Investimento_Marketing']
 
     with col1:
         st.metric("Receita Total", f"R$ {total_receita:,.2f}")
@@ -82,6 +183,28 @@ def app(df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas):
         yaxis='y2'
     ))
 
+    previsoes_fin = previsao_financeira(df_financeiro)
+    prev_receita = previsoes_fin[previsoes_fin['Serie'] == 'Receita_Bruta']
+    prev_lucro = previsoes_fin[previsoes_fin['Serie'] == 'Lucro_Líquido']
+
+    fig_trend.add_trace(go.Bar(
+        x=prev_receita['Mes'],
+        y=prev_receita['Previsao'],
+        name='Receita Bruta (previsão)',
+        marker_color='blue',
+        opacity=0.35,
+        error_y=dict(type='data', array=prev_receita['Superior'] - prev_receita['Previsao'], visible=True)
+    ))
+
+    fig_trend.add_trace(go.Scatter(
+        x=prev_lucro['Mes'],
+        y=prev_lucro['Previsao'],
+        name='Lucro Líquido (previsão)',
+        mode='lines+markers',
+        line=dict(color='green', dash='dash'),
+        yaxis='y2'
+    ))
+
     fig_trend.update_layout(
         title_text="Receita Bruta e Lucro Líquido por Mês",
         xaxis_title="Mês",
@@ -101,10 +224,10 @@ def app(df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas):
     # ==========================================================================================
     st.markdown("### Receita por Categoria de Produto")
 
-    receita_por_categoria = df_vendas.groupby('Categoria')['Valor_Total'].sum().reset_index()
+    receita_categoria = receita_por_categoria(df_vendas)
 
     fig_categoria = go.Figure(data=[
-        go.Pie(labels=receita_por_categoria['Categoria'], values=receita_por_categoria['Valor_Total'], hole=.3)
+        go.Pie(labels=receita_categoria['Categoria'], values=receita_categoria['Valor_Total'], hole=.3)
     ])
 
     fig_categoria.update_layout(title_text="Distribuição da Receita por Categoria")
@@ -133,3 +256,111 @@ def app(df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas):
     )
 
     st.plotly_chart(fig_margin, use_container_width=True)
+
+    with st.expander("Consolidado trimestral e acumulado no ano"):
+        if kpis['Linhas_Duplicadas']:
+            st.caption(f"{int(kpis['Linhas_Duplicadas'])} linha(s) do financeiro com chave repetida descartada(s).")
+        formato = {coluna: '{:,.2f}' for coluna in ['Receita_Bruta', 'Despesas_Operacionais', 'Lucro_Líquido', 'Margem (%)']}
+        trimestral = financeiro_trimestral(df_financeiro)
+        trimestral['Trimestre'] = trimestral['Trimestre'].dt.to_period('Q').astype(str)
+        st.dataframe(trimestral.style.format(formato), hide_index=True, use_container_width=True)
+        acumulado = financeiro_acumulado_ano(df_financeiro)
+        acumulado['Mês'] = acumulado['Mês'].dt.strftime('%m/%Y')
+        st.dataframe(acumulado.style.format(formato), hide_index=True, use_container_width=True)
+
+    # ==========================================================================================
+    # 7. PREVISÃO DE RECEITA POR SEGMENTO
+    # ==========================================================================================
+    st.markdown("### Previsão de Receita por Segmento")
+
+    dimensao = st.radio("Segmentar por", list(DIMENSOES_PREVISAO), horizontal=True)
+    series_vendas, previsoes_vendas = previsao_vendas(df_vendas)
+    historico = series_vendas.loc[dimensao]
+    previsoes_dim = previsoes_vendas[previsoes_vendas['Dimensao'] == dimensao]
+
+    fig_prev = go.Figure()
+    for i, serie in enumerate(historico.index):
+        cor = px.colors.qualitative.Plotly[i % len(px.colors.qualitative.Plotly)]
+        prev = previsoes_dim[previsoes_dim['Serie'] == str(serie)]
+        fig_prev.add_trace(go.Scatter(
+            x=historico.columns, y=historico.loc[serie], name=str(serie),
+            mode='lines', line=dict(color=cor), legendgroup=str(serie)
+        ))
+        fig_prev.add_trace(go.Scatter(
+            x=prev['Mes'], y=prev['Previsao'], name=f"{serie} (previsão)",
+            mode='lines', line=dict(color=cor, dash='dash'), legendgroup=str(serie), showlegend=False
+        ))
+
+    fig_prev.update_layout(
+        title_text=f"Receita Mensal por {dimensao} — histórico e previsão ({HORIZONTE_PREVISAO} meses)",
+        xaxis_title="Mês",
+        yaxis_title="Receita (R$)",
+        hovermode="x unified"
+    )
+
+    st.plotly_chart(fig_prev, use_container_width=True)
+
+    # ==========================================================================================
+    # 8. ALERTAS DE ANOMALIAS
+    # ==========================================================================================
+    st.markdown("### Alertas de Anomalias (KPIs diários)")
+
+    # `alertas` é uma função: a varredura só roda quando o painel é desenhado.
+    alertas = alertas() if alertas is not None else None
+    if alertas is None or alertas.empty:
+        st.info("Nenhuma anomalia detectada na última carga dos dados.")
+    else:
+        contagem_kpi = alertas['KPI'].value_counts()
+        cols_alerta = st.columns(len(contagem_kpi))
+        for col, (kpi, qtd) in zip(cols_alerta, contagem_kpi.items()):
+            col.metric(kpi, f"{qtd:,}")
+
+        alertas_display = alertas.head(20).copy()
+        alertas_display['Data'] = alertas_display['Data'].dt.strftime("%d/%m/%Y")
+        st.dataframe(
+            alertas_display.style.format({'Valor': '{:,.2f}', 'Mediana': '{:,.2f}', 'Z': '{:+.1f}'}),
+            hide_index=True,
+            use_container_width=True
+        )
+
+    # ==========================================================================================
+    # 9. ATRIBUIÇÃO ENTRE BASES
+    # ==========================================================================================
+    st.markdown("### Atribuição entre Bases")
+    st.caption(
+        "Tickets e campanhas não têm cliente nem cidade: a receita de cada mês é rateada pelos "
+        "tickets de cada motivo, e o investimento do mês pela receita de cada cidade (o investimento "
+        "de meses sem vendas aparece em \"Sem vendas no mês\")."
+    )
+
+    # Agregados sobre as tabelas de fatos pré-juntadas (juncoes, uma vez por versão do dataset).
+    col_motivo, col_tipo = st.columns(2)
+    with col_motivo:
+        por_motivo = receita_por_motivo(df_vendas, df_clientes, df_atendimento, df_marketing)
+        fig_motivo = px.bar(
+            por_motivo, x='Motivo', y='Receita_Atribuida',
+            title='Receita Atribuída por Motivo de Ticket',
+            labels={'Receita_Atribuida': 'Receita atribuída (R$)'},
+            custom_data=['Tickets', 'Receita_por_Ticket']
+        )
+        fig_motivo.update_traces(hovertemplate="<b>%{x}</b><br>Receita: R$ %{y:,.2f}<br>Tickets: %{customdata[0]:,.0f}"
+                                               "<br>Receita por ticket: R$ %{customdata[1]:,.2f}<extra></extra>")
+        st.plotly_chart(fig_motivo, use_container_width=True)
+
+    with col_tipo:
+        por_tipo = receita_por_tipo_cliente(df_vendas, df_clientes, df_atendimento, df_marketing)
+        fig_tipo = go.Figure(data=[go.Pie(labels=por_tipo['Tipo_Cliente'], values=por_tipo['Valor_Total'], hole=.3)])
+        fig_tipo.update_layout(title_text="Receita por Tipo de Cliente")
+        st.plotly_chart(fig_tipo, use_container_width=True)
+
+    por_cidade = marketing_vs_vendas_por_cidade(df_vendas, df_clientes, df_atendimento, df_marketing)
+    fig_cidade = go.Figure()
+    fig_cidade.add_trace(go.Bar(x=por_cidade['Cidade'], y=por_cidade['Receita'], name='Receita de Vendas'))
+    fig_cidade.add_trace(go.Bar(x=por_cidade['Cidade'], y=por_cidade['Investimento_Atribuido'], name='Investimento Atribuído'))
+    fig_cidade.update_layout(
+        barmode='group',
+        title_text="Investimento em Marketing vs. Vendas por Cidade",
+        xaxis_title="Cidade",
+        yaxis_title="Valor (R$)"
+    )
+    st.plotly_chart(fig_cidade, use_container_width=True)
@@ -0,0 +1,182 @@
+"""
+Armazenamento compartilhado dos DataFrames normalizados em arquivos Arrow IPC.
+
+Um processo carregador publica as cinco bases já tratadas em um diretório
+versionado; cada worker do Streamlit anexa os arquivos via memory-map, de modo
+que as colunas numéricas e de texto ficam nas páginas do SO compartilhadas
+entre processos em vez de serem copiadas para cada worker.
+
+Uso (processo carregador):
+    python src/arrow_store.py /caminho/do/store [tenant]
+
+As leituras por tabela (`anexar_tabela`, `ler_ipc`) aplicam a projeção de
+colunas e o filtro de período sobre a tabela Arrow mapeada, antes da conversão
+para pandas: só as colunas e linhas pedidas são materializadas.
+"""
+import json
+import os
+import shutil
+import sys
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+ARQUIVO_ATUAL = "CURRENT"
+VERSOES_MANTIDAS = 2
+
+
+def _dir_versao(raiz, versao):
+    return os.path.join(raiz, f"v{versao:06d}")
+
+
+def versao_atual(raiz):
+    """Retorna a versão publicada no momento (ou None se não houver)."""
+    try:
+        with open(os.path.join(raiz, ARQUIVO_ATUAL), encoding="utf-8") as f:
+            return int(json.load(f)["versao"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _escrever_tabela(df, caminho, metadados=None):
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    if metadados:
+        extras = {chave.encode("utf-8"): json.dumps(valor).encode("utf-8") for chave, valor in metadados.items()}
+        tabela = tabela.replace_schema_metadata({**(tabela.schema.metadata or {}), **extras})
+    with pa.OSFile(caminho, "wb") as sink:
+        with ipc.new_file(sink, tabela.schema) as writer:
+            writer.write_table(tabela)
+
+
+def gravar_tabela(df, caminho, metadados=None):
+    """Grava `df` em Arrow IPC (com `metadados` JSON no schema), trocando o arquivo de forma atômica."""
+    temporario = f"{caminho}.tmp{os.getpid()}"
+    try:
+        _escrever_tabela(df, temporario, metadados)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def ler_metadados(caminho):
+    """Metadados JSON gravados por `gravar_tabela` (sem ler as colunas); None se o arquivo não existe."""
+    try:
+        schema = ipc.open_file(pa.memory_map(caminho, "r")).schema
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadados = {}
+    for chave, valor in (schema.metadata or {}).items():
+        try:
+            metadados[chave.decode("utf-8")] = json.loads(valor)
+        except ValueError:
+            continue
+    return metadados
+
+
+def _limpar_versoes_antigas(raiz, atual):
+    # Em Linux os workers que ainda mapeiam arquivos removidos continuam
+    # lendo normalmente; a remoção só libera o espaço quando o último mapeamento fecha.
+    for nome in os.listdir(raiz):
+        if not (nome.startswith("v") and nome[1:].isdigit()):
+            continue
+        if int(nome[1:]) <= atual - VERSOES_MANTIDAS:
+            shutil.rmtree(os.path.join(raiz, nome), ignore_errors=True)
+
+
+def publicar(frames, raiz):
+    """
+    Grava cada DataFrame de `frames` (nome → DataFrame) em Arrow IPC dentro de
+    um novo diretório de versão e troca o ponteiro CURRENT de forma atômica.
+    """
+    os.makedirs(raiz, exist_ok=True)
+    versao = (versao_atual(raiz) or 0) + 1
+    destino = _dir_versao(raiz, versao)
+    temporario = destino + f".tmp{os.getpid()}"
+    os.makedirs(temporario)
+
+    for nome, df in frames.items():
+        _escrever_tabela(df, os.path.join(temporario, f"{nome}.arrow"))
+
+    os.rename(temporario, destino)
+
+    ponteiro_tmp = os.path.join(raiz, f"{ARQUIVO_ATUAL}.tmp{os.getpid()}")
+    with open(ponteiro_tmp, "w", encoding="utf-8") as f:
+        json.dump({"versao": versao, "tabelas": list(frames), "publicado_em": time.time()}, f)
+    os.replace(ponteiro_tmp, os.path.join(raiz, ARQUIVO_ATUAL))
+
+    _limpar_versoes_antigas(raiz, versao)
+    return versao
+
+
+def _tipo_pandas(tipo_arrow):
+    # Texto continua apoiado no buffer Arrow (sem materializar objetos Python).
+    if pa.types.is_string(tipo_arrow) or pa.types.is_large_string(tipo_arrow):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def _recortar(tabela, colunas=None, filtro=None):
+    if filtro is not None:
+        coluna, inicio, fim = filtro
+        if coluna in tabela.column_names:
+            valores = tabela[coluna]
+            # Datas nulas ficam de fora, como na máscara equivalente do pandas.
+            mascara = pc.and_(
+                pc.greater_equal(valores, pa.scalar(inicio, type=valores.type)),
+                pc.less(valores, pa.scalar(fim, type=valores.type)),
+            )
+            tabela = tabela.filter(mascara)
+    if colunas is not None:
+        tabela = tabela.select([c for c in colunas if c in tabela.column_names])
+    return tabela
+
+
+def ler_ipc(caminho, colunas=None, filtro=None, types_mapper=None):
+    """
+    DataFrame de um arquivo Arrow IPC mapeado em memória, só com `colunas` (None = todas)
+    e, com `filtro` = (coluna, inicio, fim), só as linhas com inicio <= coluna < fim.
+    """
+    tabela = ipc.open_file(pa.memory_map(caminho, "r")).read_all()
+    return _recortar(tabela, colunas, filtro).to_pandas(split_blocks=True, types_mapper=types_mapper)
+
+
+def anexar_tabela(raiz, nome, colunas=None, filtro=None, versao=None):
+    """
+    Uma tabela da versão publicada (ou de `versao`, enquanto o diretório dela existir),
+    com projeção e filtro (ver ler_ipc); None sem versão publicada.
+    """
+    versao = versao or versao_atual(raiz)
+    if versao is None:
+        return None
+    return ler_ipc(os.path.join(_dir_versao(raiz, versao), f"{nome}.arrow"), colunas, filtro, _tipo_pandas)
+
+
+def anexar(raiz, tabelas):
+    """
+    Anexa a versão publicada via memory-map e devolve (versao, {nome: DataFrame}).
+    Retorna (None, None) quando não há versão publicada.
+    """
+    versao = versao_atual(raiz)
+    if versao is None:
+        return None, None
+
+    frames = {}
+    for nome in tabelas:
+        frames[nome] = ler_ipc(os.path.join(_dir_versao(raiz, versao), f"{nome}.arrow"), types_mapper=_tipo_pandas)
+
+    return versao, frames
+
+
+if __name__ == "__main__":
+    from data_handler import TABELAS, load_data
+
+    raiz_store = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), ".ecomove_store")
+    tenant = sys.argv[2] if len(sys.argv) > 2 else None
+    if tenant is not None:
+        raiz_store = os.path.join(raiz_store, tenant)
+    nova_versao = publicar(dict(zip(TABELAS, load_data(usar_store=False, tenant=tenant))), raiz_store)
+    print(f"Versão {nova_versao} publicada em {raiz_store}")
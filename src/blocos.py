@@ -0,0 +1,763 @@
+"""
+Agregação fora da memória: vendas e atendimento lidos em blocos de linhas.
+
+Quando as bases de vendas e de tickets não cabem na memória do servidor, os
+agregados das páginas que dependem só delas são calculados em streaming. Cada
+bloco de linhas é normalizado como na carga (datas com o formato detectado no
+primeiro bloco, dimensões pelo dicionário canônico) e resumido em agregados
+parciais combináveis: linhas, soma, válidos, mínimo e máximo por grupo, e a
+frequência de cada valor por grupo para as medianas (t-digest quando há
+valores distintos demais). Só os parciais, do tamanho do número de grupos,
+ficam em memória; os agregados finais saem deles, com os mesmos nomes e
+formatos das páginas, e são gravados no manifesto da compilação (ver
+agregados.py) com o hash da fonte. Fonte = planilha do diretório de dados →
+o app usa os agregados como os da compilação normal.
+
+Fontes aceitas: planilha .xlsx (openpyxl em modo read-only), .csv / .csv.gz
+(pandas em chunks), .parquet (lotes do pyarrow, só as colunas usadas) ou um
+diretório com partes nesses formatos, lidas em ordem de nome.
+
+Uso:
+    python src/blocos.py [--dados DIR] [--vendas FONTE] [--atendimento FONTE] [--destino DIR]
+                         [--linhas-por-bloco N] [--limite-memoria-mb MB]
+    python src/blocos.py --verificar [--dados DIR] [--escalas 10,40]
+
+Com --limite-memoria-mb, o pico de memória alocada durante a agregação
+(tracemalloc: objetos Python, NumPy e pandas) é medido e o comando sai com
+erro acima do limite. --verificar confere os agregados em blocos contra os
+calculados pelas páginas sobre as linhas carregadas, e que o pico de memória
+não cresce com o número de linhas (exportações sintéticas de escalas crescentes).
+"""
+import argparse
+import copy
+import gc
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import agregados
+from data_handler import (
+    ARQUIVO_DIMENSOES, ARQUIVOS, DIMENSOES, TABELAS, DicionarioDimensoes, load_data, resolver_raiz,
+)
+from datas import converter_datas, detectar_formato
+from matrizes import meses_inteiros, rotulos_meses
+from sketches import COMPRESSAO_PADRAO, TDigest, sketches_por_grupo
+from app_pages import atendimento, vendasproduto
+
+LINHAS_POR_BLOCO = 100_000
+EXTENSOES = (".xlsx", ".csv", ".csv.gz", ".parquet")
+BASES = ("vendas", "atendimento")
+# Pares (grupo, valor) distintos guardados para medianas exatas; acima disso, t-digest por grupo.
+LIMITE_PARES_EXATOS = 1_000_000
+DESCONHECIDO = "Desconhecido"
+# Código de mês das datas nulas (os meses válidos são inteiros desde 1970-01).
+MES_NULO = np.iinfo(np.int64).min
+
+# Estatísticas parciais de cada coluna de valor e como se combinam entre blocos.
+ESTATISTICAS_PARCIAIS = {"soma": "sum", "validos": "count", "minimo": "min", "maximo": "max"}
+COMBINACAO = {"linhas": "sum", "soma": "sum", "validos": "sum", "minimo": "min", "maximo": "max"}
+# Função de agregação das páginas (METRICAS_GRUPO) → coluna do resumo.
+ESTATISTICA_DA_FUNCAO = {"size": "linhas", "sum": "soma", "count": "validos", "mean": "media", "min": "minimo", "max": "maximo"}
+
+TOLERANCIA_MEMORIA = 0.25
+FOLGA_MEMORIA = 2 * 2**20
+
+
+# ==========================================================================================
+#  LEITURA EM BLOCOS
+# ==========================================================================================
+
+def partes(fonte):
+    """Arquivos de uma fonte: o próprio arquivo ou as partes de um diretório, em ordem de nome."""
+    if not os.path.exists(fonte):
+        raise FileNotFoundError(f"Fonte inexistente: {fonte}")
+    if not os.path.isdir(fonte):
+        return [fonte]
+    encontradas = sorted(
+        os.path.join(raiz, nome)
+        for raiz, _, nomes in os.walk(fonte)
+        for nome in nomes
+        if nome.lower().endswith(EXTENSOES)
+    )
+    if not encontradas:
+        raise FileNotFoundError(f"Nenhuma parte ({', '.join(EXTENSOES)}) em {fonte}")
+    return encontradas
+
+
+def _blocos_parquet(caminho, colunas, linhas):
+    import pyarrow.parquet as pq
+
+    arquivo = pq.ParquetFile(caminho)
+    presentes = None if colunas is None else [c for c in arquivo.schema_arrow.names if c in colunas]
+    for lote in arquivo.iter_batches(batch_size=linhas, columns=presentes):
+        yield lote.to_pandas()
+
+
+def _blocos_csv(caminho, colunas, linhas):
+    usecols = None if colunas is None else (lambda coluna: coluna in colunas)
+    with pd.read_csv(caminho, usecols=usecols, chunksize=linhas) as leitor:
+        yield from leitor
+
+
+def _blocos_xlsx(caminho, colunas, linhas):
+    from openpyxl import load_workbook
+
+    livro = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        linhas_planilha = livro.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas_planilha, None)
+        if cabecalho is None:
+            return
+        posicoes = [i for i, c in enumerate(cabecalho) if c is not None and (colunas is None or c in colunas)]
+        nomes = [cabecalho[i] for i in posicoes]
+        lote, vazias = [], 0
+        for linha in linhas_planilha:
+            # Linhas vazias no fim da planilha são descartadas (como no read_excel); no meio, viram nulos.
+            if all(v is None for v in linha):
+                vazias += 1
+                continue
+            lote.extend([[None] * len(posicoes)] * vazias)
+            vazias = 0
+            lote.append([linha[i] if i < len(linha) else None for i in posicoes])
+            if len(lote) >= linhas:
+                yield pd.DataFrame(lote, columns=nomes)
+                lote = []
+        if lote:
+            yield pd.DataFrame(lote, columns=nomes)
+    finally:
+        livro.close()
+
+
+def ler_blocos(fonte, colunas=None, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Blocos (DataFrames de até ~`linhas_por_bloco` linhas) de `fonte`, só com as `colunas` presentes."""
+    colunas = None if colunas is None else set(colunas)
+    for caminho in partes(fonte):
+        nome = caminho.lower()
+        if nome.endswith(".parquet"):
+            yield from _blocos_parquet(caminho, colunas, linhas_por_bloco)
+        elif nome.endswith((".csv", ".csv.gz")):
+            yield from _blocos_csv(caminho, colunas, linhas_por_bloco)
+        elif nome.endswith(".xlsx"):
+            yield from _blocos_xlsx(caminho, colunas, linhas_por_bloco)
+        else:
+            raise ValueError(f"Formato não suportado: {caminho}")
+
+
+def hash_fonte(fonte):
+    """sha256 do arquivo (o mesmo de agregados.hashes_bases) ou das partes do diretório."""
+    if not os.path.isdir(fonte):
+        return agregados.hash_arquivo(fonte)
+    total = hashlib.sha256()
+    for caminho in partes(fonte):
+        total.update(os.path.relpath(caminho, fonte).encode("utf-8"))
+        total.update(agregados.hash_arquivo(caminho).encode("ascii"))
+    return total.hexdigest()
+
+
+# ==========================================================================================
+#  AGREGADOS PARCIAIS
+# ==========================================================================================
+
+def _combinar_tabelas(*tabelas):
+    juntas = pd.concat(tabelas)
+    funcoes = {coluna: COMBINACAO[coluna.split("_", 1)[0]] for coluna in juntas.columns}
+    return juntas.groupby(level=list(range(juntas.index.nlevels)), sort=False).agg(funcoes)
+
+
+def resumir(tabela, valores, por=None):
+    """
+    Recombina uma tabela parcial (linhas, soma_*, validos_*, minimo_*, maximo_*) pelos
+    níveis `por` do índice (padrão: todos) e acrescenta media_<valor> = soma / válidos.
+    """
+    por = list(tabela.index.names) if por is None else list(por)
+    funcoes = {coluna: COMBINACAO[coluna.split("_", 1)[0]] for coluna in tabela.columns}
+    resumo = tabela.groupby(level=por, sort=True).agg(funcoes)
+    for valor in valores:
+        validos = resumo[f"validos_{valor}"]
+        resumo[f"media_{valor}"] = (resumo[f"soma_{valor}"] / validos.where(validos > 0)).astype(float)
+    return resumo
+
+
+class Parcial:
+    """
+    Linhas e, para cada coluna de valor, soma, válidos, mínimo e máximo por grupo
+    (`chaves`, sem nulos: os blocos trazem códigos). Combinável entre blocos e entre
+    parciais; os grupos ficam na ordem da primeira ocorrência.
+    """
+
+    def __init__(self, chaves, valores):
+        self.chaves = list(chaves)
+        self.valores = list(valores)
+        # Somas de colunas inteiras em todos os blocos voltam como inteiros, como no groupby das linhas.
+        self.inteiros = dict.fromkeys(self.valores, True)
+        self.tabela = None
+        self.blocos = 0
+
+    @property
+    def linhas(self):
+        return 0 if self.tabela is None else int(self.tabela["linhas"].sum())
+
+    @property
+    def grupos(self):
+        return 0 if self.tabela is None else len(self.tabela)
+
+    def atualizar(self, bloco):
+        """Incorpora um bloco com as colunas de chave e de valor."""
+        dados = bloco[self.chaves].copy()
+        for valor in self.valores:
+            numeros = pd.to_numeric(bloco[valor], errors="coerce")
+            self.inteiros[valor] &= pd.api.types.is_integer_dtype(numeros)
+            dados[valor] = numeros
+        agrupado = dados.groupby(self.chaves, sort=False, dropna=False)
+        partes = [agrupado.size().rename("linhas")]
+        for valor in self.valores:
+            estatisticas = agrupado[valor].agg(list(ESTATISTICAS_PARCIAIS.values()))
+            estatisticas.columns = [f"{nome}_{valor}" for nome in ESTATISTICAS_PARCIAIS]
+            partes.append(estatisticas)
+        tabela = pd.concat(partes, axis=1)
+        self.tabela = tabela if self.tabela is None else _combinar_tabelas(self.tabela, tabela)
+        self.blocos += 1
+        return self
+
+    def combinar(self, outro):
+        """Novo parcial equivalente aos blocos dos dois."""
+        novo = Parcial(self.chaves, self.valores)
+        novo.inteiros = {v: self.inteiros[v] and outro.inteiros[v] for v in self.valores}
+        tabelas = [t for t in (self.tabela, outro.tabela) if t is not None]
+        novo.tabela = _combinar_tabelas(*tabelas) if tabelas else None
+        novo.blocos = self.blocos + outro.blocos
+        return novo
+
+    def resultado(self, por=None):
+        """Totais por `por` (subconjunto das chaves; padrão: todas), com as médias."""
+        if self.tabela is None:
+            vazia = pd.MultiIndex.from_arrays([[] for _ in self.chaves], names=self.chaves)
+            self.tabela = pd.DataFrame(
+                {c: pd.Series(dtype=float) for c in ["linhas"] + [f"{n}_{v}" for v in self.valores for n in ESTATISTICAS_PARCIAIS]},
+                index=vazia,
+            )
+        resumo = resumir(self.tabela, self.valores, por)
+        for valor in self.valores:
+            if self.inteiros[valor]:
+                resumo[f"soma_{valor}"] = resumo[f"soma_{valor}"].astype(np.int64)
+        return resumo.astype({"linhas": np.int64})
+
+
+def _mediana_ponderada(valores, pesos):
+    """Mediana (média dos dois centrais, como pandas) de valores ordenados com frequências."""
+    n = int(pesos.sum())
+    if n == 0:
+        return np.nan
+    acumulado = np.cumsum(pesos)
+    baixo = valores[np.searchsorted(acumulado, (n - 1) // 2, side="right")]
+    alto = valores[np.searchsorted(acumulado, n // 2, side="right")]
+    return (baixo + alto) / 2
+
+
+class ContagemValores:
+    """
+    Frequência de cada valor de `valor` por grupo de `chave`, para medianas exatas;
+    combinável. Acima de `limite` pares (grupo, valor) distintos passa a um t-digest por
+    grupo (medianas aproximadas), para que colunas contínuas não guardem cada linha.
+    """
+
+    def __init__(self, chave, valor, limite=LIMITE_PARES_EXATOS, compressao=COMPRESSAO_PADRAO):
+        self.chave = chave
+        self.valor = valor
+        self.limite = limite
+        self.compressao = compressao
+        self.contagens = pd.Series(dtype=np.int64)
+        self.sketches = None
+
+    @property
+    def exata(self):
+        return self.sketches is None
+
+    def atualizar(self, bloco):
+        valores = pd.to_numeric(bloco[self.valor], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        validos = np.isfinite(valores)
+        dados = pd.DataFrame({"chave": bloco[self.chave].to_numpy()[validos], "valor": valores[validos]})
+        if self.exata:
+            self._somar(dados.groupby(["chave", "valor"]).size())
+        else:
+            self._somar_sketches(sketches_por_grupo(dados, "chave", "valor", self.compressao))
+        return self
+
+    def _somar(self, contagens):
+        if self.contagens.empty:
+            self.contagens = contagens.astype(np.int64)
+        elif not contagens.empty:
+            self.contagens = self.contagens.add(contagens, fill_value=0).astype(np.int64)
+        if len(self.contagens) > self.limite:
+            self.sketches = self._sketches_das_contagens()
+            self.contagens = pd.Series(dtype=np.int64)
+
+    def _sketches_das_contagens(self):
+        if self.contagens.empty:
+            return {}
+        return {
+            chave: TDigest.de_frequencias(grupo.index.get_level_values(1), grupo.to_numpy(), self.compressao)
+            for chave, grupo in self.contagens.groupby(level=0, sort=False)
+        }
+
+    def _somar_sketches(self, sketches):
+        for chave, sketch in sketches.items():
+            atual = self.sketches.get(chave)
+            self.sketches[chave] = sketch if atual is None else atual.combinar(sketch)
+
+    def combinar(self, outro):
+        novo = ContagemValores(self.chave, self.valor, self.limite, self.compressao)
+        if self.exata and outro.exata:
+            novo._somar(self.contagens)
+            novo._somar(outro.contagens)
+            return novo
+        novo.sketches = {}
+        for parte in (self, outro):
+            novo._somar_sketches(parte.sketches if not parte.exata else parte._sketches_das_contagens())
+        return novo
+
+    def medianas(self):
+        """Mediana por grupo (Series indexada pela chave)."""
+        if not self.exata:
+            return pd.Series({chave: sketch.mediana() for chave, sketch in self.sketches.items()}, dtype=float)
+        if self.contagens.empty:
+            return pd.Series(dtype=float)
+        return self.contagens.groupby(level=0).apply(
+            lambda grupo: _mediana_ponderada(grupo.index.get_level_values(1).to_numpy(), grupo.to_numpy())
+        ).astype(float)
+
+    def mediana(self, acrescimos=None):
+        """Mediana de todos os grupos juntos, mais `acrescimos` (Series valor → frequência)."""
+        acrescimos = pd.Series(dtype=float) if acrescimos is None else acrescimos
+        if not self.exata:
+            total = TDigest(compressao=self.compressao)
+            for sketch in self.sketches.values():
+                total = total.combinar(sketch)
+            extra = TDigest.de_frequencias(acrescimos.index, acrescimos.to_numpy(), self.compressao)
+            return total.combinar(extra).mediana()
+        frequencias = self.contagens.groupby(level=1).sum().astype(float)
+        frequencias = frequencias.add(acrescimos.astype(float), fill_value=0).sort_index()
+        return _mediana_ponderada(frequencias.index.to_numpy(dtype=float), frequencias.to_numpy())
+
+
+# ==========================================================================================
+#  NORMALIZAÇÃO DOS BLOCOS
+# ==========================================================================================
+
+_DIMENSAO_DA_COLUNA = {origem: dimensao for dimensao, origens in DIMENSOES.items() for origem in origens}
+
+
+class Normalizacao:
+    """Estado compartilhado entre os blocos de uma carga: formatos de data e dicionário de dimensões."""
+
+    def __init__(self, dicionario):
+        self.dicionario = dicionario
+        self.formatos = {}
+
+    def datas(self, bloco, coluna):
+        if coluna not in bloco.columns:
+            return pd.Series(pd.NaT, index=bloco.index, dtype="datetime64[ns]")
+        serie = bloco[coluna]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie
+        # Formato detectado no primeiro bloco e mantido nos seguintes (a carga detecta uma vez por coluna).
+        if coluna not in self.formatos:
+            self.formatos[coluna] = detectar_formato(pd.unique(serie))
+        return converter_datas(serie, self.formatos[coluna])
+
+    def dimensao(self, bloco, tabela, coluna):
+        """Ids canônicos da coluna (-1 para nulos), como em data_handler.aplicar_dimensoes."""
+        if coluna not in bloco.columns:
+            return np.full(len(bloco), -1, dtype=np.int64)
+        return self.dicionario.codificar(_DIMENSAO_DA_COLUNA[(tabela, coluna)], bloco[coluna])
+
+    def indice(self, tabela, coluna, ids, nulos=None):
+        """
+        CategoricalIndex com os rótulos de `ids`; categorias = rótulos presentes em ordem
+        alfabética (como na carga), mais `nulos` no fim para o id -1, quando houver.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        rotulos = np.asarray(self.dicionario.rotulos(_DIMENSAO_DA_COLUNA[(tabela, coluna)]), dtype=object)
+        presentes = np.unique(ids[ids >= 0])
+        categorias = list(pd.Index(rotulos[presentes]).sort_values())
+        valores = rotulos[np.clip(ids, 0, None)] if len(rotulos) else np.full(len(ids), None, dtype=object)
+        if nulos is not None and (ids < 0).any():
+            categorias.append(nulos)
+            valores = np.where(ids < 0, nulos, valores)
+        return pd.CategoricalIndex(valores, categories=categorias, name=coluna)
+
+
+def _coluna(bloco, coluna):
+    return bloco[coluna] if coluna in bloco.columns else pd.Series(np.nan, index=bloco.index)
+
+
+def _texto(bloco, coluna):
+    """Texto sem espaços nas pontas, com nulos como DESCONHECIDO (clean_and_engineer do atendimento)."""
+    if coluna not in bloco.columns:
+        return pd.Series(DESCONHECIDO, index=bloco.index)
+    serie = bloco[coluna]
+    texto = serie.astype(str).str.strip().replace({"nan": DESCONHECIDO})
+    return texto.where(serie.notna(), DESCONHECIDO)
+
+
+def _metricas(resumo, metricas):
+    """Colunas de METRICAS_GRUPO de uma página ({nome: (coluna, função)}) a partir de um resumo."""
+    return pd.DataFrame({
+        nome: resumo["linhas" if funcao == "size" else f"{ESTATISTICA_DA_FUNCAO[funcao]}_{coluna}"]
+        for nome, (coluna, funcao) in metricas.items()
+    })
+
+
+# ==========================================================================================
+#  VENDAS
+# ==========================================================================================
+
+DIMENSOES_VENDAS = ["Cidade", "Canal_Venda", "Categoria"]
+COLUNAS_VENDAS = DIMENSOES_VENDAS + ["Valor_Total"]
+# Agregado das páginas → dimensão agrupada.
+ESTATISTICAS_VENDAS = {
+    "vendasproduto.estatisticas_por_cidade": "Cidade",
+    "vendasproduto.estatisticas_por_canal": "Canal_Venda",
+    "vendasproduto.estatisticas_por_categoria": "Categoria",
+}
+
+
+def parcial_vendas(blocos, normalizacao):
+    """Parcial de Valor_Total por (cidade, canal, categoria) em ids canônicos."""
+    parcial = Parcial(DIMENSOES_VENDAS, ["Valor_Total"])
+    for bloco in blocos:
+        dados = pd.DataFrame({coluna: normalizacao.dimensao(bloco, "vendas", coluna) for coluna in DIMENSOES_VENDAS})
+        dados["Valor_Total"] = _coluna(bloco, "Valor_Total").to_numpy()
+        parcial.atualizar(dados)
+    return parcial
+
+
+def tabelas_vendas(parcial, normalizacao):
+    """Agregados das páginas que dependem só das vendas."""
+    tabelas = {}
+    for nome, coluna in ESTATISTICAS_VENDAS.items():
+        resumo = parcial.resultado([coluna])
+        resumo = resumo[resumo.index >= 0]
+        estatisticas = _metricas(resumo, vendasproduto.METRICAS_GRUPO)
+        estatisticas.index = normalizacao.indice("vendas", coluna, resumo.index)
+        tabelas[nome] = estatisticas.sort_index()
+
+    por_categoria = tabelas["vendasproduto.estatisticas_por_categoria"]
+    tabelas["visaogeral.receita_por_categoria"] = pd.DataFrame({
+        "Categoria": pd.Categorical(por_categoria.index),
+        "Valor_Total": por_categoria["Receita"].to_numpy(),
+    })
+    return tabelas
+
+
+# ==========================================================================================
+#  ATENDIMENTO
+# ==========================================================================================
+
+CHAVES_ATENDIMENTO = ["Motivo", "Status", "Canal", "Mes"]
+COLUNAS_ATENDIMENTO = ["Data_Abertura", "Motivo", "Status", "Canal", "Tempo_Resolucao", "Avaliacao_Cliente"]
+VALORES_ATENDIMENTO = ["Tempo_Resolucao", "Avaliacao_Cliente"]
+
+
+def parcial_atendimento(blocos, normalizacao):
+    """
+    Parcial por (motivo, status, canal, mês) e frequências de Tempo_Resolucao por
+    motivo (as medianas que preenchem os tempos ausentes).
+    """
+    parcial = Parcial(CHAVES_ATENDIMENTO, VALORES_ATENDIMENTO)
+    tempos = ContagemValores("Motivo", "Tempo_Resolucao")
+    for bloco in blocos:
+        bloco = bloco.rename(columns=lambda c: str(c).strip())
+        meses, nulos = meses_inteiros(normalizacao.datas(bloco, "Data_Abertura"))
+        dados = pd.DataFrame({
+            "Motivo": _texto(bloco, "Motivo").to_numpy(),
+            "Status": _texto(bloco, "Status").to_numpy(),
+            "Canal": normalizacao.dimensao(bloco, "atendimento", "Canal"),
+            "Mes": np.where(nulos, MES_NULO, meses),
+            "Tempo_Resolucao": pd.to_numeric(_coluna(bloco, "Tempo_Resolucao"), errors="coerce").to_numpy(),
+            "Avaliacao_Cliente": pd.to_numeric(_coluna(bloco, "Avaliacao_Cliente"), errors="coerce").to_numpy(),
+        })
+        parcial.atualizar(dados)
+        tempos.atualizar(dados)
+    return parcial, tempos
+
+
+def _preencher(cubo, valor, preenchimento):
+    """Soma e válidos de `valor` como se os nulos recebessem `preenchimento` (por linha do cubo)."""
+    nulos = cubo["linhas"] - cubo[f"validos_{valor}"]
+    preenchimento = pd.Series(preenchimento, index=cubo.index, dtype=float)
+    usar = (nulos > 0) & preenchimento.notna()
+    cubo[f"soma_{valor}"] = cubo[f"soma_{valor}"].astype(float) + (nulos * preenchimento).where(usar, 0.0)
+    cubo[f"validos_{valor}"] = cubo[f"validos_{valor}"] + nulos.where(usar, 0)
+
+
+def tabelas_atendimento(parcial, tempos, normalizacao):
+    """
+    Agregados da página de atendimento. Os preenchimentos de clean_and_engineer saem
+    dos parciais: tempo ausente = mediana do motivo (ou a mediana geral já preenchida),
+    avaliação ausente = média geral.
+    """
+    cubo = parcial.resultado()
+    motivos = cubo.index.get_level_values("Motivo")
+
+    medianas = tempos.medianas()
+    nulos_tempo = (cubo["linhas"] - cubo["validos_Tempo_Resolucao"]).groupby(motivos).sum()
+    preenchidos = pd.DataFrame({"valor": medianas.reindex(nulos_tempo.index), "peso": nulos_tempo}).dropna()
+    mediana_geral = tempos.mediana(preenchidos.groupby("valor")["peso"].sum())
+    _preencher(cubo, "Tempo_Resolucao", medianas.reindex(motivos).fillna(mediana_geral).to_numpy())
+
+    validos = cubo["validos_Avaliacao_Cliente"].sum()
+    media_avaliacao = cubo["soma_Avaliacao_Cliente"].sum() / validos if validos > 0 else np.nan
+    _preencher(cubo, "Avaliacao_Cliente", media_avaliacao)
+
+    resolvido = pd.Series(cubo.index.get_level_values("Status"), index=cubo.index).str.lower().isin(
+        atendimento.STATUS_RESOLVIDOS
+    )
+    cubo["soma_Eh_Resolvido"] = cubo["linhas"].where(resolvido, 0)
+    cubo["validos_Eh_Resolvido"] = cubo["linhas"]
+    valores = VALORES_ATENDIMENTO + ["Eh_Resolvido"]
+    cubo = cubo[["linhas"] + [f"{e}_{v}" for v in valores for e in ("soma", "validos")]]
+
+    total = cubo.sum()
+
+    def media_total(valor):
+        validos = total[f"validos_{valor}"]
+        return float(total[f"soma_{valor}"] / validos) if validos > 0 else np.nan
+
+    tabelas = {}
+    tabelas["atendimento.kpis_atendimento"] = pd.DataFrame([{
+        "Total_Tickets": int(total["linhas"]),
+        "Pct_Resolvidos": media_total("Eh_Resolvido") * 100 if total["linhas"] > 0 else 0.0,
+        "Tempo_Medio": media_total("Tempo_Resolucao"),
+        "Avaliacao_Media": media_total("Avaliacao_Cliente"),
+    }])
+
+    tabelas["atendimento.estatisticas_por_motivo"] = _metricas(resumir(cubo, valores, ["Motivo"]), atendimento.METRICAS_GRUPO)
+
+    por_canal = resumir(cubo, valores, ["Canal"])
+    canais = normalizacao.indice("atendimento", "Canal", por_canal.index, nulos=DESCONHECIDO)
+    ordem = np.argsort(canais.codes, kind="stable")
+    tabelas["atendimento.estatisticas_por_canal"] = (
+        _metricas(por_canal, atendimento.METRICAS_GRUPO).set_axis(canais).iloc[ordem]
+    )
+
+    # Empates na ordem da primeira ocorrência, como o value_counts: o parcial guarda os grupos nessa ordem.
+    aparicao = pd.unique(parcial.tabela.index.get_level_values("Status"))
+    por_status = resumir(cubo, valores, ["Status"])["linhas"].reindex(aparicao)
+    por_status = por_status.sort_values(ascending=False, kind="stable")
+    tabelas["atendimento.status_tickets"] = pd.DataFrame({
+        "Status": por_status.index.to_numpy(dtype=object),
+        "Count": por_status.to_numpy(),
+    })
+
+    por_mes = resumir(cubo, valores, ["Mes"])
+    por_mes = por_mes[por_mes.index != MES_NULO]
+    meses = rotulos_meses(por_mes.index.to_numpy())
+    tabelas["atendimento.avaliacao_mensal"] = pd.DataFrame({
+        "Data_Abertura_Month": meses,
+        "Avaliacao_Cliente": por_mes["media_Avaliacao_Cliente"].to_numpy(),
+    })
+
+    # Heatmap mês × canal: meses com data válida × todos os canais presentes, zeros nas células vazias.
+    contagem = resumir(cubo, valores, ["Mes", "Canal"])["linhas"].unstack("Canal", fill_value=0)
+    contagem = contagem.reindex(index=por_mes.index, columns=por_canal.index.to_numpy()[ordem], fill_value=0)
+    tabelas["atendimento.tickets_mes_canal"] = pd.DataFrame(
+        contagem.to_numpy(dtype=np.int64),
+        index=meses,
+        columns=pd.Index(np.asarray(canais[ordem].astype(str)), dtype=object),
+    )
+    return tabelas
+
+
+# ==========================================================================================
+#  COMPILAÇÃO
+# ==========================================================================================
+
+def fontes_padrao(data_path):
+    """Planilhas de vendas e atendimento do diretório de dados (base → caminho)."""
+    fontes = {base: os.path.join(data_path, ARQUIVOS[base]) for base in BASES}
+    return {base: caminho for base, caminho in fontes.items() if os.path.exists(caminho)}
+
+
+def agregar(fontes, normalizacao, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Agregados finais (nome → DataFrame) das `fontes` de vendas e/ou atendimento
+    (base → arquivo ou diretório) e o parcial de cada base, para o relatório.
+    """
+    tabelas, parciais = {}, {}
+    if "vendas" in fontes:
+        blocos = ler_blocos(fontes["vendas"], COLUNAS_VENDAS, linhas_por_bloco)
+        parciais["vendas"] = parcial_vendas(blocos, normalizacao)
+        tabelas.update(tabelas_vendas(parciais["vendas"], normalizacao))
+    if "atendimento" in fontes:
+        blocos = ler_blocos(fontes["atendimento"], COLUNAS_ATENDIMENTO, linhas_por_bloco)
+        parciais["atendimento"], tempos = parcial_atendimento(blocos, normalizacao)
+        if not tempos.exata:
+            print("⚠ Tempo_Resolucao com valores distintos demais: medianas por motivo estimadas (t-digest)")
+        tabelas.update(tabelas_atendimento(parciais["atendimento"], tempos, normalizacao))
+    return tabelas, parciais
+
+
+def compilar_em_blocos(data_path, fontes=None, destino=None, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Agrega as fontes em blocos e grava os agregados no manifesto de `destino` (padrão:
+    DIR_AGREGADOS de `data_path`), mantendo os das outras bases. Usa e atualiza o
+    dicionário de dimensões de `data_path`. Devolve (manifesto, parciais).
+    """
+    agregados.importar_paginas()
+    fontes = fontes or fontes_padrao(data_path)
+    caminho_dimensoes = os.path.join(data_path, ARQUIVO_DIMENSOES)
+    dicionario = DicionarioDimensoes.carregar(caminho_dimensoes)
+    tabelas, parciais = agregar(fontes, Normalizacao(dicionario), linhas_por_bloco)
+    if dicionario.alterado:
+        dicionario.salvar(caminho_dimensoes)
+    hashes = {base: hash_fonte(caminho) for base, caminho in fontes.items()}
+    destino = destino or os.path.join(data_path, agregados.DIR_AGREGADOS)
+    return agregados.gravar(tabelas, hashes, destino, manter=True), parciais
+
+
+# ==========================================================================================
+#  VERIFICAÇÃO DE MEMÓRIA
+# ==========================================================================================
+
+def medir_memoria(funcao, *args, **kwargs):
+    """(resultado, pico de memória alocada em bytes) de funcao(*args, **kwargs), via tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        resultado = funcao(*args, **kwargs)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, pico
+
+
+def _comparar(referencia, tabelas, descricao):
+    falhas = []
+    for nome, tabela in tabelas.items():
+        try:
+            pd.testing.assert_frame_equal(tabela, referencia[nome], check_dtype=False, rtol=1e-9)
+        except AssertionError as e:
+            falhas.append(f"{descricao}: {nome} difere das páginas\n{e}")
+    return falhas
+
+
+def verificar(dados, escalas=(10, 40), linhas_por_bloco=2_000, semente=0):
+    """
+    Verificação offline do caminho em blocos (o repositório não tem suíte de testes):
+      1. planilhas de `dados`, e as mesmas linhas exportadas em CSV e Parquet,
+         agregadas em blocos = agregados das páginas sobre as linhas carregadas;
+      2. exportações sintéticas (sintetico.py) de `escalas` crescentes são agregadas com
+         o mesmo pico de memória, a menos de TOLERANCIA_MEMORIA + FOLGA_MEMORIA.
+    Imprime um relatório e devolve True se tudo passou.
+    """
+    import sintetico
+
+    agregados.importar_paginas()
+    frames = dict(zip(TABELAS, load_data(dados, usar_store=False)))
+    referencia = agregados.calcular_todos(frames)
+    del frames
+    dicionario = DicionarioDimensoes.carregar(os.path.join(dados, ARQUIVO_DIMENSOES))
+
+    def normalizacao():
+        # Cópia: a verificação não grava ids novos no dicionário do diretório de dados.
+        return Normalizacao(DicionarioDimensoes(copy.deepcopy(dicionario.dados)))
+
+    falhas = []
+    tabelas, _ = agregar(fontes_padrao(dados), normalizacao(), linhas_por_bloco)
+    falhas += _comparar(referencia, tabelas, "xlsx")
+
+    originais = sintetico.ler_originais(dados)
+    with tempfile.TemporaryDirectory(prefix="ecomove-blocos-") as temporario:
+        for formato in ("csv", "parquet"):
+            destino = os.path.join(temporario, f"originais_{formato}")
+            sintetico.gravar_partes({b: originais[b] for b in BASES}, destino, formato, linhas_por_bloco // 2 + 1)
+            fontes = {base: os.path.join(destino, base) for base in BASES}
+            tabelas, _ = agregar(fontes, normalizacao(), linhas_por_bloco)
+            falhas += _comparar(referencia, tabelas, formato)
+
+        linhas_relatorio = []
+        for escala in escalas:
+            frames = sintetico.escalar(originais, escala, semente)
+            for formato in ("csv", "parquet"):
+                destino = os.path.join(temporario, f"escala{escala:g}_{formato}")
+                sintetico.gravar_partes({b: frames[b] for b in BASES}, destino, formato, 10 * linhas_por_bloco)
+            n_linhas = sum(len(frames[b]) for b in BASES)
+            del frames
+            for formato in ("csv", "parquet"):
+                fontes = {base: os.path.join(temporario, f"escala{escala:g}_{formato}", base) for base in BASES}
+                inicio = time.perf_counter()
+                (_, parciais), pico = medir_memoria(agregar, fontes, normalizacao(), linhas_por_bloco)
+                linhas_relatorio.append({
+                    "escala": escala, "formato": formato, "linhas": n_linhas,
+                    "blocos": sum(p.blocos for p in parciais.values()),
+                    "pico_mb": pico / 2**20, "tempo_s": time.perf_counter() - inicio,
+                })
+        _, pico_tudo = medir_memoria(
+            lambda: [pd.read_parquet(os.path.join(temporario, f"escala{escalas[-1]:g}_parquet", b)) for b in BASES]
+        )
+
+    relatorio = pd.DataFrame(linhas_relatorio)
+    with pd.option_context("display.float_format", "{:.2f}".format):
+        print(relatorio.to_string(index=False))
+    print(f"Carregar as linhas da escala {escalas[-1]:g} inteiras (Parquet): pico {pico_tudo / 2**20:.1f} MB")
+
+    for formato, grupo in relatorio.groupby("formato"):
+        menor, maior = grupo["pico_mb"].iloc[0] * 2**20, grupo["pico_mb"].iloc[-1] * 2**20
+        if maior > menor * (1 + TOLERANCIA_MEMORIA) + FOLGA_MEMORIA:
+            falhas.append(
+                f"{formato}: pico de memória cresce com as linhas "
+                f"({menor / 2**20:.1f} MB → {maior / 2**20:.1f} MB para {grupo['linhas'].iloc[-1] / grupo['linhas'].iloc[0]:.0f}x linhas)"
+            )
+
+    for falha in falhas:
+        print(f"✗ {falha}", file=sys.stderr)
+    if not falhas:
+        print(f"✓ {len(tabelas)} agregados em blocos iguais aos das páginas (xlsx, csv, parquet); memória limitada")
+    return not falhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agregados de vendas e atendimento calculados em blocos de linhas.")
+    parser.add_argument("--dados", default=None, help="diretório das planilhas e do dicionário de dimensões")
+    parser.add_argument("--vendas", help="fonte das vendas: .xlsx, .csv, .parquet ou diretório de partes")
+    parser.add_argument("--atendimento", help="fonte dos tickets: .xlsx, .csv, .parquet ou diretório de partes")
+    parser.add_argument("--destino", help="diretório do manifesto (padrão: <dados>/" + agregados.DIR_AGREGADOS + ")")
+    parser.add_argument("--linhas-por-bloco", type=int, default=LINHAS_POR_BLOCO)
+    parser.add_argument("--limite-memoria-mb", type=float, help="falha se o pico de memória alocada passar disso")
+    parser.add_argument("--verificar", action="store_true", help="confere resultados e memória com dados sintéticos")
+    parser.add_argument("--escalas", default="10,40", help="escalas sintéticas da verificação de memória")
+    args = parser.parse_args(argv)
+    dados = args.dados or resolver_raiz()
+
+    if args.verificar:
+        escalas = [float(e) for e in args.escalas.split(",") if e.strip()]
+        return 0 if verificar(dados, escalas) else 1
+
+    fontes = {base: getattr(args, base) for base in BASES if getattr(args, base)} or fontes_padrao(dados)
+    inicio = time.perf_counter()
+    if args.limite_memoria_mb is None:
+        (manifesto, parciais), pico = compilar_em_blocos(dados, fontes, args.destino, args.linhas_por_bloco), None
+    else:
+        (manifesto, parciais), pico = medir_memoria(compilar_em_blocos, dados, fontes, args.destino, args.linhas_por_bloco)
+    duracao = time.perf_counter() - inicio
+
+    for base, parcial in parciais.items():
+        print(f"{base}: {parcial.linhas:,} linhas em {parcial.blocos} blocos ({parcial.grupos:,} grupos) ← {fontes[base]}")
+    print(f"{len(manifesto['agregados'])} agregados no manifesto após {duracao:.1f}s")
+    if pico is not None:
+        print(f"Pico de memória alocada: {pico / 2**20:.1f} MB (limite {args.limite_memoria_mb:g} MB)")
+        if pico > args.limite_memoria_mb * 2**20:
+            print("✗ Limite de memória excedido", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
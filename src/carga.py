@@ -0,0 +1,228 @@
+"""
+Teste de carga do dashboard com sessões simuladas.
+
+Cada sessão é um `AppTest` do Streamlit rodando `main.py` numa thread própria,
+como as sessões reais de um mesmo processo do servidor: compartilham o
+`st.cache_resource`, os caches por versão e o pool de seções, e disputam o
+mesmo GIL. Cada sessão troca de página (sorteada entre as cinco) a cada rerun.
+
+Para cada quantidade de sessões simultâneas são medidos:
+    - latência dos reruns (p50, p90, p95, p99 e máxima) e reruns por segundo;
+    - CPU do processo (tempo de CPU / tempo de parede; 100% = um núcleo);
+    - RSS ao fim do nível e pico de RSS amostrado durante o nível.
+Não entram o websocket nem a serialização para o navegador: os números são do
+lado do script, que é onde o processo satura.
+
+Tudo roda offline: as bases são as planilhas do diretório informado (padrão:
+as do repositório) ou cópias sintéticas escaladas (ver sintetico.py) geradas
+num diretório temporário. O app lê as bases do diretório de trabalho, como em produção.
+
+Uso:
+    python src/carga.py [--sessoes 1,2,4,8] [--reruns 10] [--escala 1] [--semente 0]
+                        [--dados DIR] [--saida resultados.csv]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+PAGINAS = ["Visão Geral", "Vendas & Produto", "Marketing", "Atendimento", "Análise de Clientes"]
+_DIR_FONTES = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_APP = os.path.join(_DIR_FONTES, "main.py")
+TIMEOUT_RERUN = 300
+INTERVALO_RSS = 0.05
+
+
+def rss_atual():
+    """RSS do processo em bytes (/proc no Linux; pico do processo como aproximação fora dele)."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo if sys.platform == "darwin" else maximo * 1024
+
+
+class MonitorRss(threading.Thread):
+    """Amostra o RSS periodicamente e guarda o maior valor visto."""
+
+    def __init__(self, intervalo=INTERVALO_RSS):
+        super().__init__(name="ecomove-carga-rss", daemon=True)
+        self.intervalo = intervalo
+        self.pico = rss_atual()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_atual())
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+        return self.pico
+
+
+class SessaoSimulada(threading.Thread):
+    """Uma sessão de navegador: primeira execução e `reruns` trocas de página."""
+
+    def __init__(self, numero, reruns, semente, barreira):
+        super().__init__(name=f"ecomove-sessao-{numero}", daemon=True)
+        self.reruns = reruns
+        self.rng = random.Random(semente * 1_000 + numero)
+        self.barreira = barreira
+        self.medicoes = []
+        self.erros = []
+
+    def _rodar(self, app, pagina=None):
+        inicio = time.perf_counter()
+        if pagina is None:
+            app.run(timeout=TIMEOUT_RERUN)
+        else:
+            app.sidebar.selectbox[0].select(pagina).run(timeout=TIMEOUT_RERUN)
+        duracao = time.perf_counter() - inicio
+        if app.exception:
+            self.erros.append(f"{pagina or PAGINAS[0]}: {app.exception[0].value}")
+        return duracao
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        app = AppTest.from_file(ARQUIVO_APP, default_timeout=TIMEOUT_RERUN)
+        # Todas as sessões começam juntas, como usuários chegando ao mesmo tempo.
+        self.barreira.wait()
+        try:
+            self.medicoes.append(("(primeira)", self._rodar(app)))
+            atual = PAGINAS[0]
+            for _ in range(self.reruns):
+                atual = self.rng.choice([p for p in PAGINAS if p != atual])
+                self.medicoes.append((atual, self._rodar(app, atual)))
+        except Exception as e:
+            self.erros.append(f"sessão interrompida: {e}")
+
+
+def _percentis(latencias):
+    if len(latencias) == 0:
+        return dict.fromkeys(["p50_s", "p90_s", "p95_s", "p99_s", "max_s"], np.nan)
+    p50, p90, p95, p99 = np.percentile(latencias, [50, 90, 95, 99])
+    return {"p50_s": p50, "p90_s": p90, "p95_s": p95, "p99_s": p99, "max_s": float(np.max(latencias))}
+
+
+def medir_nivel(sessoes, reruns, semente=0):
+    """
+    Roda `sessoes` sessões simultâneas com `reruns` trocas de página cada.
+    Devolve (linha de resumo, DataFrame com uma linha por rerun).
+    """
+    barreira = threading.Barrier(sessoes + 1)
+    simuladas = [SessaoSimulada(i, reruns, semente, barreira) for i in range(sessoes)]
+    for sessao in simuladas:
+        sessao.start()
+    monitor = MonitorRss()
+    monitor.start()
+    barreira.wait()
+    cpu_inicio, parede_inicio = time.process_time(), time.perf_counter()
+    for sessao in simuladas:
+        sessao.join()
+    parede = time.perf_counter() - parede_inicio
+    cpu = time.process_time() - cpu_inicio
+    pico = monitor.parar()
+
+    medicoes = pd.DataFrame(
+        [(sessoes, i, pagina, duracao) for i, s in enumerate(simuladas) for pagina, duracao in s.medicoes],
+        columns=["sessoes", "sessao", "pagina", "latencia_s"],
+    )
+    trocas = medicoes.loc[medicoes["pagina"] != "(primeira)", "latencia_s"].to_numpy()
+    erros = [erro for s in simuladas for erro in s.erros]
+    resumo = {
+        "sessoes": sessoes,
+        "reruns": len(trocas),
+        "erros": len(erros),
+        **_percentis(trocas),
+        "reruns_por_s": len(trocas) / parede if parede > 0 else np.nan,
+        "cpu_pct": 100 * cpu / parede if parede > 0 else np.nan,
+        "rss_mb": rss_atual() / 2**20,
+        "rss_pico_mb": pico / 2**20,
+    }
+    for erro in erros[:5]:
+        print(f"  ⚠ {erro}", file=sys.stderr)
+    return resumo, medicoes
+
+
+def executar(niveis, reruns, semente=0):
+    """Mede cada nível de sessões em sequência. Devolve (resumo por nível, latências por página)."""
+    resumos, todas = [], []
+    for sessoes in niveis:
+        resumo, medicoes = medir_nivel(sessoes, reruns, semente)
+        print(f"{sessoes:>3} sessões: p50 {resumo['p50_s']:.2f}s • p95 {resumo['p95_s']:.2f}s • "
+              f"CPU {resumo['cpu_pct']:.0f}% • RSS {resumo['rss_mb']:.0f} MB", file=sys.stderr)
+        resumos.append(resumo)
+        todas.append(medicoes)
+    medicoes = pd.concat(todas, ignore_index=True)
+    por_pagina = (
+        medicoes.groupby(["sessoes", "pagina"])["latencia_s"]
+        .describe(percentiles=[0.5, 0.95])[["count", "50%", "95%", "max"]]
+        .rename(columns={"count": "reruns", "50%": "p50_s", "95%": "p95_s", "max": "max_s"})
+        .reset_index()
+        .astype({"reruns": int})
+    )
+    return pd.DataFrame(resumos), por_pagina
+
+
+def _preparar_dados(args):
+    if args.escala == 1:
+        return args.dados, None
+    import sintetico
+
+    temporario = tempfile.TemporaryDirectory(prefix="ecomove-carga-")
+    inicio = time.perf_counter()
+    frames = sintetico.gerar(args.dados, temporario.name, args.escala, args.semente)
+    print(f"Bases sintéticas (escala {args.escala:g}, {len(frames['vendas']):,} vendas) "
+          f"geradas em {time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+    return temporario.name, temporario
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do dashboard com sessões simuladas.")
+    parser.add_argument("--sessoes", default="1,2,4,8", help="níveis de sessões simultâneas (ex.: 1,2,4,8)")
+    parser.add_argument("--reruns", type=int, default=10, help="trocas de página por sessão")
+    parser.add_argument("--escala", type=float, default=1.0, help="escala das bases sintéticas (1 = originais)")
+    parser.add_argument("--semente", type=int, default=0, help="semente das bases sintéticas e dos sorteios")
+    parser.add_argument("--dados", default=os.path.dirname(_DIR_FONTES), help="diretório com as planilhas")
+    parser.add_argument("--saida", help="CSV com o resumo por nível (as latências por página vão para <saida>_paginas.csv)")
+    args = parser.parse_args(argv)
+
+    niveis = [int(n) for n in args.sessoes.split(",") if n.strip()]
+    sys.path.insert(0, _DIR_FONTES)
+    dados, temporario = _preparar_dados(args)
+    diretorio_anterior = os.getcwd()
+    os.chdir(dados)
+    try:
+        # Carga inicial fora da medição: o primeiro nível não deve pagar a leitura das planilhas.
+        inicio = time.perf_counter()
+        aquecimento, _ = medir_nivel(1, 0, args.semente)
+        print(f"Carga inicial: {time.perf_counter() - inicio:.1f}s "
+              f"(RSS {aquecimento['rss_mb']:.0f} MB)", file=sys.stderr)
+        resumo, por_pagina = executar(niveis, args.reruns, args.semente)
+    finally:
+        os.chdir(diretorio_anterior)
+        if temporario is not None:
+            temporario.cleanup()
+
+    with pd.option_context("display.width", 200, "display.float_format", "{:.3f}".format):
+        print(resumo.to_string(index=False))
+        print()
+        print(por_pagina.to_string(index=False))
+    if args.saida:
+        resumo.to_csv(args.saida, index=False)
+        raiz, ext = os.path.splitext(args.saida)
+        por_pagina.to_csv(f"{raiz}_paginas{ext or '.csv'}", index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Consultas top-N e detalhamento paginado sem ordenar o frame inteiro a cada rerun.
+
+Com dataset versionado, a ordem das linhas por uma coluna (e, para o
+detalhamento, a mesma ordem partida por grupo) é calculada uma vez por versão
+e reaproveitada: cada consulta só fatia posições já ordenadas. Sem versão, o
+top-N cai para np.argpartition, O(N) em vez de O(N log N).
+
+As posições ficam em cache pela versão e pelo objeto índice do frame
+(`cache_por_versao(por_indice=True)`): um recorte do frame, que herda a versão
+nos attrs, tem índice próprio e é ordenado de novo. Cada página deve consultar
+sempre o mesmo frame derivado (ex.: o frame limpo em cache) para aproveitar a ordem.
+Nulos ficam sempre no fim, como em `sort_values`.
+"""
+import numpy as np
+import pandas as pd
+
+from data_handler import cache_por_versao, versao_dataset
+
+_FIM = np.iinfo(np.int64).max
+
+
+def _chave(serie, ascendente):
+    """Chave numérica cuja ordem crescente é a ordem pedida, com nulos no fim."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        nulos = serie.isna().to_numpy()
+        chave = serie.to_numpy(dtype="datetime64[ns]").view("i8").copy()
+        chave[nulos] = 0
+        if not ascendente:
+            chave = -chave
+        chave[nulos] = _FIM
+        return chave
+    chave = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    if not ascendente:
+        chave = -chave
+    chave[np.isnan(chave)] = np.inf
+    return chave
+
+
+@cache_por_versao(por_indice=True)
+def indice_ordenado(df, coluna, ascendente=True):
+    """Posições das linhas de `df` ordenadas por `coluna` (ordenação estável)."""
+    return np.argsort(_chave(df[coluna], ascendente), kind="stable")
+
+
+@cache_por_versao(por_indice=True)
+def indice_por_grupo(df, coluna, grupo, ascendente=True):
+    """{valor do grupo: posições ordenadas por `coluna`} a partir do índice global."""
+    ordem = indice_ordenado(df, coluna, ascendente)
+    codigos, valores = pd.factorize(df[grupo])
+    codigos_ordenados = codigos[ordem]
+    # Ordenação estável pelo código mantém, dentro de cada grupo, a ordem por `coluna`.
+    por_grupo = ordem[np.argsort(codigos_ordenados, kind="stable")]
+    contagens = np.bincount(codigos_ordenados[codigos_ordenados >= 0], minlength=len(valores))
+    inicio = int((codigos_ordenados < 0).sum())
+    limites = inicio + np.concatenate([[0], np.cumsum(contagens)])
+    return {valor: por_grupo[limites[i]:limites[i + 1]] for i, valor in enumerate(valores)}
+
+
+def _posicoes_top(df, coluna, n, ascendente):
+    if versao_dataset(df) is not None:
+        return indice_ordenado(df, coluna, ascendente)[:n]
+    chave = _chave(df[coluna], ascendente)
+    if n < len(chave):
+        candidatas = np.argpartition(chave, n - 1)[:n]
+    else:
+        candidatas = np.arange(len(chave))
+    return candidatas[np.argsort(chave[candidatas], kind="stable")]
+
+
+def top_n(df, coluna, n=10, ascendente=False, colunas=None):
+    """As `n` primeiras linhas de `df` na ordem de `coluna` (maiores, por padrão)."""
+    n = min(n, len(df))
+    if n <= 0:
+        return df.iloc[:0] if colunas is None else df.iloc[:0][colunas]
+    linhas = df.iloc[_posicoes_top(df, coluna, n, ascendente)]
+    return linhas if colunas is None else linhas[colunas]
+
+
+def pagina(df, coluna, grupo=None, valor=None, numero=0, tamanho=20, ascendente=False, colunas=None):
+    """
+    Página `numero` (a partir de 0) das linhas ordenadas por `coluna`, opcionalmente
+    só as de `grupo == valor`. Devolve (linhas, total de linhas do recorte).
+    """
+    if grupo is None:
+        posicoes = indice_ordenado(df, coluna, ascendente)
+    else:
+        posicoes = indice_por_grupo(df, coluna, grupo, ascendente).get(valor, np.array([], dtype=np.intp))
+    inicio = max(numero, 0) * tamanho
+    linhas = df.iloc[posicoes[inicio:inicio + tamanho]]
+    return (linhas if colunas is None else linhas[colunas]), len(posicoes)
@@ -0,0 +1,111 @@
+"""
+Análise de coortes e retenção de clientes.
+
+Cada cliente pertence à coorte do mês de Data_Cadastro. As vendas são ligadas
+ao cliente por um merge ordenado (searchsorted sobre os IDs ordenados) e
+acumuladas em uma matriz coorte × meses desde o cadastro com np.bincount,
+sem merges de pandas entre os frames completos.
+"""
+import numpy as np
+import pandas as pd
+
+from matrizes import meses_inteiros, rotulos_meses
+
+
+# IDs densos (faixa até este múltiplo do nº de clientes) usam tabela de lookup direta.
+FATOR_FAIXA_DENSA = 4
+# Limite de células da bitmap cliente × deslocamento para contar pares distintos.
+CELULAS_MAX_BITMAP = 500_000_000
+
+
+def _juntar_por_id(ids_ordenados, ids_busca):
+    """Posição de cada id de `ids_busca` em `ids_ordenados` e máscara de encontrados."""
+    menor, maior = ids_ordenados[0], ids_ordenados[-1]
+    faixa = int(maior - menor) + 1
+    if faixa <= FATOR_FAIXA_DENSA * len(ids_ordenados):
+        tabela = np.full(faixa, -1, dtype=np.int64)
+        tabela[ids_ordenados - menor] = np.arange(len(ids_ordenados))
+        dentro = (ids_busca >= menor) & (ids_busca <= maior)
+        pos = np.full(len(ids_busca), -1, dtype=np.int64)
+        pos[dentro] = tabela[ids_busca[dentro] - menor]
+        return np.maximum(pos, 0), pos >= 0
+
+    pos = np.searchsorted(ids_ordenados, ids_busca)
+    pos_valida = np.minimum(pos, len(ids_ordenados) - 1)
+    encontrados = (pos < len(ids_ordenados)) & (ids_ordenados[pos_valida] == ids_busca)
+    return pos_valida, encontrados
+
+
+def _chaves_distintas(chaves, n_chaves):
+    """Valores distintos de `chaves` (inteiros em [0, n_chaves)), em ordem."""
+    if n_chaves <= CELULAS_MAX_BITMAP:
+        presente = np.zeros(n_chaves, dtype=bool)
+        presente[chaves] = True
+        return np.flatnonzero(presente)
+    chaves = np.sort(chaves)
+    distintas = np.ones(len(chaves), dtype=bool)
+    distintas[1:] = chaves[1:] != chaves[:-1]
+    return chaves[distintas]
+
+
+def _ids_inteiros(serie):
+    """IDs como int64 e máscara de válidos (IDs não numéricos ficam de fora)."""
+    if pd.api.types.is_integer_dtype(serie.dtype) and not serie.hasnans:
+        return serie.to_numpy(dtype=np.int64), np.ones(len(serie), dtype=bool)
+    valores = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float)
+    validos = np.isfinite(valores)
+    return np.where(validos, valores, 0).astype(np.int64), validos
+
+
+def matriz_coortes(df_clientes, df_vendas, max_meses=None):
+    """
+    Devolve (ativos, tamanhos): `ativos` é um DataFrame coorte × meses desde o
+    cadastro com o número de clientes distintos que compraram naquele mês;
+    `tamanhos` é o número de clientes de cada coorte.
+    """
+    ids_clientes, id_valido = _ids_inteiros(df_clientes["ID_Cliente"])
+    mes_cadastro, cadastro_nulo = meses_inteiros(df_clientes["Data_Cadastro"])
+    validos = id_valido & ~cadastro_nulo
+    ids_clientes, mes_cadastro = ids_clientes[validos], mes_cadastro[validos]
+
+    # IDs duplicados ficam com o cadastro mais antigo.
+    ordem = np.lexsort((mes_cadastro, ids_clientes))
+    ids_clientes, mes_cadastro = ids_clientes[ordem], mes_cadastro[ordem]
+    primeiro = np.ones(len(ids_clientes), dtype=bool)
+    primeiro[1:] = ids_clientes[1:] != ids_clientes[:-1]
+    ids_clientes, mes_cadastro = ids_clientes[primeiro], mes_cadastro[primeiro]
+
+    coortes, coorte_cliente = np.unique(mes_cadastro, return_inverse=True)
+    tamanhos = np.bincount(coorte_cliente, minlength=len(coortes))
+    if len(ids_clientes) == 0:
+        vazio = pd.DataFrame(index=rotulos_meses(coortes))
+        return vazio, pd.Series(tamanhos, index=vazio.index)
+
+    ids_vendas, id_venda_valido = _ids_inteiros(df_vendas["ID_Cliente"])
+    mes_venda, venda_nula = meses_inteiros(df_vendas["Data_Venda"])
+    pos, encontrados = _juntar_por_id(ids_clientes, ids_vendas)
+    encontrados &= id_venda_valido & ~venda_nula
+    cliente = pos[encontrados]
+    deslocamento = mes_venda[encontrados] - mes_cadastro[cliente]
+
+    dentro = deslocamento >= 0
+    if max_meses is not None:
+        dentro &= deslocamento <= max_meses
+    cliente, deslocamento = cliente[dentro], deslocamento[dentro]
+    n_deslocamentos = int(deslocamento.max()) + 1 if deslocamento.size else 1
+
+    # Clientes distintos por (coorte, deslocamento): chave única cliente × deslocamento.
+    chaves = _chaves_distintas(cliente * n_deslocamentos + deslocamento, len(ids_clientes) * n_deslocamentos)
+    cliente_ativo, deslocamento_ativo = np.divmod(chaves, n_deslocamentos)
+    celulas = coorte_cliente[cliente_ativo] * n_deslocamentos + deslocamento_ativo
+    ativos = np.bincount(celulas, minlength=len(coortes) * n_deslocamentos).reshape(len(coortes), n_deslocamentos)
+
+    indice = rotulos_meses(coortes)
+    indice.name = "Coorte"
+    ativos = pd.DataFrame(ativos, index=indice, columns=pd.RangeIndex(n_deslocamentos, name="Meses_Desde_Cadastro"))
+    return ativos, pd.Series(tamanhos, index=indice, name="Clientes")
+
+
+def retencao(ativos, tamanhos):
+    """Fração de clientes de cada coorte ativos em cada mês desde o cadastro."""
+    return ativos.div(tamanhos.replace(0, np.nan), axis=0)
@@ -1,15 +1,32 @@
+import functools
+import json
+import re
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+
+import numpy as np
 import pandas as pd
-import unicodedata
 import os
 
+from datas import converter_datas, normalizar_datas
+from texto import normalizar_chave, remover_acentos, remover_acentos_serie
+
+TABELAS = ("atendimento", "clientes", "financeiro", "marketing", "vendas")
+ARQUIVOS = {nome: f"base_{nome}_ecomove.xlsx" for nome in TABELAS}
+
+# Diretório do store Arrow compartilhado (ver arrow_store.py). Quando definido e
+# já publicado, os workers anexam as bases via memory-map em vez de ler os xlsx.
+ENV_ARROW_STORE = "ECOMOVE_ARROW_STORE"
+
+# Raiz multi-tenant: cada tenant tem um subdiretório com as suas cinco bases
+# (e, com store Arrow, um subdiretório de mesmo nome dentro do store).
+ENV_RAIZ_TENANTS = "ECOMOVE_TENANTS_ROOT"
+_TENANT_VALIDO = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
 
 def remove_acentos(txt):
-    if pd.isna(txt):
-        return None
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', str(txt))
-        if unicodedata.category(c) != 'Mn'
-    )
+    return remover_acentos(txt)
 
 
 def load_nome_base(data_path):
@@ -21,12 +38,11 @@ def load_nome_base(data_path):
         nome_arquivo = os.path.join(data_path, "nomes.csv")
         df_nomes = pd.read_csv(nome_arquivo)
 
-        df_nomes["first_name"] = (
+        df_nomes["first_name"] = remover_acentos_serie(
             df_nomes["first_name"]
             .astype(str)
             .str.lower()
             .str.strip()
-            .apply(remove_acentos)
         )
 
         mapa_nomes = dict(zip(df_nomes["first_name"], df_nomes["classification"]))
@@ -37,6 +53,8 @@ def load_nome_base(data_path):
         print("⚠ Erro ao carregar nomes.csv:", e)
         return {}
 
+GENEROS_MAPA = {"M": "Masculino", "F": "Feminino"}
+
 def inferir_genero_por_nome(nome, mapa):
     if pd.isna(nome):
         return None
@@ -44,14 +62,12 @@ def inferir_genero_por_nome(nome, mapa):
     primeiro = str(nome).split()[0].lower()
     primeiro = remove_acentos(primeiro)
 
-    genero = mapa.get(primeiro)
-
-    if genero == "M":
-        return "Masculino"
-    if genero == "F":
-        return "Feminino"
+    return GENEROS_MAPA.get(mapa.get(primeiro))
 
-    return None
+def inferir_generos(nomes, mapa):
+    """inferir_genero_por_nome para uma Series inteira (primeiro nome sem acentos → mapa)."""
+    primeiros = remover_acentos_serie(nomes.astype("string").str.split().str[0].str.lower())
+    return primeiros.map(mapa).map(GENEROS_MAPA)
 
 def normalizar_genero(df, mapa_nomes):
 
@@ -64,37 +80,765 @@ def normalizar_genero(df, mapa_nomes):
         "f": "Feminino"
     })
 
-    df["Genero_Inferido"] = df["Nome"].apply(
-        lambda x: inferir_genero_por_nome(x, mapa_nomes)
-    )
+    # O gênero inferido pelo nome, quando existe, prevalece sobre o informado.
+    inferido = inferir_generos(df["Nome"], mapa_nomes)
+    df["Gênero"] = inferido.where(inferido.notna(), df["Gênero"])
+
+    return df
+
+# ==========================================================================================
+#  VALIDAÇÃO DE QUALIDADE
+# ==========================================================================================
+# Esquema declarativo por base. Regras suportadas por coluna:
+#   tipo: "numero" | "inteiro" | "data" | "texto"
+#   min / max: faixa permitida (inclusiva) para numéricos
+#   categorias: valores permitidos
+#   obrigatorio: nulos contam como problema
+#   unico: valores repetidos contam como duplicados
+
+ESQUEMAS = {
+    "atendimento": {
+        "ID_Chamado": {"tipo": "inteiro", "obrigatorio": True, "unico": True},
+        "Data_Abertura": {"tipo": "data", "obrigatorio": True},
+        "Motivo": {"tipo": "texto", "obrigatorio": True},
+        "Status": {"tipo": "texto", "categorias": ["Aberto", "Em Andamento", "Resolvido"]},
+        "Tempo_Resolucao": {"tipo": "numero", "min": 0},
+        "Avaliacao_Cliente": {"tipo": "numero", "min": 1, "max": 5},
+        "Canal": {"tipo": "texto", "categorias": ["Chat", "Telefone", "E-mail"]},
+    },
+    "clientes": {
+        "ID_Cliente": {"tipo": "inteiro", "obrigatorio": True, "unico": True},
+        "Nome": {"tipo": "texto"},
+        "Tipo": {"tipo": "texto", "categorias": ["PF", "PJ"]},
+        "Cidade": {"tipo": "texto"},
+        "Idade": {"tipo": "numero", "min": 0, "max": 120},
+        "Gênero": {"tipo": "texto", "categorias": ["Masculino", "Feminino", "M", "F", "m", "f"]},
+        "Renda": {"tipo": "numero", "min": 0},
+        "Data_Cadastro": {"tipo": "data", "obrigatorio": True},
+    },
+    "financeiro": {
+        "Mês": {"tipo": "data", "obrigatorio": True},
+        "Receita_Bruta": {"tipo": "numero", "min": 0},
+        "Despesas_Operacionais": {"tipo": "numero", "min": 0},
+        "Lucro_Líquido": {"tipo": "numero"},
+        "Margem (%)": {"tipo": "numero"},
+    },
+    "marketing": {
+        "Campanha": {"tipo": "texto", "obrigatorio": True},
+        "Tipo_Midia": {"tipo": "texto", "categorias": ["Online", "TV", "Redes Sociais", "Outdoor", "Rádio"]},
+        "Investimento": {"tipo": "numero", "min": 0},
+        "Receita_Gerada": {"tipo": "numero", "min": 0},
+        "Data_Campanha": {"tipo": "data"},
+    },
+    "vendas": {
+        "ID_Venda": {"tipo": "inteiro", "obrigatorio": True, "unico": True},
+        "Data_Venda": {"tipo": "data", "obrigatorio": True},
+        "Cidade": {"tipo": "texto"},
+        "Categoria": {"tipo": "texto", "categorias": ["Acessórios", "EcoBike", "EcoScoot", "EcoCargo"]},
+        "Canal_Venda": {"tipo": "texto", "categorias": ["Loja Física", "Marketplace", "Site", "B2B"]},
+        "Valor_Total": {"tipo": "numero", "min": 0},
+        "ID_Cliente": {"tipo": "inteiro"},
+    },
+}
+
+PROBLEMAS_QUALIDADE = ["nulos", "tipo_invalido", "fora_faixa", "categoria_invalida", "duplicados"]
+
+
+def _valores_tipados(serie, tipo):
+    if tipo in ("numero", "inteiro"):
+        return pd.to_numeric(serie, errors="coerce")
+    if tipo == "data":
+        return converter_datas(serie)
+    return serie
+
+
+def validar_dados(df, esquema):
+    """
+    Avalia as regras do esquema como máscaras vetorizadas (uma passada por coluna)
+    e devolve um relatório com a contagem de problemas por coluna.
+    """
+    linhas = []
+    n = len(df)
+    for coluna, regra in esquema.items():
+        if coluna not in df.columns:
+            linhas.append({"coluna": coluna, "linhas": n, "ausente": True, **dict.fromkeys(PROBLEMAS_QUALIDADE, 0)})
+            continue
+
+        serie = df[coluna]
+        tipo = regra.get("tipo", "texto")
+        nulos = serie.isna().to_numpy()
+        valores = _valores_tipados(serie, tipo)
 
-    def resolver(row):
-        if row["Genero_Inferido"] and row["Genero_Inferido"] != row["Gênero"]:
-            return row["Genero_Inferido"]
-        return row["Gênero"]
+        tipo_invalido = valores.isna().to_numpy() & ~nulos
+        fora_faixa = np.zeros(n, dtype=bool)
+        if tipo in ("numero", "inteiro"):
+            arr = valores.to_numpy(dtype=float, na_value=np.nan)
+            if tipo == "inteiro":
+                tipo_invalido |= np.isfinite(arr) & (arr % 1 != 0)
+            with np.errstate(invalid="ignore"):
+                if "min" in regra:
+                    fora_faixa |= arr < regra["min"]
+                if "max" in regra:
+                    fora_faixa |= arr > regra["max"]
 
-    df["Gênero"] = df.apply(resolver, axis=1)
+        categoria_invalida = np.zeros(n, dtype=bool)
+        if "categorias" in regra:
+            categoria_invalida = ~nulos & ~serie.isin(regra["categorias"]).to_numpy()
 
-    df.drop(columns=["Genero_Inferido"], inplace=True)
+        duplicados = np.zeros(n, dtype=bool)
+        if regra.get("unico"):
+            duplicados = serie.duplicated(keep=False).to_numpy() & ~nulos
 
+        mascaras = np.column_stack([
+            nulos if regra.get("obrigatorio") else np.zeros(n, dtype=bool),
+            tipo_invalido, fora_faixa, categoria_invalida, duplicados,
+        ])
+        contagens = mascaras.sum(axis=0)
+        linhas.append({"coluna": coluna, "linhas": n, "ausente": False, **dict(zip(PROBLEMAS_QUALIDADE, contagens.tolist()))})
+
+    relatorio = pd.DataFrame(linhas, columns=["coluna", "linhas", "ausente"] + PROBLEMAS_QUALIDADE)
+    relatorio["ok"] = ~relatorio["ausente"] & (relatorio[PROBLEMAS_QUALIDADE].sum(axis=1) == 0)
+    return relatorio
+
+
+def relatorio_qualidade(frames):
+    """Relatório consolidado (tabela, coluna) para todas as bases com esquema."""
+    partes = []
+    for nome, df in frames.items():
+        if nome in ESQUEMAS:
+            partes.append(validar_dados(df, ESQUEMAS[nome]).assign(tabela=nome))
+    if not partes:
+        return pd.DataFrame(columns=["tabela", "coluna", "linhas", "ausente"] + PROBLEMAS_QUALIDADE + ["ok"])
+    relatorio = pd.concat(partes, ignore_index=True)
+    return relatorio[["tabela"] + [c for c in relatorio.columns if c != "tabela"]]
+
+
+def marcar_versao(df, versao):
+    """Registra em df.attrs a versão do dataset de onde o frame veio."""
+    df.attrs["versao_dataset"] = versao
     return df
 
-def load_data():
-    data_path = os.getcwd()
 
-    df_atendimento = pd.read_excel(os.path.join(data_path, 'base_atendimento_ecomove.xlsx'))
-    df_clientes = pd.read_excel(os.path.join(data_path, 'base_clientes_ecomove.xlsx'))
-    df_financeiro = pd.read_excel(os.path.join(data_path, 'base_financeiro_ecomove.xlsx'), decimal=',')
-    df_marketing = pd.read_excel(os.path.join(data_path, 'base_marketing_ecomove.xlsx'))
-    df_vendas = pd.read_excel(os.path.join(data_path, 'base_vendas_ecomove.xlsx'))
+def versao_dataset(df):
+    """Versão do dataset do frame (None quando carregado fora do atualizador)."""
+    return df.attrs.get("versao_dataset")
+
+
+def cache_por_versao(maxsize=32, por_indice=False):
+    """
+    Memoiza `func(df, *args)` pela versão do dataset do frame. Outros frames em
+    `args` entram na chave pela própria versão. Frames sem versão (carregados
+    fora do atualizador) são sempre recalculados.
+
+    Recortes de um frame (df[mascara], df.head(), ...) herdam a versão dele nos
+    attrs. Com `por_indice`, para resultados que são posições de linhas, a chave
+    inclui também o objeto índice do frame: cópias rasas compartilham o cache,
+    qualquer derivação com índice novo é recalculada.
+    """
+    def decorador(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(df, *args, **kwargs):
+            versoes = [versao_dataset(df)] + [versao_dataset(a) for a in args if isinstance(a, pd.DataFrame)]
+            if any(v is None for v in versoes):
+                return func(df, *args, **kwargs)
+
+            chave_args = tuple(("df", versao_dataset(a)) if isinstance(a, pd.DataFrame) else a for a in args)
+            chave = (versoes[0], chave_args, tuple(sorted(kwargs.items())))
+            if por_indice:
+                # id() pode ser reaproveitado depois que o índice morre; a weakref confirma o objeto.
+                chave += (len(df), id(df.index))
+            with lock:
+                if chave in cache:
+                    indice, resultado = cache[chave]
+                    if indice is None or indice() is df.index:
+                        cache.move_to_end(chave)
+                        return resultado
+
+            resultado = func(df, *args, **kwargs)
+            with lock:
+                cache[chave] = (weakref.ref(df.index) if por_indice else None, resultado)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return resultado
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorador
+
+
+# ==========================================================================================
+#  DIMENSÕES CANÔNICAS
+# ==========================================================================================
+# Cada dimensão mapeia valores brutos para um id canônico: a chave do valor
+# (sem acentos, caixa ou espaços extras, ver texto.normalizar_chave) passa pela
+# tabela de aliases e é procurada no dicionário; chaves novas ganham o próximo
+# id, com a grafia mais frequente (ou o destino do alias) como rótulo. O
+# dicionário é gravado ao lado das bases, então os ids ficam estáveis entre cargas.
+# As colunas viram categóricas com os rótulos canônicos.
+
+ARQUIVO_DIMENSOES = ".ecomove_dimensoes.json"
+
+DIMENSOES = {
+    "cidade": [("clientes", "Cidade"), ("vendas", "Cidade")],
+    "canal_venda": [("vendas", "Canal_Venda")],
+    "categoria": [("vendas", "Categoria")],
+    "canal_atendimento": [("atendimento", "Canal")],
+    "tipo_midia": [("marketing", "Tipo_Midia")],
+}
+
+# Apelidos conhecidos (já como chave normalizada) → rótulo canônico.
+ALIASES_DIMENSOES = {
+    "cidade": {
+        "sp": "São Paulo", "sampa": "São Paulo", "rj": "Rio de Janeiro", "rio": "Rio de Janeiro",
+        "bh": "Belo Horizonte", "poa": "Porto Alegre", "floripa": "Florianópolis",
+        "bsb": "Brasília", "ssa": "Salvador", "rec": "Recife", "cwb": "Curitiba",
+    },
+    "canal_venda": {
+        "loja": "Loja Física", "loja fisica": "Loja Física", "e-commerce": "Site",
+        "ecommerce": "Site", "site proprio": "Site",
+    },
+    "canal_atendimento": {"email": "E-mail", "e mail": "E-mail", "fone": "Telefone", "chat online": "Chat"},
+    "tipo_midia": {"radio": "Rádio", "social": "Redes Sociais", "midias sociais": "Redes Sociais", "televisao": "TV"},
+}
+
+
+class DicionarioDimensoes:
+    """Chave normalizada → id e id → rótulo canônico, por dimensão."""
+
+    def __init__(self, dados=None):
+        self.dados = dados or {}
+        self.alterado = False
+
+    @classmethod
+    def carregar(cls, caminho):
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError) as e:
+            print("⚠ Erro ao carregar dicionário de dimensões:", e)
+            return cls()
+
+    def salvar(self, caminho):
+        temporario = f"{caminho}.tmp{os.getpid()}"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(self.dados, f, ensure_ascii=False, indent=1)
+            os.replace(temporario, caminho)
+            self.alterado = False
+        except OSError as e:
+            print("⚠ Erro ao gravar dicionário de dimensões:", e)
+
+    def rotulos(self, dimensao):
+        return self.dados.get(dimensao, {}).get("rotulos", [])
+
+    def codificar(self, dimensao, serie):
+        """Ids canônicos (int64, -1 para nulos) de uma Series, resolvendo cada valor distinto uma vez."""
+        dimensao_dados = self.dados.setdefault(dimensao, {"rotulos": [], "ids": {}})
+        aliases = ALIASES_DIMENSOES.get(dimensao, {})
+        codigos, unicos = pd.factorize(serie)
+        frequencias = np.bincount(codigos[codigos >= 0], minlength=len(unicos))
+
+        chaves = []
+        for valor in unicos:
+            chave = normalizar_chave(valor)
+            if chave in aliases:
+                chave = normalizar_chave(aliases[chave])
+            chaves.append(chave)
+
+        # Chaves novas: rótulo = destino do alias, senão a grafia mais frequente.
+        destinos = {normalizar_chave(r): r for r in aliases.values()}
+        novas = {}
+        for chave, valor, frequencia in zip(chaves, unicos, frequencias):
+            if chave is None or chave in dimensao_dados["ids"]:
+                continue
+            rotulo = destinos.get(chave, str(valor).strip())
+            if chave not in novas or (chave not in destinos and frequencia > novas[chave][1]):
+                novas[chave] = (rotulo, frequencia)
+        for chave, (rotulo, _) in novas.items():
+            dimensao_dados["ids"][chave] = len(dimensao_dados["rotulos"])
+            dimensao_dados["rotulos"].append(rotulo)
+            self.alterado = True
+
+        ids_unicos = np.array([dimensao_dados["ids"].get(c, -1) for c in chaves] + [-1], dtype=np.int64)
+        return ids_unicos[codigos]
+
+
+def aplicar_dimensoes(frames, dicionario):
+    """
+    Substitui as colunas de DIMENSOES em `frames` (nome → DataFrame) por categóricas
+    com os rótulos canônicos (categorias em ordem alfabética, só as presentes).
+    """
+    for dimensao, origens in DIMENSOES.items():
+        rotulos = None
+        for tabela, coluna in origens:
+            df = frames.get(tabela)
+            if df is None or coluna not in df.columns:
+                continue
+            ids = dicionario.codificar(dimensao, df[coluna])
+            rotulos = np.asarray(dicionario.rotulos(dimensao), dtype=object)
+            presentes = np.unique(ids[ids >= 0])
+            categorias = pd.Index(rotulos[presentes]).sort_values()
+            # id canônico → posição da categoria alfabética.
+            posicao = np.full(len(rotulos) + 1, -1, dtype=np.int64)
+            posicao[presentes] = categorias.get_indexer(rotulos[presentes])
+            df[coluna] = pd.Categorical.from_codes(posicao[ids], categories=categorias)
+    return frames
+
+
+# ==========================================================================================
+#  JUNÇÕES ENTRE BASES
+# ==========================================================================================
+# As colunas compartilhadas (cliente, cidade, mês, canal) viram chaves substitutas
+# inteiras com um dicionário por dimensão; as buscas muitos-para-um usam esse
+# código para indexar um vetor de posições, sem merge do pandas. Tickets e campanhas
+# não trazem cliente nem cidade, então se ligam às vendas pelo mês: receita e
+# investimento do mês são rateados pela participação de cada motivo/cidade.
+
+DIMENSOES_JUNCAO = {
+    "cliente": [("vendas", "ID_Cliente"), ("clientes", "ID_Cliente")],
+    "cidade": [("vendas", "Cidade"), ("clientes", "Cidade")],
+    "canal": [("vendas", "Canal_Venda")],
+}
+
+
+class ChaveSubstituta:
+    """Dicionário de valores de uma dimensão e índice hash valor → código inteiro."""
+
+    def __init__(self, *series):
+        valores = pd.concat([s.dropna() for s in series], ignore_index=True) if series else pd.Series(dtype=object)
+        self.valores = pd.Index(pd.unique(valores))
+
+    def __len__(self):
+        return len(self.valores)
+
+    def codificar(self, serie):
+        """Códigos int64 da série (-1 para nulos ou valores fora do dicionário)."""
+        return self.valores.get_indexer(serie).astype(np.int64)
+
+
+def indice_unico(codigos, tamanho):
+    """
+    Vetor código → posição da linha (lado "um" de uma busca muitos-para-um);
+    -1 onde o código não aparece. Códigos repetidos ficam com a primeira linha.
+    """
+    posicoes = np.full(tamanho, -1, dtype=np.int64)
+    validos = np.flatnonzero(codigos >= 0)
+    posicoes[codigos[validos[::-1]]] = validos[::-1]
+    return posicoes
+
+
+def buscar(codigos, indice, df, colunas):
+    """Colunas de `df` para cada código (NaN onde não há correspondência)."""
+    posicoes = np.where(codigos >= 0, indice[np.clip(codigos, 0, None)], -1)
+    encontrados = posicoes >= 0
+    resultado = {}
+    for coluna in colunas:
+        valores = df[coluna].to_numpy()
+        saida = np.full(len(posicoes), np.nan, dtype=object if valores.dtype == object else float)
+        saida[encontrados] = valores[posicoes[encontrados]]
+        resultado[coluna] = saida
+    return pd.DataFrame(resultado)
+
+
+Juncoes = namedtuple("Juncoes", ["chaves", "vendas_clientes", "receita_por_motivo", "marketing_vs_vendas"])
+# Cidade da linha que recebe o investimento de um mês sem vendas para ratear.
+SEM_VENDAS = "Sem vendas no mês"
+
+
+def _rateio(pesos, totais_mes, codigos_mes):
+    """Reparte o total de cada mês entre as linhas de `pesos`, proporcionalmente dentro do mês."""
+    soma_mes = np.bincount(codigos_mes, weights=pesos, minlength=len(totais_mes))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fracao = np.where(soma_mes[codigos_mes] > 0, pesos / soma_mes[codigos_mes], 0.0)
+    return totais_mes[codigos_mes] * fracao
+
+
+def _nao_rateado(atribuido, totais_mes, codigos_mes):
+    """(meses, valores) do total de cada mês que ficou sem linha para recebê-lo no rateio."""
+    restante = totais_mes - np.bincount(codigos_mes, weights=atribuido, minlength=len(totais_mes))
+    meses = np.flatnonzero(restante > 1e-9 * np.maximum(np.abs(totais_mes), 1.0))
+    return meses, restante[meses]
+
+
+@cache_por_versao(maxsize=8)
+def juncoes(df_vendas, df_clientes, df_atendimento, df_marketing):
+    """
+    Chaves, vendas enriquecidas com os atributos do cliente e as tabelas de fatos
+    pré-juntadas (receita × motivo de ticket, investimento × vendas por mês e cidade),
+    construídas uma vez por versão do dataset.
+    """
+    from matrizes import meses_inteiros, rotulos_meses
+
+    frames = {"vendas": df_vendas, "clientes": df_clientes}
+    chaves = {
+        nome: ChaveSubstituta(*(frames[tabela][coluna] for tabela, coluna in origens if coluna in frames[tabela]))
+        for nome, origens in DIMENSOES_JUNCAO.items()
+    }
+
+    # Vendas × clientes (muitos-para-um pelo ID_Cliente).
+    indice_clientes = indice_unico(chaves["cliente"].codificar(df_clientes["ID_Cliente"]), len(chaves["cliente"]))
+    atributos = buscar(
+        chaves["cliente"].codificar(df_vendas["ID_Cliente"]), indice_clientes, df_clientes, ["Tipo", "Gênero", "Cidade"]
+    ).rename(columns={"Tipo": "Tipo_Cliente", "Gênero": "Genero_Cliente", "Cidade": "Cidade_Cliente"})
+    valor = pd.to_numeric(df_vendas["Valor_Total"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    vendas_clientes = pd.concat([
+        df_vendas[["ID_Venda", "Data_Venda", "Cidade", "Canal_Venda", "Categoria", "ID_Cliente"]].reset_index(drop=True),
+        pd.Series(valor, name="Valor_Total"),
+        atributos,
+    ], axis=1)
+
+    # Mês como chave comum às quatro bases: um eixo contínuo cobrindo todas.
+    meses_vendas, nulos_vendas = meses_inteiros(df_vendas["Data_Venda"])
+    meses_tickets, nulos_tickets = meses_inteiros(df_atendimento["Data_Abertura"])
+    meses_mkt, nulos_mkt = meses_inteiros(df_marketing["Data_Campanha"])
+    validos = [m[~n] for m, n in ((meses_vendas, nulos_vendas), (meses_tickets, nulos_tickets), (meses_mkt, nulos_mkt))]
+    validos = [m for m in validos if len(m)]
+    primeiro = min(m.min() for m in validos) if validos else 0
+    n_meses = (max(m.max() for m in validos) - primeiro + 1) if validos else 0
+    chaves["mes"] = rotulos_meses(np.arange(primeiro, primeiro + n_meses))
+
+    receita_mes = np.bincount(meses_vendas[~nulos_vendas] - primeiro, weights=valor[~nulos_vendas], minlength=n_meses)
+    investimento = pd.to_numeric(df_marketing["Investimento"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    investimento_mes = np.bincount(meses_mkt[~nulos_mkt] - primeiro, weights=investimento[~nulos_mkt], minlength=n_meses)
+
+    # Receita × motivo de ticket: a receita do mês é rateada pelos tickets de cada motivo.
+    motivo = ChaveSubstituta(df_atendimento["Motivo"])
+    codigos_motivo = motivo.codificar(df_atendimento["Motivo"])
+    ok = ~nulos_tickets & (codigos_motivo >= 0)
+    celula = (meses_tickets[ok] - primeiro) * len(motivo) + codigos_motivo[ok]
+    tickets = np.bincount(celula, minlength=n_meses * len(motivo)).astype(float)
+    mes_celula = np.repeat(np.arange(n_meses), len(motivo))
+    receita_por_motivo = pd.DataFrame({
+        "Mes": chaves["mes"][mes_celula],
+        "Motivo": np.tile(motivo.valores.to_numpy(dtype=object), n_meses),
+        "Tickets": tickets,
+        "Receita_Atribuida": _rateio(tickets, receita_mes, mes_celula),
+    })
+    receita_por_motivo = receita_por_motivo[receita_por_motivo["Tickets"] > 0].reset_index(drop=True)
+
+    # Investimento × vendas por mês e cidade: o investimento do mês é rateado pela receita de cada cidade.
+    codigos_cidade = chaves["cidade"].codificar(df_vendas["Cidade"])
+    n_cidades = len(chaves["cidade"])
+    ok = ~nulos_vendas & (codigos_cidade >= 0)
+    celula = (meses_vendas[ok] - primeiro) * n_cidades + codigos_cidade[ok]
+    vendas_celula = np.bincount(celula, minlength=n_meses * n_cidades).astype(float)
+    receita_celula = np.bincount(celula, weights=valor[ok], minlength=n_meses * n_cidades)
+    mes_celula = np.repeat(np.arange(n_meses), n_cidades)
+    marketing_vs_vendas = pd.DataFrame({
+        "Mes": chaves["mes"][mes_celula],
+        "Cidade": np.tile(chaves["cidade"].valores.to_numpy(dtype=object), n_meses),
+        "Vendas": vendas_celula,
+        "Receita": receita_celula,
+        "Investimento_Atribuido": _rateio(receita_celula, investimento_mes, mes_celula),
+    })
+    # Meses com investimento e sem receita para ratear: o valor fica numa linha própria,
+    # e o investimento atribuído continua somando o investimento total.
+    meses, restante = _nao_rateado(marketing_vs_vendas["Investimento_Atribuido"].to_numpy(), investimento_mes, mes_celula)
+    sem_vendas = pd.DataFrame({
+        "Mes": chaves["mes"][meses], "Cidade": SEM_VENDAS, "Vendas": 0.0, "Receita": 0.0,
+        "Investimento_Atribuido": restante,
+    })
+    marketing_vs_vendas = pd.concat(
+        [marketing_vs_vendas[marketing_vs_vendas["Vendas"] > 0], sem_vendas], ignore_index=True
+    ).sort_values("Mes", kind="stable").reset_index(drop=True)
+
+    return Juncoes(chaves, vendas_clientes, receita_por_motivo, marketing_vs_vendas)
+
+
+def resolver_raiz(tenant=None, raiz=None):
+    """
+    Diretório das bases de um tenant: `raiz` (ou ECOMOVE_TENANTS_ROOT, ou o diretório
+    de trabalho) + id do tenant. Sem tenant, o diretório de trabalho, como antes.
+    """
+    if tenant is None:
+        return raiz or os.getcwd()
+    if not _TENANT_VALIDO.match(tenant):
+        raise ValueError(f"Tenant inválido: {tenant!r}")
+    caminho = os.path.join(raiz or os.environ.get(ENV_RAIZ_TENANTS) or os.getcwd(), tenant)
+    if not os.path.isdir(caminho):
+        raise FileNotFoundError(f"Tenant sem diretório de dados: {caminho}")
+    return caminho
+
+
+def memoria_frames(frames):
+    """Memória ocupada (bytes, incluindo objetos Python) por um dict nome → DataFrame."""
+    return int(sum(df.memory_usage(deep=True).sum() for df in frames.values()))
+
+
+def _ler_planilha(data_path, nome):
+    return pd.read_excel(os.path.join(data_path, ARQUIVOS[nome]), decimal="," if nome == "financeiro" else ".")
+
+
+_LOCK_DIMENSOES = threading.Lock()
+
+
+def carregar_tabela(data_path, nome, com_relatorio=False):
+    """
+    Lê e normaliza uma base da planilha: datas do esquema, dimensões canônicas e, em
+    clientes, o gênero. Devolve (df, relatório de qualidade dos valores brutos ou None).
+    """
+    df = _ler_planilha(data_path, nome)
+    relatorio = relatorio_qualidade({nome: df}) if com_relatorio else None
+
+    # Colunas de data do esquema: formato detectado uma vez, só valores distintos convertidos.
+    normalizar_datas(df, [coluna for coluna, regra in ESQUEMAS[nome].items() if regra["tipo"] == "data"])
+
+    # Cidade, canais, categoria e mídia: grafias variantes viram um só valor canônico.
+    caminho_dimensoes = os.path.join(data_path, ARQUIVO_DIMENSOES)
+    with _LOCK_DIMENSOES:
+        dicionario = DicionarioDimensoes.carregar(caminho_dimensoes)
+        aplicar_dimensoes({nome: df}, dicionario)
+        if dicionario.alterado:
+            dicionario.salvar(caminho_dimensoes)
+
+    if nome == "clientes":
+        df = normalizar_genero(df, load_nome_base(data_path))
+    return df, relatorio
+
+
+def load_data(data_path=None, usar_store=True, com_relatorio=False, tenant=None):
+    """
+    Carrega e normaliza as cinco bases. Com `com_relatorio=True` devolve também o
+    relatório de qualidade calculado sobre os valores brutos (antes da coerção);
+    bases anexadas do store Arrow já foram validadas pelo carregador e vêm sem relatório.
+    Com `tenant`, lê do diretório do tenant (ver `resolver_raiz`) e do seu subdiretório no store.
+    """
+    raiz_store = os.environ.get(ENV_ARROW_STORE)
+    if usar_store and raiz_store:
+        import arrow_store
+
+        if tenant is not None:
+            raiz_store = os.path.join(raiz_store, tenant)
+        _, frames = arrow_store.anexar(raiz_store, TABELAS)
+        if frames is not None:
+            resultado = tuple(frames[nome] for nome in TABELAS)
+            return (resultado, None) if com_relatorio else resultado
+
+    data_path = data_path or resolver_raiz(tenant)
+    frames, relatorios = {}, []
+    for nome in TABELAS:
+        frames[nome], relatorio = carregar_tabela(data_path, nome, com_relatorio)
+        relatorios.append(relatorio)
+
+    resultado = tuple(frames[nome] for nome in TABELAS)
+    return (resultado, pd.concat(relatorios, ignore_index=True)) if com_relatorio else resultado
+
+
+# ==========================================================================================
+#  CARGA SOB DEMANDA
+# ==========================================================================================
+# Cada página declara o que usa de cada base (REQUISITOS = {base: Requisito}): as colunas
+# e a coluna de data que recebe o filtro de período. O atualizador (refresher.Dataset)
+# carrega só as bases pedidas, quando alguma página as pede pela primeira vez.
+# A planilha é lida uma vez e a base normalizada vai para o cache colunar (Arrow IPC
+# em DIR_COLUNAR, válido enquanto mtime e tamanho da planilha forem os mesmos); as
+# leituras seguintes (outras colunas, outro processo, recarga) mapeiam o arquivo e
+# aplicam a projeção de colunas e o filtro de período no Arrow, antes do pandas.
+
+DIR_COLUNAR = ".ecomove_colunar"
+
+# colunas: lista (None = todas); data: coluna filtrada pelo período (None = base sem filtro).
+Requisito = namedtuple("Requisito", ["colunas", "data"], defaults=(None, None))
+# Intervalo semiaberto [inicio, fim).
+Periodo = namedtuple("Periodo", ["inicio", "fim"])
+
+
+def periodo_de_texto(de=None, ate=None):
+    """Periodo das datas "AAAA-MM-DD" `de` e `ate` (inclusivas); None quando nenhuma é informada."""
+    if not de and not ate:
+        return None
+    inicio = pd.Timestamp(de) if de else pd.Timestamp.min
+    fim = pd.Timestamp(ate) + pd.Timedelta(days=1) if ate else pd.Timestamp.max
+    if inicio >= fim:
+        raise ValueError(f"Período vazio: {de} a {ate}")
+    return Periodo(inicio, fim)
+
+
+def combinar_requisitos(*conjuntos):
+    """União de dicionários base → Requisito (colunas somadas; None absorve as listas)."""
+    combinados = {}
+    for requisitos in conjuntos:
+        for nome, requisito in requisitos.items():
+            atual = combinados.get(nome)
+            if atual is None:
+                combinados[nome] = requisito
+                continue
+            if atual.colunas is None or requisito.colunas is None:
+                colunas = None
+            else:
+                colunas = list(dict.fromkeys([*atual.colunas, *requisito.colunas]))
+            combinados[nome] = Requisito(colunas, atual.data or requisito.data)
+    return combinados
+
+
+def recortar(df, colunas=None, filtro=None):
+    """`df` só com `colunas` (as presentes) e, com `filtro` = (coluna, inicio, fim), as linhas no intervalo."""
+    if filtro is not None and filtro[0] in df.columns:
+        coluna, inicio, fim = filtro
+        df = df[((df[coluna] >= inicio) & (df[coluna] < fim)).to_numpy()].reset_index(drop=True)
+    if colunas is not None:
+        df = df[[c for c in colunas if c in df.columns]]
+    return df
+
+
+def _assinatura_planilha(data_path, nome):
+    estado = os.stat(os.path.join(data_path, ARQUIVOS[nome]))
+    return [estado.st_mtime_ns, estado.st_size]
+
+
+def ler_tabela(data_path, nome, colunas=None, filtro=None, usar_store=True, tenant=None, versao_store=None):
+    """
+    Base `nome` normalizada, só com `colunas` e as linhas de `filtro` (ver `recortar`).
+    Fontes, nesta ordem: store Arrow publicado (ENV_ARROW_STORE; `versao_store` fixa a
+    versão lida), cache colunar de `data_path` e a planilha (que atualiza o cache).
+    Devolve (df, relatório de qualidade ou None); o relatório da planilha fica
+    guardado junto com o cache colunar.
+    """
+    raiz_store = os.environ.get(ENV_ARROW_STORE)
+    if usar_store and raiz_store:
+        import arrow_store
+
+        if tenant is not None:
+            raiz_store = os.path.join(raiz_store, tenant)
+        df = arrow_store.anexar_tabela(raiz_store, nome, colunas, filtro, versao_store)
+        if df is not None:
+            return df, None
+
+    data_path = data_path or resolver_raiz(tenant)
+    try:
+        import arrow_store
+    except ImportError:
+        # Sem pyarrow não há cache colunar: cada carga lê a planilha.
+        df, relatorio = carregar_tabela(data_path, nome, com_relatorio=True)
+        return recortar(df, colunas, filtro), relatorio
+
+    caminho = os.path.join(data_path, DIR_COLUNAR, f"{nome}.arrow")
+    assinatura = _assinatura_planilha(data_path, nome)
+    metadados = arrow_store.ler_metadados(caminho)
+    if metadados is not None and metadados.get("ecomove_assinatura") == assinatura:
+        relatorio = pd.DataFrame(metadados["ecomove_qualidade"])
+        return arrow_store.ler_ipc(caminho, colunas, filtro), relatorio
+
+    df, relatorio = carregar_tabela(data_path, nome, com_relatorio=True)
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        arrow_store.gravar_tabela(df, caminho, {
+            "ecomove_assinatura": assinatura,
+            "ecomove_qualidade": relatorio.to_dict(orient="list"),
+        })
+    except Exception as e:
+        # Coluna que o Arrow não converte (tipos misturados) ou disco cheio: segue sem cache.
+        print(f"⚠ Cache colunar de {nome} não gravado:", e)
+    return recortar(df, colunas, filtro), relatorio
+
+
+# ==========================================================================================
+#  CONSOLIDAÇÃO FINANCEIRA
+# ==========================================================================================
+# O financeiro traz várias linhas por mês; linhas com os mesmos valores são
+# lançamentos legítimos e todas entram nas somas. Só com CHAVE_FINANCEIRO
+# definida (colunas que identificam o lançamento) as linhas que repetem a chave
+# são descartadas, contadas e registradas no log. Trimestre e acumulado no ano
+# saem das somas mensais; a margem é ponderada pela receita bruta.
+
+COLUNAS_FINANCEIRAS = ["Receita_Bruta", "Despesas_Operacionais", "Lucro_Líquido"]
+# Colunas que identificam um lançamento do financeiro. A planilha atual não tem
+# identificador, então nenhuma linha é descartada.
+CHAVE_FINANCEIRO = None
+
+
+def linhas_financeiras(df_financeiro, chave=None):
+    """
+    Financeiro com Mês no primeiro dia e valores numéricos (nulos = 0). Com `chave`,
+    só a primeira linha de cada chave fica. Devolve (linhas, quantas foram descartadas).
+    """
+    descartadas = 0
+    if chave:
+        repetidas = df_financeiro.duplicated(subset=chave, keep="first").to_numpy()
+        descartadas = int(repetidas.sum())
+        if descartadas:
+            print(f"⚠ Financeiro: {descartadas} linha(s) com chave {chave} repetida descartada(s)")
+            df_financeiro = df_financeiro[~repetidas]
+    mes = converter_datas(df_financeiro["Mês"])
+    linhas = pd.DataFrame({"Mês": mes.dt.to_period("M").dt.to_timestamp()})
+    for coluna in [*COLUNAS_FINANCEIRAS, "Margem (%)"]:
+        linhas[coluna] = pd.to_numeric(df_financeiro[coluna], errors="coerce").fillna(0).to_numpy(dtype=float)
+    return linhas[linhas["Mês"].notna()].reset_index(drop=True), descartadas
+
+
+def _margem(soma_ponderada, receita):
+    """Margem (%) média ponderada pela receita; NaN quando a receita do grupo é zero."""
+    return (soma_ponderada / receita.where(receita != 0)).astype(float)
+
+
+class ConsolidacaoFinanceira:
+    """Somas mensais do financeiro, com trimestre, acumulado no ano e totais."""
+
+    def __init__(self):
+        self.duplicadas = 0
+        self._mensal = pd.DataFrame(
+            columns=[*COLUNAS_FINANCEIRAS, "soma_margem_receita", "Linhas"],
+            index=pd.DatetimeIndex([], name="Mês"), dtype=float,
+        )
+
+    def atualizar(self, linhas):
+        """Soma as `linhas` (ver linhas_financeiras) às somas mensais; devolve quantas entraram."""
+        if linhas.empty:
+            return 0
+        lote = linhas.assign(
+            soma_margem_receita=linhas["Margem (%)"] * linhas["Receita_Bruta"], Linhas=1.0,
+        ).drop(columns="Margem (%)")
+        por_mes = lote.groupby("Mês").sum()
+        self._mensal = self._mensal.add(por_mes, fill_value=0).sort_index()
+        return len(linhas)
+
+    @staticmethod
+    def _com_margem(somas):
+        tabela = somas[COLUNAS_FINANCEIRAS].copy()
+        tabela["Margem (%)"] = _margem(somas["soma_margem_receita"], somas["Receita_Bruta"])
+        tabela["Linhas"] = somas["Linhas"].astype(int)
+        return tabela
+
+    @property
+    def mensal(self):
+        """Uma linha por mês: somas, margem ponderada e número de linhas."""
+        return self._com_margem(self._mensal).reset_index()
+
+    @property
+    def trimestral(self):
+        trimestre = self._mensal.index.to_period("Q").to_timestamp().rename("Trimestre")
+        return self._com_margem(self._mensal.groupby(trimestre).sum()).reset_index()
+
+    @property
+    def acumulado_ano(self):
+        """Somas acumuladas de janeiro até cada mês (YTD), com a margem ponderada do acumulado."""
+        acumulado = self._mensal.groupby(self._mensal.index.year).cumsum()
+        return self._com_margem(acumulado).reset_index()
 
-    df_atendimento['Data_Abertura'] = pd.to_datetime(df_atendimento['Data_Abertura'], errors='coerce')
-    df_clientes['Data_Cadastro'] = pd.to_datetime(df_clientes['Data_Cadastro'], errors='coerce')
-    df_financeiro['Mês'] = pd.to_datetime(df_financeiro['Mês'], errors='coerce')
-    df_marketing['Data_Campanha'] = pd.to_datetime(df_marketing['Data_Campanha'], errors='coerce')
-    df_vendas['Data_Venda'] = pd.to_datetime(df_vendas['Data_Venda'], errors='coerce')
+    @property
+    def totais(self):
+        """Escalares do período inteiro (cards de KPI)."""
+        somas = self._mensal.sum()
+        receita = somas["Receita_Bruta"]
+        return {
+            **{coluna: float(somas[coluna]) for coluna in COLUNAS_FINANCEIRAS},
+            "Margem (%)": float(somas["soma_margem_receita"] / receita) if receita else np.nan,
+            "Linhas": int(somas["Linhas"]),
+            "Duplicadas": self.duplicadas,
+        }
 
-    mapa_nomes = load_nome_base(data_path)
-    df_clientes = normalizar_genero(df_clientes, mapa_nomes)
 
-    return df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas
+@cache_por_versao()
+def consolidar_financeiro(df_financeiro):
+    """Consolidação do financeiro, calculada uma vez por versão do dataset."""
+    linhas, descartadas = linhas_financeiras(df_financeiro, CHAVE_FINANCEIRO)
+    consolidacao = ConsolidacaoFinanceira()
+    consolidacao.atualizar(linhas)
+    consolidacao.duplicadas = descartadas
+    return consolidacao
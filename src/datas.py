@@ -0,0 +1,118 @@
+"""
+Normalização de colunas de datas.
+
+O formato é detectado uma vez por coluna numa amostra dos valores distintos
+(dd/mm/aaaa, ISO, número de série do Excel...); só os valores distintos são
+convertidos e o resultado é espalhado pelos códigos do factorize, então uma
+coluna com milhões de linhas e poucos milhares de datas custa o factorize.
+
+Uma coluna convertida fica com dtype datetime64, que é a própria marca de
+"já normalizada": `converter_datas` devolve colunas datetime sem trabalho
+algum, então as páginas podem chamá-lo sobre as bases já carregadas.
+"""
+import numpy as np
+import pandas as pd
+
+FORMATOS_CANDIDATOS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d-%m-%Y",
+    "%Y/%m/%d",
+    "%d.%m.%Y",
+]
+EXCEL = "excel"
+# Números de série do Excel: dias desde 1899-12-30 (1 = 1900-01-01, 2958465 = 9999-12-31).
+ORIGEM_EXCEL = pd.Timestamp("1899-12-30")
+SERIE_EXCEL_MIN, SERIE_EXCEL_MAX = 1, 2958465
+TAMANHO_AMOSTRA = 1000
+# Fração mínima da amostra que o formato precisa converter para ser escolhido.
+ACERTO_MINIMO = 0.9
+
+
+def _serie_excel(valores):
+    numeros = pd.to_numeric(pd.Series(valores), errors="coerce")
+    fora = (numeros < SERIE_EXCEL_MIN) | (numeros > SERIE_EXCEL_MAX)
+    return pd.to_datetime(numeros.mask(fora), unit="D", origin=ORIGEM_EXCEL)
+
+
+def detectar_formato(valores):
+    """
+    Formato (strftime ou "excel") que converte a maior parte de uma amostra dos
+    valores distintos; None quando nenhum chega a ACERTO_MINIMO.
+    """
+    amostra = pd.Series(valores).dropna()
+    amostra = amostra[:TAMANHO_AMOSTRA]
+    if amostra.empty:
+        return None
+    if pd.api.types.is_numeric_dtype(amostra):
+        return EXCEL if amostra.between(SERIE_EXCEL_MIN, SERIE_EXCEL_MAX).mean() >= ACERTO_MINIMO else None
+
+    texto = amostra.astype(str).str.strip()
+    melhor, acerto_melhor = None, 0.0
+    for formato in FORMATOS_CANDIDATOS:
+        acerto = pd.to_datetime(texto, format=formato, errors="coerce").notna().mean()
+        if acerto > acerto_melhor:
+            melhor, acerto_melhor = formato, acerto
+        if acerto == 1.0:
+            break
+    if acerto_melhor < ACERTO_MINIMO and _serie_excel(texto).notna().mean() >= ACERTO_MINIMO:
+        return EXCEL
+    return melhor if acerto_melhor >= ACERTO_MINIMO else None
+
+
+def _converter_unicos(unicos, formato):
+    if formato == EXCEL:
+        convertidos = _serie_excel(unicos)
+    elif formato is not None:
+        convertidos = pd.to_datetime(pd.Series(unicos).astype(str).str.strip(), format=formato, errors="coerce")
+    else:
+        convertidos = pd.Series(pd.NaT, index=range(len(unicos)), dtype="datetime64[ns]")
+    # Valores fora do formato detectado (datetime do Excel misturado com texto, etc.)
+    # seguem a inferência padrão do pandas, como antes.
+    faltando = convertidos.isna().to_numpy()
+    if faltando.any():
+        convertidos = convertidos.copy()
+        convertidos[faltando] = pd.to_datetime(pd.Series(unicos)[faltando], errors="coerce").to_numpy()
+    return convertidos.to_numpy(dtype="datetime64[ns]")
+
+
+def _converter(serie, formato):
+    codigos, unicos = pd.factorize(serie)
+    if formato is None:
+        formato = detectar_formato(unicos)
+    convertidos = _converter_unicos(unicos, formato)
+    valores = np.full(len(codigos), np.datetime64("NaT"), dtype="datetime64[ns]")
+    validos = codigos >= 0
+    valores[validos] = convertidos[codigos[validos]]
+    return pd.Series(valores, index=serie.index, name=serie.name), formato
+
+
+def converter_datas(serie, formato=None):
+    """
+    Converte `serie` em datetime64 (NaT no que não converte), só nos valores distintos.
+    O formato é `formato` ou o de `detectar_formato`, e os formatos com barra são
+    sempre dia primeiro: "03/04/2024" vira 3 de abril, onde pd.to_datetime leria
+    4 de março. Só os valores fora do formato detectado passam pela inferência do
+    pandas (mês primeiro). Colunas já datetime64 voltam sem cópia.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return _converter(serie, formato)[0]
+
+
+def normalizar_datas(df, colunas):
+    """
+    Converte as colunas de `df` no lugar e registra em df.attrs["formatos_datas"]
+    o formato detectado em cada uma (None = inferência do pandas).
+    """
+    formatos = df.attrs.setdefault("formatos_datas", {})
+    for coluna in colunas:
+        if coluna not in df.columns:
+            continue
+        if pd.api.types.is_datetime64_any_dtype(df[coluna]):
+            formatos.setdefault(coluna, "datetime64")
+            continue
+        df[coluna], formatos[coluna] = _converter(df[coluna], None)
+    return df
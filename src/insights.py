@@ -0,0 +1,108 @@
+"""
+Motor de insights automáticos baseado em regras declarativas.
+
+As regras são avaliadas sobre uma tabela de estatísticas já agregada (uma
+linha por grupo: mídia, motivo, canal, campanha...), então gerar os textos
+custa O(grupos) e não faz novas varreduras nos dados brutos.
+
+Cada regra é um dict com "tipo", "metrica", "texto" e parâmetros do tipo:
+    melhor / pior            grupo com maior / menor valor da métrica
+    acima_limite             fração dos grupos com métrica acima de "limite"
+                             (só dispara com pelo menos "min_grupos" acima, padrão 0)
+    abaixo_referencia        grupos com métrica abaixo de "referencia"
+    outliers_mediana         grupos a mais de "fator" × MAD da mediana dos grupos
+    condicoes                grupos que atendem todas as "condicoes" [(coluna, op, valor)],
+                             onde valor pode ser "mediana" (mediana da coluna)
+O "texto" é formatado com {grupo}, {valor}, {grupos}, {n}, {total} e {pct}.
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+
+_OPERADORES = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq}
+
+
+def estatisticas_por_grupo(df, grupo, metricas):
+    """Tabela de estatísticas num único groupby; `metricas` = {nome: (coluna, função)}."""
+    return df.groupby(grupo, observed=True).agg(**metricas)
+
+
+def _lista(grupos, max_itens):
+    grupos = [str(g) for g in grupos]
+    return ", ".join(grupos[:max_itens]) if max_itens else ", ".join(grupos)
+
+
+def _extremo(estatisticas, regra, maior):
+    valores = estatisticas[regra["metrica"]].dropna()
+    if valores.empty:
+        return None
+    grupo = valores.idxmax() if maior else valores.idxmin()
+    return {"grupo": grupo, "valor": valores[grupo]}
+
+
+def _acima_limite(estatisticas, regra):
+    valores = estatisticas[regra["metrica"]].dropna()
+    if valores.empty:
+        return None
+    acima = valores > regra["limite"]
+    if acima.sum() < regra.get("min_grupos", 0):
+        return None
+    return {"n": int(acima.sum()), "total": len(valores), "pct": acima.mean() * 100}
+
+
+def _selecionados(grupos, regra):
+    if len(grupos) == 0:
+        return None
+    return {"grupos": _lista(grupos, regra.get("max_itens")), "n": len(grupos)}
+
+
+def _abaixo_referencia(estatisticas, regra):
+    referencia = regra["referencia"]
+    if referencia is None or pd.isna(referencia):
+        return None
+    valores = estatisticas[regra["metrica"]]
+    return _selecionados(valores.index[valores < referencia], regra)
+
+
+def _outliers_mediana(estatisticas, regra):
+    valores = estatisticas[regra["metrica"]].dropna()
+    if len(valores) < 3:
+        return None
+    mediana = valores.median()
+    mad = (valores - mediana).abs().median()
+    if mad == 0 or pd.isna(mad):
+        return None
+    desvio = (valores - mediana).abs() / mad
+    return _selecionados(valores.index[desvio > regra.get("fator", 3.0)], regra)
+
+
+def _condicoes(estatisticas, regra):
+    mascara = np.ones(len(estatisticas), dtype=bool)
+    for coluna, op, valor in regra["condicoes"]:
+        if valor == "mediana":
+            valor = estatisticas[coluna].median()
+        mascara &= _OPERADORES[op](estatisticas[coluna], valor).to_numpy()
+    return _selecionados(estatisticas.index[mascara], regra)
+
+
+_AVALIADORES = {
+    "melhor": lambda e, r: _extremo(e, r, maior=True),
+    "pior": lambda e, r: _extremo(e, r, maior=False),
+    "acima_limite": _acima_limite,
+    "abaixo_referencia": _abaixo_referencia,
+    "outliers_mediana": _outliers_mediana,
+    "condicoes": _condicoes,
+}
+
+
+def avaliar_regras(estatisticas, regras):
+    """Avalia as regras em ordem e devolve os textos das que dispararam."""
+    textos = []
+    if estatisticas is None or estatisticas.empty:
+        return textos
+    for regra in regras:
+        resultado = _AVALIADORES[regra["tipo"]](estatisticas, regra)
+        if resultado is not None:
+            textos.append(regra["texto"].format(**resultado))
+    return textos
@@ -1,8 +1,14 @@
 import streamlit.web.bootstrap
 streamlit.web.bootstrap._is_running_with_streamlit = lambda: False
 
+import os
+import time
+
 import streamlit as st
-from data_handler import load_data
+import anomalias
+import perfilador
+from refresher import CacheTenants, DatasetDesatualizado
+from data_handler import TABELAS, combinar_requisitos, periodo_de_texto
 from app_pages import visaogeral, vendasproduto, marketing, atendimento, clientes
 
 st.set_page_config(
@@ -13,7 +19,44 @@ st.set_page_config(
 st.sidebar.title("Navegação")
 st.sidebar.markdown("Selecione uma página abaixo:")
 
-df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas = load_data()
+
+# Bases e colunas de cada página: só elas são carregadas (ver data_handler, CARGA SOB DEMANDA).
+REQUISITOS_PAGINAS = {
+    "Visão Geral": visaogeral.REQUISITOS,
+    "Vendas & Produto": vendasproduto.REQUISITOS,
+    "Marketing": marketing.REQUISITOS,
+    "Atendimento": atendimento.REQUISITOS,
+    "Análise de Clientes": clientes.REQUISITOS,
+}
+
+# Limite de memória (MB) somado dos datasets de todos os tenants carregados no processo.
+LIMITE_CACHE_TENANTS_MB = float(os.environ.get("ECOMOVE_TENANTS_CACHE_MB", "2048"))
+# Pré-carga opt-in (ECOMOVE_PRECARGA=1): cada tenant, ao entrar, lê em segundo plano as bases
+# de todas as páginas e os alertas. Desligada, só o que as páginas pedem é carregado.
+PRECARGA_COMPLETA = os.environ.get("ECOMOVE_PRECARGA", "").lower() in ("1", "true", "sim", "yes")
+
+
+@st.cache_resource
+def get_cache_tenants():
+    if not PRECARGA_COMPLETA:
+        return CacheTenants(int(LIMITE_CACHE_TENANTS_MB * 1024 * 1024))
+    return CacheTenants(
+        int(LIMITE_CACHE_TENANTS_MB * 1024 * 1024),
+        precarga=combinar_requisitos(*REQUISITOS_PAGINAS.values()),
+        alertas_na_precarga=True,
+    )
+
+
+# Tenant pela URL (?tenant=<id>); sem parâmetro, as bases do diretório de trabalho.
+tenant = st.query_params.get("tenant")
+try:
+    atualizador = get_cache_tenants().obter(tenant)
+except (ValueError, FileNotFoundError) as e:
+    st.error(f"Não foi possível carregar os dados do tenant: {e}")
+    st.stop()
+
+# Uma única referência por rerun: recargas em segundo plano não afetam a renderização em curso.
+dataset = atualizador.snapshot()
 
 page = st.sidebar.selectbox(
     "Escolha o Dashboard",
@@ -26,13 +69,78 @@ page = st.sidebar.selectbox(
     ],
 )
 
-if page == "Visão Geral":
-    visaogeral.app(df_atendimento, df_clientes, df_financeiro, df_marketing, df_vendas)
-elif page == "Vendas & Produto":
-    vendasproduto.app(df_vendas)
-elif page == "Marketing":
-    marketing.app(df_marketing, df_financeiro)
-elif page == "Atendimento":
-    atendimento.app(df_atendimento)
-elif page == "Análise de Clientes":
-    clientes.app(df_clientes)
+
+# Período pela URL (?de=AAAA-MM-DD&ate=AAAA-MM-DD, inclusivas); sem parâmetros, todo o histórico.
+try:
+    periodo = periodo_de_texto(st.query_params.get("de"), st.query_params.get("ate"))
+except ValueError as e:
+    st.error(f"Período inválido na URL: {e}")
+    periodo = None
+
+
+def trocar_versao():
+    # A fonte mudou depois deste snapshot: publica a versão nova agora e refaz o rerun com ela.
+    atualizador.atualizar()
+    st.rerun()
+
+
+try:
+    frames = dataset.tabelas(REQUISITOS_PAGINAS[page], periodo)
+except DatasetDesatualizado:
+    trocar_versao()
+
+idade_min = (time.time() - dataset.carregado_em) / 60
+st.sidebar.caption(
+    (f"Tenant: {tenant} • " if tenant else "")
+    + f"Dados: versão {dataset.versao} • atualizados há {idade_min:.0f} min"
+    + (f" • {len(dataset.agregados)} agregados pré-compilados" if dataset.agregados else "")
+    + f" • {len(dataset.carregadas)} de {len(TABELAS)} bases em memória"
+)
+if periodo is not None:
+    st.sidebar.caption(
+        f"Período: {st.query_params.get('de') or 'início'} a {st.query_params.get('ate') or 'hoje'}"
+    )
+cache = get_cache_tenants().metricas()
+st.sidebar.caption(
+    f"Cache de tenants: {cache['tenants']} carregado(s) • {cache['memoria_bytes'] / 2**20:.0f} de "
+    f"{cache['limite_bytes'] / 2**20:.0f} MB • {cache['acertos']} acertos • {cache['despejos']} despejos"
+)
+
+qualidade = dataset.qualidade
+if qualidade is not None:
+    problemas = qualidade[~qualidade["ok"]]
+    with st.sidebar.expander(f"Qualidade dos dados ({len(problemas)} colunas com alertas)"):
+        if problemas.empty:
+            st.write("Nenhum problema encontrado.")
+        else:
+            st.dataframe(problemas.drop(columns=["ok"]), hide_index=True)
+
+
+def renderizar_pagina(page):
+    if page == "Visão Geral":
+        visaogeral.app(
+            frames["atendimento"], frames["clientes"], frames["financeiro"], frames["marketing"], frames["vendas"],
+            lambda: dataset.alertas,
+        )
+    elif page == "Vendas & Produto":
+        vendasproduto.app(frames["vendas"])
+    elif page == "Marketing":
+        # Só o KPI de ROAS: a página não lê vendas nem atendimento para montar os alertas.
+        marketing.app(frames["marketing"], frames.get("financeiro"), lambda: dataset.alertas_de([anomalias.KPI_ROAS]))
+    elif page == "Atendimento":
+        atendimento.app(frames["atendimento"])
+    elif page == "Análise de Clientes":
+        clientes.app(frames["clientes"], frames["vendas"])
+
+
+# Profiling opt-in (ECOMOVE_PROFILE=1 ou ?profile=1); desligado, a página roda sem nenhum coletor.
+try:
+    if perfilador.ativo(st.query_params):
+        with perfilador.perfilar(page) as relatorio:
+            renderizar_pagina(page)
+        perfilador.mostrar_resumo(relatorio)
+    else:
+        renderizar_pagina(page)
+except DatasetDesatualizado:
+    # Bases lidas sob demanda no meio da página (ex.: a varredura de anomalias).
+    trocar_versao()
@@ -0,0 +1,150 @@
+"""
+Matrizes de contingência 2-D sobre dimensões codificadas em inteiros.
+
+As dimensões são fatoradas uma vez (datas viram códigos de mês inteiros, sem
+passar por strings) e as células são acumuladas com np.bincount em tempo
+linear. Quando a maior parte das células fica vazia o resultado é guardado
+em formato esparso (scipy.sparse).
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Acima deste número de células a acumulação é feita direto em formato esparso.
+CELULAS_MAX_DENSA = 10_000_000
+# Abaixo desta fração de células preenchidas o resultado é convertido para esparso.
+DENSIDADE_ESPARSA = 0.1
+
+
+NS_POR_DIA = 86_400_000_000_000
+# Faixas de até este número de dias convertem dia → mês por tabela de lookup.
+DIAS_MAX_LOOKUP = 1_000_000
+
+
+def meses_inteiros(serie):
+    """Meses desde 1970-01 como int64 e máscara de datas nulas."""
+    datas = serie.to_numpy(dtype="datetime64[ns]")
+    nulos = np.isnat(datas)
+    if nulos.all():
+        return np.zeros(len(datas), dtype=np.int64), nulos
+
+    # A conversão de calendário datetime64[D] → [M] é cara; faz-se uma vez por dia
+    # distinto da faixa e o resultado é espalhado por indexação.
+    dias = datas.view(np.int64) // NS_POR_DIA
+    primeiro, ultimo = dias[~nulos].min(), dias[~nulos].max()
+    if ultimo - primeiro >= DIAS_MAX_LOOKUP:
+        return datas.astype("datetime64[M]").astype(np.int64), nulos
+    tabela = np.arange(primeiro, ultimo + 1).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return tabela[np.clip(dias - primeiro, 0, len(tabela) - 1)], nulos
+
+
+def rotulos_meses(meses):
+    """Converte meses inteiros (desde 1970-01) em DatetimeIndex do primeiro dia do mês."""
+    return pd.DatetimeIndex(np.asarray(meses).astype("datetime64[M]").astype("datetime64[ns]"))
+
+
+def codificar(serie, freq=None):
+    """
+    Fatora uma coluna em (códigos int64, rótulos ordenados); nulos recebem -1.
+    Com freq="M" (ou "Q") e coluna de datas, o código é o mês (trimestre) inteiro;
+    com freq="D", o dia.
+    """
+    if freq == "D" and pd.api.types.is_datetime64_any_dtype(serie):
+        datas = serie.to_numpy(dtype="datetime64[ns]")
+        nulos = np.isnat(datas)
+        unicos, codigos = np.unique(datas.view(np.int64)[~nulos] // NS_POR_DIA, return_inverse=True)
+        todos = np.full(len(datas), -1, dtype=np.int64)
+        todos[~nulos] = codigos
+        return todos, pd.DatetimeIndex(unicos.astype("datetime64[D]").astype("datetime64[ns]"))
+
+    if freq is not None and pd.api.types.is_datetime64_any_dtype(serie):
+        meses, nulos = meses_inteiros(serie)
+        if freq == "Q":
+            meses = meses - meses % 3
+        unicos, codigos = np.unique(meses[~nulos], return_inverse=True)
+        todos = np.full(len(meses), -1, dtype=np.int64)
+        todos[~nulos] = codigos
+        return todos, rotulos_meses(unicos)
+
+    codigos, rotulos = pd.factorize(serie, sort=True)
+    return codigos.astype(np.int64), pd.Index(rotulos)
+
+
+class Matriz:
+    """Contagem, soma e contagem de valores válidos por célula (linha × coluna)."""
+
+    def __init__(self, linhas, colunas, contagem, soma=None, contagem_valores=None):
+        self.linhas = linhas
+        self.colunas = colunas
+        self.contagem = contagem
+        self.soma = soma
+        self.contagem_valores = contagem_valores
+
+    @property
+    def esparsa(self):
+        return sparse.issparse(self.contagem)
+
+    def _denso(self, m):
+        return m.toarray() if sparse.issparse(m) else m
+
+    def valores(self, estatistica="contagem"):
+        """Matriz densa de 'contagem', 'soma' ou 'media' (células sem dados = NaN na média)."""
+        if estatistica == "contagem":
+            return self._denso(self.contagem)
+        if estatistica == "soma":
+            return self._denso(self.soma)
+        if estatistica == "media":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return self._denso(self.soma) / self._denso(self.contagem_valores)
+        raise ValueError(f"Estatística desconhecida: {estatistica}")
+
+    def para_frame(self, estatistica="contagem", preencher=None):
+        df = pd.DataFrame(self.valores(estatistica), index=self.linhas, columns=self.colunas)
+        return df.fillna(preencher) if preencher is not None else df
+
+
+def _acumular(idx_linha, idx_coluna, forma, pesos):
+    n_celulas = forma[0] * forma[1]
+    if n_celulas > CELULAS_MAX_DENSA:
+        # coo → csr soma entradas repetidas sem alocar a matriz cheia.
+        return sparse.coo_matrix((pesos, (idx_linha, idx_coluna)), shape=forma).tocsr()
+    plano = np.bincount(idx_linha * forma[1] + idx_coluna, weights=pesos, minlength=n_celulas)
+    return plano.reshape(forma)
+
+
+def matriz_contingencia(codigos_linha, rotulos_linha, codigos_coluna, rotulos_coluna, valores=None, esparsa="auto"):
+    """
+    Acumula a matriz rótulos_linha × rótulos_coluna a partir dos códigos de cada linha.
+    `valores` (opcional) gera soma e contagem de válidos para médias; NaN é ignorado.
+    esparsa: True, False ou "auto" (decide pela densidade).
+    """
+    validos = (codigos_linha >= 0) & (codigos_coluna >= 0)
+    cl, cc = codigos_linha[validos], codigos_coluna[validos]
+    forma = (len(rotulos_linha), len(rotulos_coluna))
+
+    contagem = _acumular(cl, cc, forma, np.ones(cl.size))
+    soma = contagem_valores = None
+    if valores is not None:
+        v = np.asarray(valores, dtype=float)[validos]
+        finitos = np.isfinite(v)
+        soma = _acumular(cl[finitos], cc[finitos], forma, v[finitos])
+        contagem_valores = _acumular(cl[finitos], cc[finitos], forma, np.ones(int(finitos.sum())))
+
+    if esparsa == "auto":
+        total = max(forma[0] * forma[1], 1)
+        nnz = contagem.nnz if sparse.issparse(contagem) else np.count_nonzero(contagem)
+        esparsa = nnz / total < DENSIDADE_ESPARSA
+    converter = sparse.csr_matrix if esparsa else (lambda m: m.toarray() if sparse.issparse(m) else m)
+    contagem, soma, contagem_valores = (
+        converter(m) if m is not None else None for m in (contagem, soma, contagem_valores)
+    )
+
+    return Matriz(rotulos_linha, rotulos_coluna, contagem, soma, contagem_valores)
+
+
+def contingencia(df, linha, coluna, valor=None, freq_linha=None, freq_coluna=None, esparsa="auto"):
+    """Atalho: codifica as colunas `linha` e `coluna` de df e monta a matriz."""
+    cl, rl = codificar(df[linha], freq_linha)
+    cc, rc = codificar(df[coluna], freq_coluna)
+    valores = pd.to_numeric(df[valor], errors="coerce").to_numpy(dtype=float) if valor is not None else None
+    return matriz_contingencia(cl, rl, cc, rc, valores, esparsa)
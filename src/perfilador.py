@@ -0,0 +1,224 @@
+"""
+Modo de profiling de uma renderização de página (opt-in).
+
+Ativado por ECOMOVE_PROFILE=1 ou pelo parâmetro ?profile=1. A renderização é
+envolvida por três coletores:
+    - amostrador de pilhas (sys._current_frames) da thread do script e das
+      threads de seções (renderizacao.py) que estiverem executando cálculos;
+    - cProfile na thread do script (chamadas e tempo por função);
+    - tracemalloc (pico de memória e linhas que mais alocaram).
+Os resultados vão para ECOMOVE_PROFILE_DIR (padrão .ecomove_profiles/) como
+pilhas colapsadas (flamegraph.pl / speedscope), JSON do speedscope e pstats,
+e um resumo aparece na própria página.
+
+Desligado, nenhum coletor é criado: a página roda exatamente como sem o módulo.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+ENV_PROFILE = "ECOMOVE_PROFILE"
+ENV_DIR_PROFILE = "ECOMOVE_PROFILE_DIR"
+DIR_PADRAO = ".ecomove_profiles"
+INTERVALO_AMOSTRAS = 0.005
+PREFIXO_THREADS_SECOES = "ecomove-secao"
+
+_DIR_FONTES = os.path.dirname(os.path.abspath(__file__))
+
+
+def ativo(query_params=None):
+    """Modo ligado pela variável de ambiente ou por ?profile=1."""
+    if os.environ.get(ENV_PROFILE, "").lower() in ("1", "true", "sim", "yes"):
+        return True
+    return query_params is not None and query_params.get("profile") in ("1", "true")
+
+
+def _rotulo(codigo):
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+def _pilha(frame):
+    """Pilha raiz → folha a partir do primeiro frame do próprio app (sem o runner do Streamlit)."""
+    codigos = []
+    while frame is not None:
+        codigos.append(frame.f_code)
+        frame = frame.f_back
+    codigos.reverse()
+    for i, codigo in enumerate(codigos):
+        if os.path.abspath(codigo.co_filename).startswith(_DIR_FONTES):
+            return codigos[i:]
+    return codigos
+
+
+def _executando_tarefa(frame):
+    # Threads do pool ociosas ficam presas em queue.get; só interessam as que estão num _WorkItem.run.
+    while frame is not None:
+        if frame.f_code.co_name == "run" and frame.f_code.co_filename.endswith(os.path.join("futures", "thread.py")):
+            return True
+        frame = frame.f_back
+    return False
+
+
+class AmostradorPilhas(threading.Thread):
+    """Amostra periodicamente as pilhas da thread alvo e das threads de seções."""
+
+    def __init__(self, thread_alvo, intervalo=INTERVALO_AMOSTRAS):
+        super().__init__(name="ecomove-perfilador", daemon=True)
+        self.thread_alvo = thread_alvo
+        self.intervalo = intervalo
+        self.amostras = Counter()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                nome = nomes.get(ident, "")
+                if ident == self.thread_alvo:
+                    self.amostras[(nome,) + tuple(_pilha(frame))] += 1
+                elif nome.startswith(PREFIXO_THREADS_SECOES) and _executando_tarefa(frame):
+                    self.amostras[(nome,) + tuple(_pilha(frame))] += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+    def colapsadas(self):
+        """Linhas 'thread;f1;f2;... contagem' (formato do flamegraph.pl)."""
+        linhas = []
+        for (thread, *codigos), contagem in self.amostras.most_common():
+            quadros = [thread] + [_rotulo(c) for c in codigos]
+            linhas.append(";".join(q.replace(";", ",") for q in quadros) + f" {contagem}")
+        return "\n".join(linhas) + "\n"
+
+    def speedscope(self, nome):
+        """Perfil 'sampled' no formato de arquivo do speedscope."""
+        quadros, indices = [], {}
+        amostras, pesos = [], []
+        for (thread, *codigos), contagem in self.amostras.items():
+            pilha = []
+            for chave in [("thread", thread, 0)] + [(c.co_name, c.co_filename, c.co_firstlineno) for c in codigos]:
+                if chave not in indices:
+                    indices[chave] = len(quadros)
+                    quadros.append({"name": chave[0] if chave[0] != "thread" else f"[{chave[1]}]",
+                                    "file": chave[1], "line": chave[2]})
+                pilha.append(indices[chave])
+            amostras.append(pilha)
+            pesos.append(contagem * self.intervalo)
+        total = sum(pesos)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": nome,
+            "exporter": "ecomove-perfilador",
+            "shared": {"frames": quadros},
+            "profiles": [{
+                "type": "sampled", "name": nome, "unit": "seconds",
+                "startValue": 0, "endValue": total, "samples": amostras, "weights": pesos,
+            }],
+        }
+
+
+class Relatorio:
+    """Resultados de uma renderização perfilada."""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.duracao = 0.0
+        self.pico_memoria = 0
+        self.funcoes = pd.DataFrame()
+        self.alocacoes = pd.DataFrame()
+        self.arquivos = []
+
+
+def _tabela_funcoes(perfil, limite):
+    linhas = []
+    for (arquivo, linha, funcao), (_, chamadas, proprio, acumulado, _) in pstats.Stats(perfil).stats.items():
+        linhas.append({
+            "Funcao": funcao,
+            "Local": f"{os.path.basename(arquivo)}:{linha}",
+            "Chamadas": chamadas,
+            "Tempo_Proprio_s": proprio,
+            "Tempo_Acumulado_s": acumulado,
+        })
+    tabela = pd.DataFrame(linhas)
+    if tabela.empty:
+        return tabela
+    return tabela.nlargest(limite, "Tempo_Proprio_s").reset_index(drop=True)
+
+
+def _tabela_alocacoes(snapshot, limite):
+    estatisticas = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ]).statistics("lineno")[:limite]
+    return pd.DataFrame([{
+        "Local": f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+        "KB": s.size / 1024,
+        "Blocos": s.count,
+    } for s in estatisticas])
+
+
+def _nome_arquivo(nome):
+    ascii_ = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode()
+    return time.strftime("%Y%m%d-%H%M%S") + "_" + (re.sub(r"[^A-Za-z0-9]+", "_", ascii_).strip("_").lower() or "pagina")
+
+
+@contextmanager
+def perfilar(nome, limite=25):
+    """Perfila o bloco (uma renderização de página) e grava os arquivos ao sair."""
+    relatorio = Relatorio(nome)
+    ja_rastreava = tracemalloc.is_tracing()
+    if not ja_rastreava:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    amostrador = AmostradorPilhas(threading.get_ident())
+    perfil = cProfile.Profile()
+
+    inicio = time.perf_counter()
+    amostrador.start()
+    perfil.enable()
+    try:
+        yield relatorio
+    finally:
+        perfil.disable()
+        amostrador.parar()
+        relatorio.duracao = time.perf_counter() - inicio
+        _, relatorio.pico_memoria = tracemalloc.get_traced_memory()
+        relatorio.alocacoes = _tabela_alocacoes(tracemalloc.take_snapshot(), limite)
+        if not ja_rastreava:
+            tracemalloc.stop()
+        relatorio.funcoes = _tabela_funcoes(perfil, limite)
+
+        destino = os.environ.get(ENV_DIR_PROFILE) or os.path.join(os.getcwd(), DIR_PADRAO)
+        os.makedirs(destino, exist_ok=True)
+        base = os.path.join(destino, _nome_arquivo(nome))
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(amostrador.colapsadas())
+        with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(amostrador.speedscope(nome), f)
+        perfil.dump_stats(base + ".pstats")
+        relatorio.arquivos = [base + ext for ext in (".collapsed", ".speedscope.json", ".pstats")]
+
+
+def mostrar_resumo(relatorio):
+    """Resumo do perfil no fim da página."""
+    st.markdown("---")
+    with st.expander(f"🔬 Profiling: {relatorio.nome} — {relatorio.duracao:.2f}s, "
+                     f"pico de memória {relatorio.pico_memoria / 2**20:.1f} MB", expanded=True):
+        st.markdown("**Funções com maior tempo próprio (cProfile)**")
+        st.dataframe(relatorio.funcoes, hide_index=True, use_container_width=True)
+        st.markdown("**Linhas que mais alocaram (tracemalloc)**")
+        st.dataframe(relatorio.alocacoes, hide_index=True, use_container_width=True)
+        st.caption("Arquivos: " + " • ".join(relatorio.arquivos))
@@ -0,0 +1,84 @@
+"""
+Previsão de séries mensais em lote (tendência linear + sazonalidade mensal).
+
+Todas as séries compartilham a mesma matriz de desenho (intercepto, tendência
+e dummies de mês), então os parâmetros de centenas de séries saem de uma única
+chamada a np.linalg.lstsq com múltiplos lados direitos, sem laço por série.
+"""
+import numpy as np
+import pandas as pd
+
+from matrizes import contingencia, meses_inteiros, rotulos_meses
+
+PERIODO_SAZONAL = 12
+
+
+def series_mensais(df, coluna_data, coluna_valor, coluna_grupo=None):
+    """
+    Matriz séries × meses (soma de `coluna_valor`), com todos os meses do
+    intervalo (meses sem dados = 0). Sem grupo, devolve uma série "Total".
+    """
+    if coluna_grupo is None:
+        df = df.assign(_Grupo="Total")
+        coluna_grupo = "_Grupo"
+    matriz = contingencia(df, coluna_grupo, coluna_data, valor=coluna_valor, freq_coluna="M", esparsa=False)
+    series = matriz.para_frame("soma")
+    if series.shape[1] == 0:
+        return series
+    meses, _ = meses_inteiros(pd.Series(series.columns))
+    todos = rotulos_meses(np.arange(meses.min(), meses.max() + 1))
+    return series.reindex(columns=todos, fill_value=0.0)
+
+
+def _desenho(passos, mes_inicial, sazonal):
+    """Intercepto, tendência e (opcional) 11 dummies de mês para os passos dados."""
+    colunas = [np.ones(len(passos)), passos.astype(float)]
+    if sazonal:
+        mes = (mes_inicial + passos) % PERIODO_SAZONAL
+        colunas += [(mes == m).astype(float) for m in range(1, PERIODO_SAZONAL)]
+    return np.column_stack(colunas)
+
+
+def ajustar_lote(series):
+    """
+    Ajusta todas as linhas de `series` (DataFrame séries × meses contínuos) de uma vez.
+    A sazonalidade só entra com pelo menos dois ciclos completos de dados.
+    """
+    y = series.to_numpy(dtype=float)
+    n_meses = y.shape[1]
+    mes_inicial = int(meses_inteiros(pd.Series(series.columns[:1]))[0][0]) if n_meses else 0
+    sazonal = n_meses >= 2 * PERIODO_SAZONAL
+    x = _desenho(np.arange(n_meses), mes_inicial, sazonal)
+
+    coeficientes, _, _, _ = np.linalg.lstsq(x, y.T, rcond=None)
+    residuos = y - (x @ coeficientes).T
+    graus = max(n_meses - x.shape[1], 1)
+    return {
+        "series": list(series.index),
+        "coeficientes": coeficientes,
+        "desvio": np.sqrt((residuos ** 2).sum(axis=1) / graus),
+        "mes_inicial": mes_inicial,
+        "n_meses": n_meses,
+        "sazonal": sazonal,
+    }
+
+
+def prever_lote(modelo, horizonte=6, z=1.96):
+    """
+    Previsões para os próximos `horizonte` meses de todas as séries do modelo.
+    Devolve DataFrame longo com Serie, Mes, Previsao, Inferior e Superior.
+    """
+    passos = np.arange(modelo["n_meses"], modelo["n_meses"] + horizonte)
+    x = _desenho(passos, modelo["mes_inicial"], modelo["sazonal"])
+    previsoes = (x @ modelo["coeficientes"]).T
+    margem = z * modelo["desvio"][:, None]
+
+    meses = rotulos_meses(modelo["mes_inicial"] + passos)
+    n_series = len(modelo["series"])
+    return pd.DataFrame({
+        "Serie": np.repeat(np.asarray(modelo["series"], dtype=object), horizonte),
+        "Mes": np.tile(meses, n_series),
+        "Previsao": previsoes.ravel(),
+        "Inferior": (previsoes - margem).ravel(),
+        "Superior": (previsoes + margem).ravel(),
+    })
@@ -0,0 +1,436 @@
+"""
+Atualização das bases em segundo plano.
+
+Uma thread observa os arquivos base_*_ecomove.xlsx (e, com ECOMOVE_ARROW_STORE,
+a versão publicada no store Arrow) e, quando algo muda, publica uma versão nova do `Dataset` fora do caminho da requisição. A troca é
+atômica: cada rerun pega uma referência ao `Dataset` vigente no início e
+continua usando essa versão até terminar, mesmo que outra seja publicada.
+Cada `Dataset` fica preso à fonte que viu ao ser criado (versão do store ou
+assinatura das planilhas): uma base lida depois que a fonte mudou levantaria
+`DatasetDesatualizado` em vez de misturar duas versões das planilhas.
+
+As bases de uma versão são carregadas sob demanda (ver `Dataset.tabelas`):
+só as bases e colunas que as páginas declaram, com o filtro de período
+aplicado na leitura. Com `precarga` (opcional; ECOMOVE_PRECARGA=1 no app),
+a thread carrega essas bases logo na partida, sem segurar a primeira
+renderização; na recarga, só o que já estava em uso na versão anterior é
+carregado de novo em segundo plano antes da troca.
+
+Com vários tenants, `CacheTenants` mantém um atualizador por tenant num LRU
+limitado pela memória dos datasets carregados.
+
+Se houver agregados pré-compilados válidos (ver agregados.py), eles são lidos
+junto com as bases e anexados à versão nova.
+"""
+import glob
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import agregados
+import anomalias
+from data_handler import (
+    ENV_ARROW_STORE, TABELAS, ler_tabela, marcar_versao, memoria_frames, recortar, resolver_raiz, versao_dataset,
+)
+
+PADRAO_ARQUIVOS = "base_*_ecomove.xlsx"
+# Recortes por período mantidos em memória por versão do dataset (LRU).
+MAX_RECORTES = 16
+
+# Versões únicas no processo inteiro: os caches por versão (cache_por_versao)
+# não podem confundir a versão 1 de um tenant com a versão 1 de outro.
+_VERSOES = itertools.count(1)
+
+
+def _versao_store(tenant=None):
+    """Versão publicada no store Arrow (ponteiro CURRENT), ou None sem store configurado."""
+    raiz = os.environ.get(ENV_ARROW_STORE)
+    if not raiz:
+        return None
+    import arrow_store
+
+    if tenant is not None:
+        raiz = os.path.join(raiz, tenant)
+    return arrow_store.versao_atual(raiz)
+
+
+def _assinatura_arquivos(data_path, tenant=None):
+    arquivos = sorted(glob.glob(os.path.join(data_path, PADRAO_ARQUIVOS)))
+    assinatura = []
+    for caminho in arquivos:
+        try:
+            st_arquivo = os.stat(caminho)
+        except OSError:
+            continue
+        assinatura.append((caminho, st_arquivo.st_mtime_ns, st_arquivo.st_size))
+    # Uma versão nova publicada no store (troca do CURRENT) também gera recarga.
+    assinatura.append(("store", _versao_store(tenant)))
+    return tuple(assinatura)
+
+
+class DatasetDesatualizado(RuntimeError):
+    """A fonte das bases mudou depois que o Dataset foi criado; é preciso usar a versão nova."""
+
+
+class Dataset:
+    """
+    Uma versão das bases de um diretório, carregadas sob demanda.
+
+    Cada base é lida na primeira vez que uma página a pede, só com as colunas
+    pedidas; quando outra página pede mais colunas, a base é relida com a união
+    delas. Os frames de uma base sem filtro carregam a versão do dataset (e os
+    caches por versão valem entre páginas); um recorte por período tem uma
+    versão derivada própria, a mesma para todas as bases recortadas no período.
+
+    Com `assinatura` (ver `_assinatura_arquivos`), as leituras vêm só dessa fonte:
+    a versão do store que ela registra ou, sem store, as planilhas com essas
+    datas e tamanhos; se a fonte já mudou, levanta DatasetDesatualizado.
+    """
+
+    def __init__(self, versao, data_path, tenant=None, agregados=None, assinatura=None):
+        self.versao = versao
+        self.assinatura = assinatura
+        # A versão do store é sempre o último item da assinatura.
+        self.versao_store = assinatura[-1][1] if assinatura else None
+        self.carregado_em = time.time()
+        self.data_path = data_path
+        self.tenant = tenant
+        self.agregados = agregados or {}
+        self._carregadas = {}  # base → DataFrame com as colunas pedidas até agora
+        self._pedidas = {}  # base → colunas pedidas (None = todas)
+        self._relatorios = {}
+        self._recortes = OrderedDict()  # (base, colunas, período) → DataFrame
+        self._memoria = {}  # base ou chave do recorte → bytes (medidos uma vez, na carga)
+        self._versoes_periodo = {}
+        self._alertas = {}  # KPI → alertas da varredura
+        self._lock = threading.Lock()
+        self._locks_bases = {nome: threading.Lock() for nome in TABELAS}
+        self._lock_alertas = threading.Lock()
+
+    def _conferir_planilhas(self):
+        if self.assinatura is not None and _assinatura_arquivos(self.data_path, self.tenant) != self.assinatura:
+            raise DatasetDesatualizado(f"As bases de {self.data_path} mudaram depois da versão {self.versao}")
+
+    def _ler(self, nome, colunas, filtro=None):
+        """ler_tabela presa à fonte do Dataset."""
+        if self.versao_store is not None:
+            try:
+                return ler_tabela(self.data_path, nome, colunas, filtro, tenant=self.tenant,
+                                  versao_store=self.versao_store)
+            except FileNotFoundError as e:
+                # A versão fixada saiu do store (só as VERSOES_MANTIDAS mais novas ficam).
+                raise DatasetDesatualizado(f"Versão {self.versao_store} do store removida") from e
+        # Planilhas conferidas antes e depois: uma gravação durante a leitura também conta.
+        self._conferir_planilhas()
+        lido = ler_tabela(self.data_path, nome, colunas, filtro, usar_store=self.assinatura is None,
+                          tenant=self.tenant)
+        self._conferir_planilhas()
+        return lido
+
+    def _base(self, nome, colunas):
+        """Base `nome` com pelo menos `colunas` (None = todas), lendo o que faltar."""
+        with self._locks_bases[nome]:
+            pedidas = self._pedidas.get(nome, [])
+            if nome in self._carregadas and (
+                pedidas is None or (colunas is not None and set(colunas) <= set(pedidas))
+            ):
+                return self._carregadas[nome]
+            if colunas is not None and pedidas is not None:
+                colunas = list(dict.fromkeys([*pedidas, *colunas]))
+            df, relatorio = self._ler(nome, colunas)
+            marcar_versao(df, self.versao)
+            memoria = memoria_frames({nome: df})
+            with self._lock:
+                self._carregadas[nome] = df
+                self._pedidas[nome] = colunas
+                self._memoria[nome] = memoria
+                if relatorio is not None:
+                    self._relatorios[nome] = relatorio
+            return df
+
+    def _versao_periodo(self, periodo):
+        with self._lock:
+            if periodo not in self._versoes_periodo:
+                self._versoes_periodo[periodo] = next(_VERSOES)
+            return self._versoes_periodo[periodo]
+
+    def _recorte(self, nome, requisito, periodo):
+        chave = (nome, None if requisito.colunas is None else tuple(requisito.colunas), periodo)
+        with self._lock:
+            df = self._recortes.get(chave)
+            if df is not None:
+                self._recortes.move_to_end(chave)
+                return df
+            carregada = self._carregadas.get(nome)
+            pedidas = self._pedidas.get(nome, [])
+        filtro = (requisito.data, *periodo)
+        if carregada is not None and (
+            pedidas is None or (requisito.colunas is not None and set(requisito.colunas) <= set(pedidas))
+        ):
+            # Base já em memória: o recorte sai dela, sem nova leitura.
+            df = recortar(carregada, requisito.colunas, filtro)
+        else:
+            # Projeção e filtro aplicados na leitura; a base inteira não é carregada.
+            df, _ = self._ler(nome, requisito.colunas, filtro)
+        marcar_versao(df, self._versao_periodo(periodo))
+        memoria = memoria_frames({nome: df})
+        with self._lock:
+            self._recortes[chave] = df
+            self._memoria[chave] = memoria
+            while len(self._recortes) > MAX_RECORTES:
+                antiga, _ = self._recortes.popitem(last=False)
+                del self._memoria[antiga]
+        return df
+
+    def tabelas(self, requisitos, periodo=None):
+        """
+        Frames das bases de `requisitos` (base → Requisito), só com as colunas pedidas.
+        Com `periodo`, as bases com coluna de data ficam só com as linhas do período.
+        """
+        frames = {}
+        for nome, requisito in requisitos.items():
+            if periodo is not None and requisito.data is not None:
+                df = self._recorte(nome, requisito, periodo)
+            else:
+                df = recortar(self._base(nome, requisito.colunas), requisito.colunas)
+            # Cópias rasas: as páginas atribuem colunas sem alterar os frames compartilhados entre sessões.
+            frames[nome] = marcar_versao(df.copy(deep=False), versao_dataset(df))
+        return frames
+
+    def precarregar_requisitos(self, requisitos, alertas=False):
+        """Carrega as bases de `requisitos` (sem recorte de período) e, com `alertas`, a varredura completa."""
+        for nome, requisito in requisitos.items():
+            self._base(nome, requisito.colunas)
+        if alertas:
+            self.alertas_de()
+
+    def precarregar(self, anterior):
+        """Carrega as bases e colunas que estavam em uso no Dataset `anterior`."""
+        with anterior._lock:
+            pedidas = dict(anterior._pedidas)
+        with anterior._lock_alertas:
+            kpis = list(anterior._alertas)
+        for nome, colunas in pedidas.items():
+            self._base(nome, colunas)
+        if kpis:
+            self.alertas_de(kpis)
+
+    @property
+    def carregadas(self):
+        """Nomes das bases já em memória."""
+        with self._lock:
+            return [nome for nome in TABELAS if nome in self._carregadas]
+
+    @property
+    def qualidade(self):
+        """Relatório de qualidade das bases já carregadas (None se nenhuma tem relatório)."""
+        with self._lock:
+            relatorios = [self._relatorios[nome] for nome in TABELAS if nome in self._relatorios]
+        return pd.concat(relatorios, ignore_index=True) if relatorios else None
+
+    def alertas_de(self, kpis=None):
+        """
+        Alertas de anomalias dos `kpis` (todos, por padrão; ver anomalias.VARREDURAS),
+        ordenados por |z|. Cada KPI é varrido na primeira vez que é pedido, lendo só a sua base.
+        """
+        kpis = list(kpis or anomalias.VARREDURAS)
+        with self._lock_alertas:
+            faltam = [kpi for kpi in kpis if kpi not in self._alertas]
+            if faltam:
+                self._alertas.update(anomalias.varrer(self.tabelas(anomalias.requisitos(faltam)), faltam))
+            return anomalias.ordenar(pd.concat([self._alertas[kpi] for kpi in kpis], ignore_index=True))
+
+    @property
+    def alertas(self):
+        """Varredura de anomalias de todos os KPIs diários, calculada na primeira vez que é pedida."""
+        return self.alertas_de()
+
+    @property
+    def memoria_bytes(self):
+        with self._lock:
+            return sum(self._memoria.values())
+
+
+class AtualizadorDados:
+    """Mantém o Dataset vigente e o recarrega quando os xlsx ou a versão do store mudam."""
+
+    def __init__(self, data_path, intervalo=5.0, tenant=None, precarga=None, alertas_na_precarga=False,
+                 ao_carregar=None):
+        self.data_path = data_path
+        self.intervalo = intervalo
+        self.tenant = tenant
+        # Requisitos (base → Requisito) carregados em segundo plano logo após a carga inicial
+        # (nenhum por padrão: a primeira versão fica só com o que as páginas pedirem).
+        self.precarga = precarga or {}
+        self.alertas_na_precarga = alertas_na_precarga
+        # Chamado (sem argumentos) quando a pré-carga ou uma recarga em segundo plano termina.
+        self.ao_carregar = ao_carregar
+        self.ultimo_erro = None
+        self._assinatura = None
+        self._atual = None
+        self._lock = threading.Lock()
+        self._lock_recarga = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _recarregar(self):
+        assinatura = _assinatura_arquivos(self.data_path, self.tenant)
+        compilados = agregados.carregar(self.data_path)
+        dataset = Dataset(next(_VERSOES), self.data_path, self.tenant, compilados, assinatura)
+        if self._atual is not None:
+            # O que as sessões já usavam é lido aqui, antes da troca, e não no primeiro rerun.
+            dataset.precarregar(self._atual)
+        with self._lock:
+            agregados.anexar(dataset.versao, compilados)
+            self._assinatura = assinatura
+            self._atual = dataset
+
+    @property
+    def memoria_bytes(self):
+        """Memória das bases carregadas na versão vigente."""
+        return self._atual.memoria_bytes if self._atual is not None else 0
+
+    def _precarregar_inicial(self):
+        dataset = self._atual
+        try:
+            dataset.precarregar_requisitos(self.precarga, self.alertas_na_precarga)
+        except Exception as e:
+            # As páginas ainda carregam sob demanda o que faltar.
+            self.ultimo_erro = e
+            print("⚠ Erro ao pré-carregar bases:", e)
+
+    def _carregou(self):
+        # A memória do dataset vigente mudou fora de qualquer requisição.
+        if self.ao_carregar is not None:
+            self.ao_carregar()
+
+    def _loop(self):
+        if self.precarga or self.alertas_na_precarga:
+            self._precarregar_inicial()
+            self._carregou()
+        while not self._parar.wait(self.intervalo):
+            self.atualizar()
+
+    def atualizar(self):
+        """
+        Recarrega agora se os xlsx ou a versão do store mudaram (a thread faz o mesmo
+        a cada `intervalo`). Devolve True se uma versão nova foi publicada.
+        """
+        with self._lock_recarga:
+            if _assinatura_arquivos(self.data_path, self.tenant) == self._assinatura:
+                return False
+            try:
+                self._recarregar()
+                self.ultimo_erro = None
+            except Exception as e:
+                # Mantém a versão anterior; tenta de novo no próximo ciclo.
+                self.ultimo_erro = e
+                print("⚠ Erro ao recarregar bases:", e)
+                return False
+        self._carregou()
+        return True
+
+    def iniciar(self):
+        """
+        Publica a versão inicial (se necessário) e sobe a thread observadora, que
+        começa pré-carregando `precarga`, se houver; o primeiro rerun não espera por ela.
+        """
+        if self._atual is None:
+            self._recarregar()
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="ecomove-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+
+    def snapshot(self):
+        """Dataset vigente; a referência devolvida nunca é alterada depois."""
+        return self._atual
+
+
+class CacheTenants:
+    """
+    Um AtualizadorDados por tenant, em LRU limitado por `limite_bytes` (soma da
+    memória dos datasets vigentes). O tenant mais antigo é despejado e tem a
+    thread parada; sessões que já pegaram o snapshot dele terminam normalmente.
+    O tenant recém-usado nunca é despejado, mesmo sozinho acima do limite.
+
+    Um tenant entra no LRU quase vazio (as bases são lidas sob demanda ou pela
+    pré-carga); o limite é reaplicado a cada `obter` e sempre que a pré-carga
+    ou uma recarga em segundo plano de qualquer tenant termina.
+    """
+
+    def __init__(self, limite_bytes, intervalo=5.0, precarga=None, alertas_na_precarga=False):
+        self.limite_bytes = limite_bytes
+        self.intervalo = intervalo
+        self.precarga = precarga
+        self.alertas_na_precarga = alertas_na_precarga
+        self.acertos = 0
+        self.faltas = 0
+        self.despejos = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _novo(self, tenant):
+        return AtualizadorDados(
+            resolver_raiz(tenant), self.intervalo, tenant=tenant,
+            precarga=self.precarga, alertas_na_precarga=self.alertas_na_precarga,
+            ao_carregar=self._aplicar_limite,
+        ).iniciar()
+
+    def _aplicar_limite(self):
+        """Reaplica o limite depois que uma carga em segundo plano mudou a memória de um tenant."""
+        with self._lock:
+            self._despejar()
+
+    def obter(self, tenant=None):
+        """Atualizador do tenant (None = diretório de trabalho), carregando-o se preciso."""
+        with self._lock:
+            atualizador = self._itens.get(tenant)
+            if atualizador is not None:
+                self.acertos += 1
+                self._itens.move_to_end(tenant)
+                # Recargas em segundo plano podem ter mudado o tamanho dos datasets.
+                self._despejar()
+                return atualizador
+            self.faltas += 1
+
+        # Carga fora do lock: outros tenants continuam sendo servidos enquanto isso.
+        novo = self._novo(tenant)
+        with self._lock:
+            atualizador = self._itens.get(tenant)
+            if atualizador is None:
+                atualizador = self._itens[tenant] = novo
+            else:
+                # Outra sessão carregou o mesmo tenant ao mesmo tempo; fica a que chegou primeiro.
+                novo.parar()
+            self._itens.move_to_end(tenant)
+            self._despejar()
+        return atualizador
+
+    def _memoria(self):
+        return sum(a.memoria_bytes for a in self._itens.values())
+
+    def _despejar(self):
+        while len(self._itens) > 1 and self._memoria() > self.limite_bytes:
+            _, atualizador = self._itens.popitem(last=False)
+            atualizador.parar()
+            self.despejos += 1
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "tenants": len(self._itens),
+                "memoria_bytes": self._memoria(),
+                "limite_bytes": self.limite_bytes,
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "despejos": self.despejos,
+            }
@@ -0,0 +1,52 @@
+"""
+Renderização progressiva das páginas.
+
+As seções baratas (KPIs, títulos) são escritas na hora; as caras ganham um
+placeholder na posição certa da página e têm o cálculo (agregações pandas/NumPy
+e montagem das figuras) feito num pool de threads. O script principal
+preenche cada placeholder assim que o respectivo cálculo termina, na ordem
+de conclusão. Só a renderização toca em `st`; os cálculos não podem.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import streamlit as st
+
+_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ECOMOVE_RENDER_THREADS", "4")),
+    thread_name_prefix="ecomove-secao",
+)
+
+
+class AgendadorSecoes:
+    """Reserva placeholders em ordem e os preenche quando os cálculos ficam prontos."""
+
+    def __init__(self, mensagem_espera="⏳ Calculando..."):
+        self.mensagem_espera = mensagem_espera
+        self._pendentes = {}
+
+    def tarefa(self, calcular):
+        """Agenda um cálculo intermediário compartilhado por várias seções (devolve o Future)."""
+        return _POOL.submit(calcular)
+
+    def secao(self, calcular, renderizar):
+        """
+        Agenda `calcular()` no pool e reserva o lugar da seção na página;
+        `renderizar(resultado)` roda depois, dentro do placeholder.
+        """
+        placeholder = st.empty()
+        placeholder.caption(self.mensagem_espera)
+        futuro = self.tarefa(calcular)
+        self._pendentes[futuro] = (placeholder, renderizar)
+
+    def concluir(self):
+        """Preenche os placeholders conforme os cálculos terminam."""
+        for futuro in as_completed(list(self._pendentes)):
+            placeholder, renderizar = self._pendentes.pop(futuro)
+            with placeholder.container():
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    st.error(f"Erro ao calcular esta seção: {e}")
+                    continue
+                renderizar(resultado)
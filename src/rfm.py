@@ -0,0 +1,100 @@
+"""
+Segmentação RFM (recência, frequência, valor) dos clientes.
+
+Os agregados por cliente saem de um único groupby sobre df_vendas; as notas
+de 1 a 5 são atribuídas com np.searchsorted contra os pontos de corte
+(quintis) calculados uma vez, e o segmento vem de uma tabela 5 × 5
+indexada pelas notas de recência e frequência.
+"""
+import numpy as np
+import pandas as pd
+
+SEM_COMPRAS = "Sem compras"
+
+# Segmento por nota de recência (linhas R1..R5) × frequência (colunas F1..F5).
+_SEGMENTOS = np.array([
+    ["Hibernando", "Hibernando", "Em risco", "Em risco", "Não podemos perder"],
+    ["Hibernando", "Hibernando", "Em risco", "Em risco", "Não podemos perder"],
+    ["Quase dormindo", "Quase dormindo", "Precisam de atenção", "Clientes leais", "Clientes leais"],
+    ["Promissores", "Potenciais leais", "Potenciais leais", "Clientes leais", "Clientes leais"],
+    ["Novos clientes", "Potenciais leais", "Potenciais leais", "Campeões", "Campeões"],
+])
+
+
+def agregados_clientes(df_vendas, data_referencia=None):
+    """Última compra, nº de compras e valor total por cliente (um único groupby)."""
+    vendas = df_vendas[["ID_Cliente", "Data_Venda", "Valor_Total"]].assign(
+        Valor_Total=pd.to_numeric(df_vendas["Valor_Total"], errors="coerce")
+    )
+    agregados = vendas.groupby("ID_Cliente").agg(
+        Ultima_Compra=("Data_Venda", "max"),
+        Frequencia=("Data_Venda", "size"),
+        Valor=("Valor_Total", "sum"),
+    )
+    if data_referencia is None:
+        data_referencia = vendas["Data_Venda"].max()
+    agregados["Recencia"] = (data_referencia - agregados["Ultima_Compra"]).dt.days
+    return agregados
+
+
+def pontos_de_corte(valores, n_faixas=5):
+    """Quantis internos (n_faixas - 1 cortes) usados para dar as notas."""
+    valores = np.asarray(valores, dtype=float)
+    valores = valores[np.isfinite(valores)]
+    if valores.size == 0:
+        return np.zeros(n_faixas - 1)
+    return np.quantile(valores, np.linspace(0, 1, n_faixas + 1)[1:-1])
+
+
+def notas(valores, cortes, inverter=False):
+    """Nota 1..n por searchsorted nos cortes; `inverter` para métricas onde menor é melhor."""
+    # side="left": valores empatados com o corte ficam na faixa de baixo (importa para frequências discretas).
+    nota = np.searchsorted(cortes, np.asarray(valores, dtype=float), side="left") + 1
+    return (len(cortes) + 2 - nota) if inverter else nota
+
+
+def calcular_cortes(agregados):
+    return {
+        "Recencia": pontos_de_corte(agregados["Recencia"]),
+        "Frequencia": pontos_de_corte(agregados["Frequencia"]),
+        "Valor": pontos_de_corte(agregados["Valor"]),
+    }
+
+
+def pontuar(agregados, cortes):
+    """Acrescenta notas R, F, M e o segmento aos agregados (cortes reaproveitáveis)."""
+    resultado = agregados.copy()
+    resultado["R"] = notas(agregados["Recencia"], cortes["Recencia"], inverter=True)
+    resultado["F"] = notas(agregados["Frequencia"], cortes["Frequencia"])
+    resultado["M"] = notas(agregados["Valor"], cortes["Valor"])
+    resultado["Segmento"] = _SEGMENTOS[resultado["R"].to_numpy() - 1, resultado["F"].to_numpy() - 1]
+    return resultado
+
+
+def tabela_rfm(df_clientes, df_vendas, data_referencia=None):
+    """
+    Devolve (tabela, cortes): uma linha por cliente de df_clientes com recência,
+    frequência, valor, notas e segmento; clientes sem venda ficam em "Sem compras".
+    """
+    agregados = agregados_clientes(df_vendas, data_referencia)
+    cortes = calcular_cortes(agregados)
+    pontuados = pontuar(agregados, cortes)
+
+    ids = pd.Index(df_clientes["ID_Cliente"].dropna().unique(), name="ID_Cliente")
+    tabela = pontuados.reindex(ids)
+    sem_compras = tabela["Frequencia"].isna()
+    tabela.loc[sem_compras, ["Frequencia", "Valor"]] = 0
+    tabela["Segmento"] = tabela["Segmento"].where(~sem_compras, SEM_COMPRAS)
+    return tabela, cortes
+
+
+def resumo_segmentos(tabela):
+    """Clientes, recência/frequência/valor médios e valor total por segmento."""
+    resumo = tabela.groupby("Segmento").agg(
+        Clientes=("Segmento", "size"),
+        Recencia_Media=("Recencia", "mean"),
+        Frequencia_Media=("Frequencia", "mean"),
+        Valor_Medio=("Valor", "mean"),
+        Valor_Total=("Valor", "sum"),
+    )
+    return resumo.sort_values("Valor_Total", ascending=False).reset_index()
@@ -0,0 +1,229 @@
+"""
+Simulador de alocação do orçamento de marketing entre tipos de mídia.
+
+A curva de resposta de cada mídia é a reta de Receita_Gerada contra
+Investimento por campanha em escala log-log (log R = α + β·log I): β é a
+elasticidade da receita ao investimento e, abaixo de 1, dá retornos
+decrescentes. As somas suficientes de todas as mídias saem de np.bincount e
+os sistemas 2×2 das retas são resolvidos numa única chamada a np.linalg.solve.
+
+Na simulação, β fica limitado a [0, 1], α é reajustado com esse β e a volta da
+escala log usa o fator de Duan (média de e^resíduo), já que e^(α + β·log I) é a
+mediana da receita e não a média. Assim, o mix atual no investimento atual
+reproduz a receita observada (exatamente com β = 0).
+
+Um cenário é uma divisão do orçamento entre as mídias (sorteada em torno do mix
+atual). Com as campanhas de cada mídia crescendo na proporção do orçamento dela,
+a receita prevista é R_m = c_m·(orçamento·participação_m)^β_m. Então
+a receita de todos os cenários em todos os níveis de orçamento é um único
+produto de matrizes: participações^β (cenários × mídias) @ c·orçamento^β
+(mídias × níveis).
+
+Verificação e benchmark com mídias e campanhas sintéticas:
+    python src/simulador.py [midias] [cenarios]
+"""
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+CENARIOS_PADRAO = 10_000
+# Concentração do sorteio de Dirichlet em torno do mix atual: quanto maior, mais perto dele.
+CONCENTRACAO_PADRAO = 50.0
+# Elasticidade usada nas simulações: acima de 1 toda a verba iria para uma mídia só;
+# abaixo de 0 a receita cresceria ao cortar investimento.
+ELASTICIDADE_MIN, ELASTICIDADE_MAX = 0.0, 1.0
+
+Curvas = namedtuple("Curvas", ["midias", "campanhas", "investimento", "receita", "alfa", "beta", "r2", "fator"])
+
+
+def ajustar_curvas(df, grupo="Tipo_Midia", x="Investimento", y="Receita_Gerada"):
+    """
+    Curvas de resposta log-log de todas as mídias de `df` (uma linha por campanha).
+    Só campanhas com investimento e receita positivos entram no ajuste. Uma mídia
+    com menos de dois pontos distintos fica com β = 1 e o ROAS agregado como fator.
+    `beta` é a elasticidade ajustada; `alfa` e `fator` usam a limitada a
+    [ELASTICIDADE_MIN, ELASTICIDADE_MAX], a mesma da simulação. O R² é o
+    quadrado da correlação entre log I e log R, tirado das mesmas somas.
+    """
+    codigos, midias = pd.factorize(df[grupo], sort=True)
+    n_midias = len(midias)
+    investimento = pd.to_numeric(df[x], errors="coerce").fillna(0).to_numpy(dtype=float)
+    receita = pd.to_numeric(df[y], errors="coerce").fillna(0).to_numpy(dtype=float)
+    com_midia = codigos >= 0
+
+    def somar(pesos, mascara):
+        return np.bincount(codigos[mascara], weights=pesos[mascara], minlength=n_midias)
+
+    campanhas = np.bincount(codigos[com_midia], minlength=n_midias).astype(float)
+    total_investido = somar(investimento, com_midia)
+    total_receita = somar(receita, com_midia)
+
+    validas = com_midia & (investimento > 0) & (receita > 0)
+    u = np.log(np.where(validas, investimento, 1.0))
+    v = np.log(np.where(validas, receita, 1.0))
+    n = somar(np.ones_like(u), validas)
+    su, sv = somar(u, validas), somar(v, validas)
+    suu, svv, suv = somar(u * u, validas), somar(v * v, validas), somar(u * v, validas)
+
+    # Equações normais de todas as mídias empilhadas (mídias × 2 × 2), resolvidas de uma vez.
+    var_u = suu - su * su / np.maximum(n, 1)
+    var_v = svv - sv * sv / np.maximum(n, 1)
+    cov_uv = suv - su * sv / np.maximum(n, 1)
+    ajustavel = (n >= 2) & (var_u > 1e-12)
+    a = np.stack([np.stack([n, su], -1), np.stack([su, suu], -1)], -2)
+    a[~ajustavel] = np.eye(2)
+    b = np.stack([sv, suv], -1)
+    alfa, beta = np.linalg.solve(a, b[..., None])[..., 0].T
+
+    r2 = np.full(n_midias, np.nan)
+    com_variancia = ajustavel & (var_v > 1e-12)
+    r2[com_variancia] = cov_uv[com_variancia] ** 2 / (var_u[com_variancia] * var_v[com_variancia])
+
+    roas = np.divide(total_receita, total_investido, out=np.zeros(n_midias), where=total_investido > 0)
+    beta = np.where(ajustavel, beta, 1.0)
+    beta_simulado = np.clip(beta, ELASTICIDADE_MIN, ELASTICIDADE_MAX)
+    # Com β limitado, α é reajustado pela mesma reta: α = média(log R) − β·média(log I).
+    alfa = np.where(ajustavel, (sv - beta_simulado * su) / np.maximum(n, 1), np.nan)
+    # e^(α + β·log I) estima a mediana da receita, não a média: fator de Duan = média de e^resíduo.
+    residuos = v - np.nan_to_num(alfa)[codigos] - beta_simulado[codigos] * u
+    duan = somar(np.exp(residuos), validas) / np.maximum(n, 1)
+    # Cada campanha cresce na proporção do orçamento da mídia (X/X_m), mantendo o mix entre elas:
+    # R_m(X) = Σ duan·e^α·(I_i·X/X_m)^β = (duan·e^α·Σ I_i^β / X_m^β)·X^β; sem ajuste, R_m(X) = ROAS·X.
+    potencias = somar(np.exp(beta_simulado[codigos] * u), validas)
+    nivel = np.power(np.where(ajustavel, total_investido, 1.0), beta_simulado)
+    fator = np.where(ajustavel, duan * np.exp(np.nan_to_num(alfa)) * potencias / nivel, roas)
+    return Curvas(list(midias), campanhas, total_investido, total_receita, alfa, beta, r2, fator)
+
+
+def tabela_curvas(curvas):
+    """Uma linha por mídia com os parâmetros da curva (para exibição)."""
+    return pd.DataFrame({
+        "Tipo_Midia": curvas.midias,
+        "Campanhas": curvas.campanhas.astype(int),
+        "Investimento": curvas.investimento,
+        "Receita_Gerada": curvas.receita,
+        "Elasticidade": curvas.beta,
+        "R2_log": curvas.r2,
+    })
+
+
+def participacao_atual(curvas):
+    total = curvas.investimento.sum()
+    if total <= 0:
+        return np.full(len(curvas.midias), 1 / max(len(curvas.midias), 1))
+    return curvas.investimento / total
+
+
+def sortear_participacoes(participacao, n_cenarios=CENARIOS_PADRAO, concentracao=CONCENTRACAO_PADRAO, semente=0):
+    """
+    Matriz cenários × mídias de divisões do orçamento (linhas somam 1), sorteadas
+    de uma Dirichlet centrada em `participacao`. A primeira linha é o próprio mix atual.
+    """
+    participacao = np.asarray(participacao, dtype=float)
+    n_midias = len(participacao)
+    # Piso de 1/n_midias no parâmetro: mídias sem investimento hoje também são exploradas.
+    parametros = concentracao * participacao + 1.0 / n_midias
+    rng = np.random.default_rng(semente)
+    sorteios = rng.standard_gamma(parametros, size=(n_cenarios, n_midias))
+    sorteios /= sorteios.sum(axis=1, keepdims=True)
+    sorteios[0] = participacao
+    return sorteios
+
+
+def simular(curvas, participacoes, orcamentos):
+    """Receita prevista (cenários × níveis de orçamento) de cada divisão em `participacoes`."""
+    beta = np.clip(curvas.beta, ELASTICIDADE_MIN, ELASTICIDADE_MAX)
+    orcamentos = np.asarray(orcamentos, dtype=float)
+    # Participação 0 dá resposta 0 (β > 0) ou 1 (β = 0, receita que não depende do investimento).
+    respostas = np.power(participacoes, beta)
+    pesos = curvas.fator[:, None] * np.power(orcamentos[None, :], beta[:, None])
+    return respostas @ pesos
+
+
+def melhores_alocacoes(curvas, participacoes, receitas, orcamento, n=5):
+    """
+    As `n` divisões de maior receita prevista no `orcamento` (receitas = uma coluna
+    de `simular`), com o mix atual (linha 0) como referência na última linha.
+    """
+    ordem = np.argsort(-receitas, kind="stable")[:n]
+    linhas = list(ordem) + ([0] if 0 not in ordem else [])
+    tabela = pd.DataFrame(participacoes[linhas] * orcamento, columns=[str(m) for m in curvas.midias])
+    tabela.insert(0, "Cenario", ["Mix atual" if i == 0 else f"#{posicao + 1}" for posicao, i in enumerate(linhas)])
+    tabela["Receita_Prevista"] = receitas[linhas]
+    tabela["ROAS_Previsto"] = receitas[linhas] / orcamento if orcamento > 0 else np.nan
+    tabela["Ganho_vs_Atual"] = receitas[linhas] - receitas[0]
+    return tabela
+
+
+def varrer(curvas, multiplicadores, n_cenarios=CENARIOS_PADRAO, concentracao=CONCENTRACAO_PADRAO, semente=0):
+    """
+    Varredura completa: sorteia os cenários e simula todos nos orçamentos
+    investimento atual × `multiplicadores`. Devolve (participações, orçamentos, receitas).
+    """
+    orcamentos = curvas.investimento.sum() * np.asarray(multiplicadores, dtype=float)
+    participacoes = sortear_participacoes(participacao_atual(curvas), n_cenarios, concentracao, semente)
+    return participacoes, orcamentos, simular(curvas, participacoes, orcamentos)
+
+
+def _campanhas_sinteticas(n_midias, campanhas_por_midia=200, semente=0):
+    rng = np.random.default_rng(semente)
+    midias = np.repeat([f"Midia_{i:02d}" for i in range(n_midias)], campanhas_por_midia)
+    beta = np.repeat(rng.uniform(0.4, 0.95, n_midias), campanhas_por_midia)
+    investimento = rng.lognormal(9, 1, len(midias))
+    receita = np.exp(1.0 + beta * np.log(investimento) + rng.normal(0, 0.3, len(midias)))
+    return pd.DataFrame({"Tipo_Midia": midias, "Investimento": investimento, "Receita_Gerada": receita})
+
+
+def verificar():
+    """
+    Casos de referência do ajuste (o repositório não tem suíte de testes): o mix atual
+    (linha 0) no investimento atual reproduz a receita observada. Devolve True se passou.
+    """
+    falhas = []
+    # Elasticidades em (0, 1): a previsão é a soma das médias previstas das campanhas.
+    sinteticas = _campanhas_sinteticas(10)
+    # Receita que não cresce com o investimento (β ajustado < 0, limitado a 0, como nas bases atuais): exato.
+    rng = np.random.default_rng(1)
+    sem_relacao = sinteticas.assign(
+        Receita_Gerada=rng.lognormal(12, 0.8, len(sinteticas)) * sinteticas["Investimento"] ** -0.2
+    )
+    for descricao, df, tolerancia in (("β em (0, 1)", sinteticas, 0.01), ("β limitado a 0", sem_relacao, 1e-9)):
+        curvas = ajustar_curvas(df)
+        _, _, receitas = varrer(curvas, [1.0], n_cenarios=1)
+        erro = receitas[0, 0] / curvas.receita.sum() - 1
+        if abs(erro) > tolerancia:
+            falhas.append(f"{descricao}: mix atual prevê {receitas[0, 0]:,.0f}, observado {curvas.receita.sum():,.0f}")
+
+    # α reajustado com o β limitado: a reta passa pelo centro dos pontos em log.
+    curvas = ajustar_curvas(sem_relacao)
+    beta = np.clip(curvas.beta, ELASTICIDADE_MIN, ELASTICIDADE_MAX)
+    logs = np.log(sem_relacao[["Investimento", "Receita_Gerada"]]).groupby(sem_relacao["Tipo_Midia"]).mean()
+    if not np.allclose(curvas.alfa, logs["Receita_Gerada"] - beta * logs["Investimento"]):
+        falhas.append("α não foi reajustado com a elasticidade limitada")
+
+    for falha in falhas:
+        print("✗", falha)
+    if not falhas:
+        print("✓ 3 casos do simulador ok")
+    return not falhas
+
+
+if __name__ == "__main__":
+    if not verificar():
+        sys.exit(1)
+    n_midias = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    n_cenarios = int(sys.argv[2]) if len(sys.argv) > 2 else CENARIOS_PADRAO
+    df = _campanhas_sinteticas(n_midias)
+    multiplicadores = np.arange(0.5, 2.01, 0.1)
+
+    inicio = time.perf_counter()
+    curvas = ajustar_curvas(df)
+    ajuste = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    participacoes, orcamentos, receitas = varrer(curvas, multiplicadores, n_cenarios)
+    varredura = time.perf_counter() - inicio
+    print(f"{n_midias} mídias ({len(df):,} campanhas): ajuste {ajuste * 1000:.1f} ms • "
+          f"{n_cenarios:,} cenários × {len(orcamentos)} orçamentos em {varredura * 1000:.1f} ms")
@@ -0,0 +1,139 @@
+"""
+Cópias sintéticas escaladas das cinco bases.
+
+Cada base é reamostrada (linhas inteiras, com reposição) a partir da planilha
+original até `escala` vezes o número de linhas; os IDs são renumerados, os
+valores monetários recebem um ruído multiplicativo pequeno e as datas um
+deslocamento de alguns dias dentro do período original. As distribuições e as
+categorias continuam as da base real, então as páginas se comportam como com
+dados de produção de volume maior. Com a mesma semente o resultado é o mesmo.
+
+Uso (gera as planilhas num diretório, utilizável como diretório de dados ou de tenant):
+    python src/sintetico.py /caminho/destino [escala] [semente] [xlsx|csv|parquet]
+
+Em csv ou parquet, cada base vira um diretório destino/<base>/ com partes de
+LINHAS_POR_PARTE linhas, como as exportações lidas por blocos.py.
+"""
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from data_handler import ARQUIVOS
+
+# Colunas de ID renumeradas 1..n em cada base.
+IDS = {"atendimento": "ID_Chamado", "clientes": "ID_Cliente", "vendas": "ID_Venda"}
+# Colunas que recebem ruído multiplicativo (lognormal, desvio RUIDO).
+VALORES = {
+    "clientes": ["Renda"],
+    "financeiro": ["Receita_Bruta", "Despesas_Operacionais"],
+    "marketing": ["Investimento", "Receita_Gerada"],
+    "vendas": ["Valor_Total"],
+}
+DATAS = {
+    "atendimento": ["Data_Abertura"],
+    "clientes": ["Data_Cadastro"],
+    "marketing": ["Data_Campanha"],
+    "vendas": ["Data_Venda"],
+}
+RUIDO = 0.05
+DESLOCAMENTO_DIAS = 15
+LINHAS_POR_PARTE = 100_000
+
+
+def ler_originais(origem):
+    """As cinco planilhas de `origem`, sem normalização (como saem do Excel)."""
+    return {
+        nome: pd.read_excel(os.path.join(origem, arquivo), decimal="," if nome == "financeiro" else ".")
+        for nome, arquivo in ARQUIVOS.items()
+    }
+
+
+def _reamostrar(df, linhas, rng):
+    return df.iloc[rng.integers(0, len(df), size=linhas)].reset_index(drop=True)
+
+
+def _com_ruido(serie, rng):
+    fator = rng.lognormal(0.0, RUIDO, size=len(serie))
+    novos = pd.to_numeric(serie, errors="coerce") * fator
+    return novos.round().astype("Int64") if pd.api.types.is_integer_dtype(serie) else novos.round(2)
+
+
+def _deslocar(serie, rng):
+    datas = pd.to_datetime(serie, errors="coerce")
+    dias = pd.to_timedelta(rng.integers(-DESLOCAMENTO_DIAS, DESLOCAMENTO_DIAS + 1, size=len(datas)), unit="D")
+    return (datas + dias).clip(datas.min(), datas.max())
+
+
+def escalar(originais, escala=1.0, semente=0):
+    """Versões com round(len * escala) linhas de cada base de `originais` (nome → DataFrame)."""
+    rng = np.random.default_rng(semente)
+    n_clientes_original = len(originais["clientes"])
+    frames = {}
+    for nome, df in originais.items():
+        novo = _reamostrar(df, max(1, round(len(df) * escala)), rng)
+        if nome in IDS:
+            novo[IDS[nome]] = np.arange(1, len(novo) + 1)
+        for coluna in VALORES.get(nome, []):
+            novo[coluna] = _com_ruido(novo[coluna], rng)
+        for coluna in DATAS.get(nome, []):
+            novo[coluna] = _deslocar(novo[coluna], rng)
+        frames[nome] = novo
+
+    financeiro = frames["financeiro"]
+    financeiro["Lucro_Líquido"] = financeiro["Receita_Bruta"] - financeiro["Despesas_Operacionais"]
+    financeiro["Margem (%)"] = (
+        financeiro["Lucro_Líquido"] / financeiro["Receita_Bruta"].replace(0, np.nan) * 100
+    ).astype(float).round(2)
+
+    frames["marketing"]["Campanha"] = [f"Campanha_{i}" for i in range(1, len(frames["marketing"]) + 1)]
+
+    # Cada venda aponta para uma das cópias do cliente original, mantendo a distribuição
+    # de vendas por cliente; cópias além do total de clientes voltam para o original.
+    n_clientes = len(frames["clientes"])
+    copias = rng.integers(0, math.ceil(max(escala, 1.0)), size=len(frames["vendas"]))
+    originais_ids = pd.to_numeric(frames["vendas"]["ID_Cliente"], errors="coerce")
+    ids = originais_ids + copias * n_clientes_original
+    frames["vendas"]["ID_Cliente"] = ids.where(ids <= n_clientes, originais_ids).astype("Int64")
+    return frames
+
+
+def gerar(origem, destino, escala=1.0, semente=0):
+    """Lê as bases de `origem`, escala e grava as planilhas em `destino`; devolve os frames gerados."""
+    frames = escalar(ler_originais(origem), escala, semente)
+    os.makedirs(destino, exist_ok=True)
+    for nome, df in frames.items():
+        df.to_excel(os.path.join(destino, ARQUIVOS[nome]), index=False)
+    return frames
+
+
+def gravar_partes(frames, destino, formato="parquet", linhas_por_parte=LINHAS_POR_PARTE):
+    """Exporta cada base de `frames` em destino/<base>/parte-00000.<formato>, ... (csv ou parquet)."""
+    if formato not in ("csv", "parquet"):
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    for nome, df in frames.items():
+        diretorio = os.path.join(destino, nome)
+        os.makedirs(diretorio, exist_ok=True)
+        for numero, inicio in enumerate(range(0, max(len(df), 1), linhas_por_parte)):
+            parte = df.iloc[inicio:inicio + linhas_por_parte]
+            caminho = os.path.join(diretorio, f"parte-{numero:05d}.{formato}")
+            if formato == "csv":
+                parte.to_csv(caminho, index=False)
+            else:
+                parte.to_parquet(caminho, index=False)
+
+
+if __name__ == "__main__":
+    destino = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), "sintetico")
+    escala = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    semente = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    formato = sys.argv[4] if len(sys.argv) > 4 else "xlsx"
+    if formato == "xlsx":
+        frames = gerar(os.getcwd(), destino, escala, semente)
+    else:
+        frames = escalar(ler_originais(os.getcwd()), escala, semente)
+        gravar_partes(frames, destino, formato)
+    print(f"Bases sintéticas (escala {escala:g}) gravadas em {destino}: "
+          + ", ".join(f"{nome} {len(df):,}" for nome, df in frames.items()))
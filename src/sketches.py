@@ -0,0 +1,195 @@
+"""
+Sketches de quantis (t-digest) para boxplots e medianas.
+
+Cada grupo é resumido em um conjunto limitado de centróides (média, peso).
+Os sketches podem ser combinados entre filtros e meses e atualizados com
+novas linhas sem voltar aos dados brutos, de modo que as estatísticas de
+caixa custam O(grupos) por rerun em vez de ordenar colunas inteiras.
+"""
+import numpy as np
+import pandas as pd
+
+COMPRESSAO_PADRAO = 200
+
+
+def _comprimir(medias, pesos, compressao):
+    """Agrupa centróides ordenados em buckets da escala k1 (mais finos nas caudas)."""
+    if len(medias) <= compressao:
+        return medias, pesos
+
+    total = pesos.sum()
+    q = (np.cumsum(pesos) - pesos / 2) / total
+    k = compressao / (2 * np.pi) * np.arcsin(2 * q - 1)
+    bucket = np.floor(k - k[0]).astype(np.int64)
+    _, bucket = np.unique(bucket, return_inverse=True)
+
+    novos_pesos = np.bincount(bucket, weights=pesos)
+    novas_medias = np.bincount(bucket, weights=medias * pesos) / novos_pesos
+    return novas_medias, novos_pesos
+
+
+class TDigest:
+    """Sketch de quantis combinável; vazio quando não há valores finitos."""
+
+    def __init__(self, medias=None, pesos=None, minimo=np.nan, maximo=np.nan, compressao=COMPRESSAO_PADRAO):
+        self.medias = np.asarray(medias if medias is not None else [], dtype=float)
+        self.pesos = np.asarray(pesos if pesos is not None else [], dtype=float)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.compressao = compressao
+
+    @classmethod
+    def de_valores(cls, valores, compressao=COMPRESSAO_PADRAO, ordenado=False):
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[np.isfinite(valores)]
+        if valores.size == 0:
+            return cls(compressao=compressao)
+        if not ordenado:
+            valores = np.sort(valores)
+        medias, pesos = _comprimir(valores, np.ones(valores.size), compressao)
+        return cls(medias, pesos, valores[0], valores[-1], compressao)
+
+    @classmethod
+    def de_frequencias(cls, valores, pesos, compressao=COMPRESSAO_PADRAO):
+        """Sketch de valores distintos com a frequência de cada um (ex.: value_counts)."""
+        valores = np.asarray(valores, dtype=float)
+        pesos = np.asarray(pesos, dtype=float)
+        validos = np.isfinite(valores) & (pesos > 0)
+        valores, pesos = valores[validos], pesos[validos]
+        if valores.size == 0:
+            return cls(compressao=compressao)
+        ordem = np.argsort(valores, kind="stable")
+        valores, pesos = valores[ordem], pesos[ordem]
+        medias, pesos = _comprimir(valores, pesos, compressao)
+        return cls(medias, pesos, valores[0], valores[-1], compressao)
+
+    @property
+    def n(self):
+        return float(self.pesos.sum())
+
+    def combinar(self, outro):
+        """Novo sketch equivalente à união dos dados dos dois."""
+        if outro.n == 0:
+            return self
+        if self.n == 0:
+            return outro
+        medias = np.concatenate([self.medias, outro.medias])
+        pesos = np.concatenate([self.pesos, outro.pesos])
+        ordem = np.argsort(medias, kind="stable")
+        medias, pesos = _comprimir(medias[ordem], pesos[ordem], self.compressao)
+        return TDigest(
+            medias, pesos,
+            np.fmin(self.minimo, outro.minimo), np.fmax(self.maximo, outro.maximo),
+            self.compressao,
+        )
+
+    def atualizar(self, valores):
+        """Incorpora novas linhas ao sketch."""
+        return self.combinar(TDigest.de_valores(valores, self.compressao))
+
+    def quantil(self, q):
+        """Quantis (interpolação linear, como np.quantile) estimados pelos centróides."""
+        q = np.asarray(q, dtype=float)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+
+        # Posição de cada centróide na escala de ranks 0..n-1; centróides de peso 1
+        # caem exatamente sobre o rank do valor original.
+        posicoes = np.cumsum(self.pesos) - self.pesos / 2 - 0.5
+        medias = self.medias
+        if posicoes[0] > 0:
+            posicoes = np.concatenate([[0.0], posicoes])
+            medias = np.concatenate([[self.minimo], medias])
+        if posicoes[-1] < self.n - 1:
+            posicoes = np.concatenate([posicoes, [self.n - 1]])
+            medias = np.concatenate([medias, [self.maximo]])
+        return np.interp(q * (self.n - 1), posicoes, medias)
+
+    def mediana(self):
+        return float(self.quantil(0.5))
+
+    def media(self):
+        return float(np.dot(self.medias, self.pesos) / self.n) if self.n else np.nan
+
+    def estatisticas_caixa(self):
+        """
+        q1, mediana, q3 e bigodes de Tukey: o ponto mais extremo dentro das cercas
+        q1 - 1.5·IQR e q3 + 1.5·IQR, como no go.Box calculado sobre as linhas. Os
+        pontos candidatos são o mínimo, o máximo e as médias dos centróides, então
+        os bigodes são aproximados; o mínimo e o máximo, quando dentro das cercas, são exatos.
+        """
+        q1, mediana, q3 = self.quantil([0.25, 0.5, 0.75])
+        inferior = superior = np.nan
+        if self.n:
+            iqr = q3 - q1
+            pontos = np.concatenate([[self.minimo], self.medias, [self.maximo]])
+            dentro = pontos[(pontos >= q1 - 1.5 * iqr) & (pontos <= q3 + 1.5 * iqr)]
+            # Sem ponto dentro das cercas (centróides largos), o bigode encosta na caixa.
+            inferior = min(dentro.min(), q1) if dentro.size else q1
+            superior = max(dentro.max(), q3) if dentro.size else q3
+        return {
+            "n": int(self.n),
+            "q1": q1,
+            "mediana": mediana,
+            "q3": q3,
+            "media": self.media(),
+            "cerca_inferior": inferior,
+            "cerca_superior": superior,
+        }
+
+
+def sketches_por_grupo(df, grupos, valor, compressao=COMPRESSAO_PADRAO):
+    """
+    Constrói um TDigest por grupo com uma única ordenação (grupo, valor).
+    `grupos` pode ser uma coluna ou lista de colunas; as chaves seguem o groupby.
+    """
+    agrupado = df.groupby(grupos, sort=True, observed=True, dropna=False)
+    codigos = agrupado.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    chaves = agrupado.size().index
+    valores = pd.to_numeric(df[valor], errors="coerce").to_numpy(dtype=float)
+
+    validos = (codigos >= 0) & np.isfinite(valores)
+    codigos, valores = codigos[validos], valores[validos]
+    ordem = np.lexsort((valores, codigos))
+    codigos, valores = codigos[ordem], valores[ordem]
+    inicios = np.searchsorted(codigos, np.arange(len(chaves)), side="left")
+    fins = np.searchsorted(codigos, np.arange(len(chaves)), side="right")
+
+    return {
+        chave: TDigest.de_valores(valores[ini:fim], compressao, ordenado=True)
+        for chave, ini, fim in zip(chaves, inicios, fins)
+    }
+
+
+def combinar_sketches(sketches, filtro=None):
+    """Combina os sketches cujas chaves passam em `filtro` (todos, por padrão)."""
+    total = TDigest()
+    for chave, sketch in sketches.items():
+        if filtro is None or filtro(chave):
+            total = total.combinar(sketch)
+    return total
+
+
+def reagrupar(sketches, nivel=0):
+    """Combina sketches de chaves compostas mantendo só o nível `nivel` da chave."""
+    resultado = {}
+    for chave, sketch in sketches.items():
+        grupo = chave[nivel] if isinstance(chave, tuple) else chave
+        resultado[grupo] = resultado[grupo].combinar(sketch) if grupo in resultado else sketch
+    return resultado
+
+
+def tabela_caixas(sketches):
+    """DataFrame com as estatísticas de caixa de cada grupo (índice = chave)."""
+    linhas = {chave: sketch.estatisticas_caixa() for chave, sketch in sketches.items()}
+    return pd.DataFrame.from_dict(linhas, orient="index")
+
+
+def caixas_plotly(tabela):
+    """Argumentos de go.Box com estatísticas pré-calculadas (uma caixa por linha)."""
+    return dict(
+        x=[str(i) for i in tabela.index],
+        q1=tabela["q1"], median=tabela["mediana"], q3=tabela["q3"],
+        lowerfence=tabela["cerca_inferior"], upperfence=tabela["cerca_superior"],
+        mean=tabela["media"],
+    )
@@ -0,0 +1,423 @@
+"""
+Verificação de regressão dos agregados das páginas contra snapshots gravados.
+
+O repositório não tem suíte de testes; como em `blocos.py --verificar`, a
+verificação é um comando offline. Cada tabela agregada que uma página entrega
+ao Plotly é extraída pelo mesmo ponto de entrada do app:
+    - os agregados registrados com `@agregado` (agregados.REGISTRO), por exemplo
+      vendasproduto.estatisticas_por_cidade (receita e ticket médio por cidade),
+      atendimento.tickets_mes_canal (heatmap de tickets), marketing.aggregate_by_month
+      (investimento × receita mensal) e clientes.renda_media_por_mes;
+    - as tabelas das seções calculadas sobre as linhas, fora do REGISTRO (EXTRAS):
+      caixas de t-digest, retenção de coortes, segmentos RFM, previsões e curvas
+      do simulador.
+
+Fixtures: as planilhas do repositório e uma cópia sintética escalada
+(sintetico.py, semente fixa), sempre copiadas para um diretório temporário
+(o dicionário de dimensões e os caches são criados do zero, sem tocar no
+diretório de dados).
+
+Os snapshots (um JSON por fixture em snapshots/) são gravados a partir do modo
+"pandas". A verificação recalcula as tabelas em cada modo de execução e as
+compara com eles, com as tolerâncias numéricas de TOLERANCIAS:
+    pandas          linhas carregadas da planilha, sem versão (nenhum cache);
+    cache           frames versionados; o resultado é o da segunda chamada (cache por versão);
+    colunar         Dataset do atualizador: cache colunar Arrow, só as colunas de cada página;
+    compilado       agregados gravados em Parquet + manifesto e servidos pela versão anexada;
+    fora_da_memoria agregados de vendas e atendimento calculados em blocos (blocos.py).
+
+Uso:
+    python src/snapshots.py                  # verifica todos os modos nas duas fixtures
+    python src/snapshots.py --atualizar      # regrava os snapshots (revise o diff!)
+    python src/snapshots.py --modos pandas,colunar --fixtures planilhas
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import agregados
+from data_handler import (
+    ARQUIVO_DIMENSOES, ARQUIVOS, TABELAS, DicionarioDimensoes, ler_tabela, load_data, marcar_versao,
+)
+
+_DIR_FONTES = os.path.dirname(os.path.abspath(__file__))
+DIR_SNAPSHOTS = os.path.join(os.path.dirname(_DIR_FONTES), "snapshots")
+FORMATO_SNAPSHOT = 1
+FIXTURES = ("planilhas", "sintetico")
+MODOS = ("pandas", "cache", "colunar", "compilado", "fora_da_memoria")
+ESCALA_SINTETICA = 2.0
+SEMENTE_SINTETICA = 0
+# Blocos pequenos: a fixture atravessa vários blocos no modo fora da memória.
+LINHAS_POR_BLOCO = 2_000
+
+TOLERANCIA_PADRAO = {"rtol": 1e-7, "atol": 1e-6}
+# Tabelas que saem de mínimos quadrados: a ordem das operações do BLAS varia entre máquinas.
+TOLERANCIAS = {
+    "visaogeral.previsao_financeira": {"rtol": 1e-5, "atol": 1e-3},
+    "visaogeral.previsao_vendas": {"rtol": 1e-5, "atol": 1e-3},
+    "marketing.curvas_midia": {"rtol": 1e-5, "atol": 1e-6},
+}
+# Diferenças mostradas por tabela.
+MAX_DIFERENCAS = 3
+
+Extracao = namedtuple("Extracao", ["nome", "bases", "preparo", "funcao"])
+
+
+# ==========================================================================================
+#  EXTRAÇÃO
+# ==========================================================================================
+
+def _extras():
+    """Tabelas das seções calculadas sobre as linhas (fora do REGISTRO), como as páginas as montam."""
+    from app_pages import atendimento, clientes, marketing, visaogeral
+    from coortes import retencao
+    from rfm import resumo_segmentos
+    from simulador import tabela_curvas
+    from sketches import combinar_sketches, reagrupar, tabela_caixas
+
+    def caixas_roas(df):
+        por_midia = reagrupar(marketing.sketches_roas(df), nivel=0)
+        return tabela_caixas({m: sk for m, sk in por_midia.items() if pd.notna(m)})
+
+    return [
+        Extracao("atendimento.caixas_tempo_resolucao", ("atendimento",), atendimento.PREPARO,
+                 lambda df: tabela_caixas(reagrupar(atendimento.sketches_tempo_resolucao(df), nivel=0))),
+        Extracao("clientes.caixa_renda", ("clientes",), clientes.PREPARO,
+                 lambda df: tabela_caixas({"Renda": combinar_sketches(clientes.sketches_renda(df))})),
+        Extracao("clientes.retencao_coortes", ("clientes", "vendas"), clientes.PREPARO,
+                 lambda df_clientes, df_vendas: retencao(*clientes.coortes_clientes(df_clientes, df_vendas))),
+        Extracao("clientes.resumo_rfm", ("clientes", "vendas"), clientes.PREPARO,
+                 lambda df_clientes, df_vendas: resumo_segmentos(clientes.segmentos_rfm(df_clientes, df_vendas)[0])),
+        Extracao("marketing.caixas_roas", ("marketing",), marketing.PREPARO, caixas_roas),
+        Extracao("marketing.heatmap_roas", ("marketing",), marketing.PREPARO,
+                 lambda df: marketing.matriz_roas_midia_trimestre(df).para_frame("media", preencher=0)),
+        Extracao("marketing.curvas_midia", ("marketing",), marketing.PREPARO,
+                 lambda df: tabela_curvas(marketing.curvas_midia(df))),
+        Extracao("visaogeral.previsao_vendas", ("vendas",), visaogeral.PREPARO,
+                 lambda df: visaogeral.previsao_vendas(df)[1]),
+    ]
+
+
+def extracoes():
+    """Todas as tabelas verificadas: agregados do REGISTRO (pela função decorada, como no app) e EXTRAS."""
+    agregados.importar_paginas()
+    registradas = [
+        Extracao(item.nome, item.bases, item.preparo,
+                 getattr(sys.modules[item.funcao.__module__], item.funcao.__name__))
+        for item in agregados.REGISTRO.values()
+    ]
+    return registradas + _extras()
+
+
+def calcular(lista, frames):
+    """Tabelas de `lista` (Extracao) sobre `frames` (base → DataFrame); a versão dos frames é mantida."""
+    preparadas = {}
+    tabelas = {}
+    for item in lista:
+        argumentos = []
+        for base in item.bases:
+            preparo = item.preparo.get(base)
+            if (base, preparo) not in preparadas:
+                # Cópia rasa por preparo, como na página: as funções de preparo alteram colunas no lugar.
+                df = frames[base].copy(deep=False)
+                preparadas[(base, preparo)] = preparo(df) if preparo is not None else df
+            argumentos.append(preparadas[(base, preparo)])
+        tabelas[item.nome] = item.funcao(*argumentos)
+    return tabelas
+
+
+# ==========================================================================================
+#  MODOS DE EXECUÇÃO
+# ==========================================================================================
+
+def _nova_versao():
+    from refresher import _VERSOES
+
+    return next(_VERSOES)
+
+
+def _versionados(frames, versao):
+    return {nome: marcar_versao(df.copy(deep=False), versao) for nome, df in frames.items()}
+
+
+def modo_pandas(dados):
+    frames = dict(zip(TABELAS, load_data(dados, usar_store=False)))
+    return calcular(extracoes(), frames)
+
+
+def modo_cache(dados):
+    frames = _versionados(dict(zip(TABELAS, load_data(dados, usar_store=False))), _nova_versao())
+    lista = extracoes()
+    calcular(lista, frames)
+    return calcular(lista, frames)
+
+
+def modo_colunar(dados):
+    from app_pages import atendimento, clientes, marketing, vendasproduto, visaogeral
+    from refresher import Dataset
+
+    # Primeira leitura grava o cache colunar; o Dataset lê dele, com a projeção de cada página.
+    for nome in TABELAS:
+        ler_tabela(dados, nome, usar_store=False)
+    dataset = Dataset(_nova_versao(), dados)
+    tabelas = {}
+    for pagina in (atendimento, clientes, marketing, vendasproduto, visaogeral):
+        prefixo = pagina.__name__.rsplit(".", 1)[-1] + "."
+        lista = [item for item in extracoes() if item.nome.startswith(prefixo)]
+        tabelas.update(calcular(lista, dataset.tabelas(pagina.REQUISITOS)))
+    return tabelas
+
+
+def modo_compilado(dados):
+    frames = dict(zip(TABELAS, load_data(dados, usar_store=False)))
+    destino = os.path.join(dados, agregados.DIR_AGREGADOS)
+    agregados.compilar(dados, destino)
+    compilados = agregados.carregar(dados, destino)
+    versao = _nova_versao()
+    agregados.anexar(versao, compilados)
+    lista = [item for item in extracoes() if item.nome in compilados]
+    tabelas = calcular(lista, _versionados(frames, versao))
+    # A função decorada devolve a tabela compilada; confere que nenhuma foi recalculada.
+    for nome in tabelas:
+        if agregados._compilado(nome, versao) is None:
+            raise RuntimeError(f"{nome} não foi servido pela compilação")
+    return tabelas
+
+
+def modo_fora_da_memoria(dados):
+    import blocos
+
+    agregados.importar_paginas()
+    dicionario = DicionarioDimensoes.carregar(os.path.join(dados, ARQUIVO_DIMENSOES))
+    normalizacao = blocos.Normalizacao(DicionarioDimensoes(copy.deepcopy(dicionario.dados)))
+    tabelas, _ = blocos.agregar(blocos.fontes_padrao(dados), normalizacao, LINHAS_POR_BLOCO)
+    return tabelas
+
+
+EXECUTORES = {
+    "pandas": modo_pandas,
+    "cache": modo_cache,
+    "colunar": modo_colunar,
+    "compilado": modo_compilado,
+    "fora_da_memoria": modo_fora_da_memoria,
+}
+
+
+# ==========================================================================================
+#  FIXTURES
+# ==========================================================================================
+
+def preparar_fixture(fixture, origem, destino):
+    """Copia (planilhas) ou gera (sintetico) as cinco bases de `origem` em `destino`."""
+    os.makedirs(destino, exist_ok=True)
+    if fixture == "planilhas":
+        for arquivo in [*ARQUIVOS.values(), "nomes.csv"]:
+            if os.path.exists(os.path.join(origem, arquivo)):
+                shutil.copy2(os.path.join(origem, arquivo), destino)
+    elif fixture == "sintetico":
+        import sintetico
+
+        sintetico.gerar(origem, destino, ESCALA_SINTETICA, SEMENTE_SINTETICA)
+    else:
+        raise ValueError(f"Fixture desconhecida: {fixture}")
+
+
+# ==========================================================================================
+#  SNAPSHOTS E COMPARAÇÃO
+# ==========================================================================================
+
+def canonica(tabela):
+    """
+    Forma comparável de uma tabela: índice com significado (nomeado ou não inteiro)
+    vira coluna, nomes de colunas viram texto e cada coluna é classificada em
+    numero, data ou texto (categorias e períodos como texto).
+    """
+    df = tabela.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [" | ".join(map(str, c)) for c in df.columns]
+    indice_posicional = df.index.name is None and pd.api.types.is_integer_dtype(df.index)
+    df = df.reset_index(drop=indice_posicional)
+    df.columns = [str(c) for c in df.columns]
+
+    tipos = []
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_bool_dtype(serie) or (
+            pd.api.types.is_numeric_dtype(serie) and not isinstance(serie.dtype, pd.CategoricalDtype)
+        ):
+            df[coluna] = serie.astype(float)
+            tipos.append("numero")
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            tipos.append("data")
+        else:
+            df[coluna] = serie.astype(object).where(serie.notna(), None).map(lambda v: v if v is None else str(v))
+            tipos.append("texto")
+    return df, tipos
+
+
+def _valores(df, tipos):
+    colunas = []
+    for coluna, tipo in zip(df.columns, tipos):
+        serie = df[coluna]
+        if tipo == "numero":
+            colunas.append([None if np.isnan(v) else float(v) for v in serie])
+        elif tipo == "data":
+            colunas.append([None if pd.isna(v) else v.isoformat() for v in serie])
+        else:
+            colunas.append(list(serie))
+    return [list(linha) for linha in zip(*colunas)]
+
+
+def para_snapshot(tabela):
+    df, tipos = canonica(tabela)
+    return {"colunas": list(df.columns), "tipos": tipos, "linhas": _valores(df, tipos)}
+
+
+def gravar_snapshot(caminho, fixture, tabelas):
+    """Grava as tabelas (nome → DataFrame) em JSON com uma linha de dados por linha de texto (diffs legíveis)."""
+    partes = []
+    for nome in sorted(tabelas):
+        snapshot = para_snapshot(tabelas[nome])
+        linhas = ",\n".join("        " + json.dumps(linha, ensure_ascii=False) for linha in snapshot["linhas"])
+        partes.append(
+            f"    {json.dumps(nome, ensure_ascii=False)}: {{\n"
+            f"      \"colunas\": {json.dumps(snapshot['colunas'], ensure_ascii=False)},\n"
+            f"      \"tipos\": {json.dumps(snapshot['tipos'])},\n"
+            f"      \"linhas\": [\n{linhas}\n      ]\n    }}"
+        )
+    cabecalho = {"formato": FORMATO_SNAPSHOT, "fixture": fixture}
+    if fixture == "sintetico":
+        cabecalho.update(escala=ESCALA_SINTETICA, semente=SEMENTE_SINTETICA)
+    conteudo = json.dumps(cabecalho, ensure_ascii=False)[:-1] + ', "tabelas": {\n' + ",\n".join(partes) + "\n  }\n}\n"
+    json.loads(conteudo)  # o formato manual continua JSON válido
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+
+
+def ler_snapshot(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    if snapshot.get("formato") != FORMATO_SNAPSHOT:
+        raise ValueError(f"{caminho}: formato de snapshot {snapshot.get('formato')} (esperado {FORMATO_SNAPSHOT})")
+    return snapshot["tabelas"]
+
+
+def comparar(nome, tabela, esperado):
+    """Diferenças (lista de textos; vazia = igual) entre `tabela` e o snapshot `esperado`."""
+    atual = para_snapshot(tabela)
+    if atual["colunas"] != esperado["colunas"]:
+        return [f"colunas {atual['colunas']} ≠ {esperado['colunas']}"]
+    if atual["tipos"] != esperado["tipos"]:
+        return [f"tipos {atual['tipos']} ≠ {esperado['tipos']}"]
+    if len(atual["linhas"]) != len(esperado["linhas"]):
+        return [f"{len(atual['linhas'])} linhas ≠ {len(esperado['linhas'])}"]
+
+    tolerancia = TOLERANCIAS.get(nome, TOLERANCIA_PADRAO)
+    diferencas = []
+    for i, tipo in enumerate(atual["tipos"]):
+        obtidos = [linha[i] for linha in atual["linhas"]]
+        esperados = [linha[i] for linha in esperado["linhas"]]
+        if tipo == "numero":
+            a = np.array([np.nan if v is None else v for v in obtidos], dtype=float)
+            b = np.array([np.nan if v is None else v for v in esperados], dtype=float)
+            iguais = np.isclose(a, b, equal_nan=True, **tolerancia)
+        else:
+            iguais = np.array([x == y for x, y in zip(obtidos, esperados)], dtype=bool)
+        for linha in np.flatnonzero(~iguais)[:MAX_DIFERENCAS]:
+            diferencas.append(
+                f"linha {linha}, {atual['colunas'][i]}: {obtidos[linha]!r} ≠ {esperados[linha]!r}"
+            )
+        if (~iguais).sum() > MAX_DIFERENCAS:
+            diferencas.append(f"... {(~iguais).sum() - MAX_DIFERENCAS} diferença(s) a mais em {atual['colunas'][i]}")
+    return diferencas
+
+
+def verificar_modo(tabelas, snapshot):
+    """(tabelas comparadas, falhas) de um modo; tabelas fora do snapshot contam como falha."""
+    falhas = []
+    for nome, tabela in tabelas.items():
+        if nome not in snapshot:
+            falhas.append(f"{nome}: sem snapshot (rode --atualizar e revise)")
+            continue
+        falhas += [f"{nome}: {diferenca}" for diferenca in comparar(nome, tabela, snapshot[nome])]
+    return len(tabelas), falhas
+
+
+# ==========================================================================================
+#  COMANDO
+# ==========================================================================================
+
+def executar(fixtures, modos, origem, dir_snapshots, atualizar=False):
+    """Roda os `modos` em cada fixture; devolve (relatório, falhas)."""
+    relatorio, falhas = [], []
+    with tempfile.TemporaryDirectory(prefix="ecomove-snapshots-") as temporario:
+        for fixture in fixtures:
+            caminho = os.path.join(dir_snapshots, f"{fixture}.json")
+            modos_fixture = list(modos)
+            if atualizar:
+                modos_fixture = ["pandas"] + [m for m in modos_fixture if m != "pandas"]
+            elif not os.path.exists(caminho):
+                falhas.append(f"{fixture}: snapshot {caminho} não existe (rode --atualizar)")
+                continue
+
+            snapshot = None if atualizar else ler_snapshot(caminho)
+            for modo in modos_fixture:
+                # Diretório novo por modo: caches colunares e compilações não passam de um modo para outro.
+                dados = os.path.join(temporario, f"{fixture}_{modo}")
+                preparar_fixture(fixture, origem, dados)
+                inicio = time.perf_counter()
+                tabelas = EXECUTORES[modo](dados)
+                duracao = time.perf_counter() - inicio
+                if snapshot is None:
+                    gravar_snapshot(caminho, fixture, tabelas)
+                    snapshot = ler_snapshot(caminho)
+                    print(f"Snapshot {caminho} gravado ({len(tabelas)} tabelas, modo {modo})")
+                comparadas, falhas_modo = verificar_modo(tabelas, snapshot)
+                ausentes = set(snapshot) - set(tabelas) if modo == "pandas" else set()
+                falhas_modo += [f"{nome}: não foi mais produzida" for nome in sorted(ausentes)]
+                falhas += [f"{fixture}/{modo}: {falha}" for falha in falhas_modo]
+                relatorio.append({
+                    "fixture": fixture, "modo": modo, "tabelas": comparadas,
+                    "falhas": len(falhas_modo), "tempo_s": duracao,
+                })
+    return pd.DataFrame(relatorio), falhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agregados das páginas comparados com snapshots em todos os modos.")
+    parser.add_argument("--fixtures", default=",".join(FIXTURES), help="fixtures (planilhas, sintetico)")
+    parser.add_argument("--modos", default=",".join(MODOS), help="modos de execução: " + ", ".join(MODOS))
+    parser.add_argument("--dados", default=os.path.dirname(_DIR_FONTES), help="diretório com as planilhas de origem")
+    parser.add_argument("--snapshots", default=DIR_SNAPSHOTS, help="diretório dos snapshots JSON")
+    parser.add_argument("--atualizar", action="store_true", help="regrava os snapshots a partir do modo pandas")
+    args = parser.parse_args(argv)
+
+    fixtures = [f for f in args.fixtures.split(",") if f.strip()]
+    modos = [m for m in args.modos.split(",") if m.strip()]
+    desconhecidos = [m for m in modos if m not in EXECUTORES]
+    if desconhecidos:
+        parser.error(f"modos desconhecidos: {desconhecidos}")
+
+    relatorio, falhas = executar(fixtures, modos, args.dados, args.snapshots, args.atualizar)
+    if not relatorio.empty:
+        with pd.option_context("display.float_format", "{:.2f}".format):
+            print(relatorio.to_string(index=False))
+    for falha in falhas:
+        print(f"✗ {falha}", file=sys.stderr)
+    if not falhas:
+        print(f"✓ {int(relatorio['tabelas'].sum())} comparações iguais aos snapshots")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Remoção de acentos e chaves de texto para agrupamento.
+
+A remoção usa uma tabela de `str.translate` pré-calculada para Latin-1 e Latin
+Extended (U+0080–U+024F) e para as marcas combinantes (U+0300–U+036F); só
+textos com outros caracteres passam pelo NFD caractere a caractere. O
+resultado é o mesmo da versão NFD pura. As funções de Series trabalham sobre
+os valores distintos (factorize) e as escalares têm memo limitado.
+"""
+import functools
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+TAMANHO_MEMO = 65_536
+
+
+def _remover_nfd(txt):
+    return "".join(c for c in unicodedata.normalize("NFD", txt) if unicodedata.category(c) != "Mn")
+
+
+def _montar_tabela():
+    tabela = {}
+    for codigo in list(range(0x80, 0x250)) + list(range(0x300, 0x370)):
+        caractere = chr(codigo)
+        sem_acento = _remover_nfd(caractere)
+        if sem_acento != caractere:
+            tabela[codigo] = sem_acento or None
+    return tabela
+
+
+_TABELA_ACENTOS = _montar_tabela()
+# Qualquer caractere fora de ASCII, Latin-1/Extended e marcas combinantes exige o NFD.
+_FORA_DA_TABELA = re.compile(r"[^\x00-\u024f\u0300-\u036f]")
+_ESPACOS = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=TAMANHO_MEMO)
+def _remover(txt):
+    if _FORA_DA_TABELA.search(txt):
+        return _remover_nfd(txt)
+    return txt.translate(_TABELA_ACENTOS)
+
+
+def remover_acentos(txt):
+    """Texto sem acentos (None para nulos)."""
+    if txt is None or (not isinstance(txt, str) and pd.isna(txt)):
+        return None
+    return _remover(str(txt))
+
+
+def _por_valores_distintos(serie, funcao):
+    codigos, unicos = pd.factorize(serie)
+    convertidos = np.array([funcao(v) for v in unicos] + [None], dtype=object)
+    # Código -1 (nulo) aponta para o None acrescentado no fim.
+    return pd.Series(convertidos[codigos], index=serie.index, name=serie.name)
+
+
+def remover_acentos_serie(serie):
+    """remover_acentos aplicado só aos valores distintos da Series."""
+    return _por_valores_distintos(serie, remover_acentos)
+
+
+def normalizar_chave(txt):
+    """Chave de um valor: sem acentos, em caixa baixa e com espaços normalizados (None para nulos/vazios)."""
+    txt = remover_acentos(txt)
+    if txt is None:
+        return None
+    return _ESPACOS.sub(" ", txt).strip().casefold() or None
+